@@ -0,0 +1,186 @@
+import asyncio
+import datetime
+import hashlib
+import json
+import math
+import time
+from typing import Optional
+from aiohttp import web
+
+
+class FakeOllamaServer:
+    """A stand-in for an ollama server that implements enough of its API for the bot to run against it, generating
+    filler responses at a configurable speed
+    Args:
+        models (list[str]): The ids of the models the server has installed
+        prompt_latency (float): The amount of seconds it takes to evaluate a prompt before the first token
+        token_rate (float): The amount of tokens generated per second
+        response_tokens (int): The amount of tokens in every response, unless capped by ``num_predict``
+        thinking_tokens (int): The amount of thinking tokens generated before the response when thinking is enabled
+        load_time (float): The amount of seconds it takes to load a model that isn't loaded yet
+        model_size (int): The amount of bytes each loaded model reports taking up
+        host (str): The address to listen on
+        port (int): The port to listen on, or 0 to pick a free one
+    Attributes:
+        loaded (dict[str, float]): The loaded models along with the monotonic time they were last used
+        requests (dict[str, int]): The amount of requests each endpoint received
+    """
+    def __init__(self, models: list[str], *, prompt_latency: float = 0.05, token_rate: float = 200.0,
+                 response_tokens: int = 200, thinking_tokens: int = 0, load_time: float = 0.5,
+                 model_size: int = 4 * 1024 ** 3, host: str = "127.0.0.1", port: int = 0):
+        self.models = models
+        self.prompt_latency = prompt_latency
+        self.token_rate = token_rate
+        self.response_tokens = response_tokens
+        self.thinking_tokens = thinking_tokens
+        self.load_time = load_time
+        self.model_size = model_size
+        self.host = host
+        self.port = port
+        self.loaded: dict[str, float] = {}
+        self.requests: dict[str, int] = {}
+        self._runner: Optional[web.AppRunner] = None
+        self._app = web.Application()
+        self._app.add_routes([
+            web.post("/api/chat", self.chat), web.post("/api/generate", self.generate),
+            web.post("/api/embed", self.embed), web.get("/api/ps", self.ps), web.get("/api/tags", self.tags)
+        ])
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self._runner = web.AppRunner(self._app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def _count(self, endpoint: str):
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    @staticmethod
+    def _timestamp() -> str:
+        return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+    async def _load(self, model: str) -> float:
+        """Loads a model if it isn't loaded and returns the amount of seconds it took"""
+        load_time = 0.0
+        if model not in self.loaded:
+            load_time = self.load_time
+            await asyncio.sleep(load_time)
+        self.loaded[model] = time.monotonic()
+        return load_time
+
+    async def ps(self, _: web.Request) -> web.Response:
+        self._count("ps")
+        return web.json_response({'models': [
+            {'model': model, 'name': model, 'size': self.model_size, 'size_vram': self.model_size}
+            for model in self.loaded
+        ]})
+
+    async def tags(self, _: web.Request) -> web.Response:
+        self._count("tags")
+        return web.json_response({'models': [
+            {'model': model, 'name': model, 'size': self.model_size, 'modified_at': self._timestamp()}
+            for model in self.models
+        ]})
+
+    async def generate(self, request: web.Request) -> web.Response:
+        self._count("generate")
+        body = await request.json()
+        model = body.get('model')
+        if model not in self.models:
+            return web.json_response({'error': f"model '{model}' not found"}, status=404)
+        load_time = 0.0
+        if body.get('keep_alive') == 0:
+            self.loaded.pop(model, None)
+        else:
+            load_time = await self._load(model)
+        return web.json_response({
+            'model': model, 'created_at': self._timestamp(), 'response': "", 'done': True, 'done_reason': "load",
+            'load_duration': int(load_time * 10 ** 9)
+        })
+
+    @staticmethod
+    def _embedding(text: str, dimensions: int = 64) -> list[float]:
+        """A bag of words embedding, so texts sharing words are similar"""
+        vector = [0.0] * dimensions
+        for word in text.lower().split():
+            vector[int.from_bytes(hashlib.sha256(word.encode()).digest()[:4], "big") % dimensions] += 1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    async def embed(self, request: web.Request) -> web.Response:
+        self._count("embed")
+        body = await request.json()
+        model = body.get('model')
+        if model not in self.models:
+            return web.json_response({'error': f"model '{model}' not found"}, status=404)
+        texts = body.get('input')
+        texts = [texts] if isinstance(texts, str) else texts
+        load_time = await self._load(model)
+        await asyncio.sleep(self.prompt_latency)
+        return web.json_response({
+            'model': model, 'embeddings': [self._embedding(text) for text in texts],
+            'load_duration': int(load_time * 10 ** 9), 'prompt_eval_count': sum(len(text) // 4 for text in texts)
+        })
+
+    async def chat(self, request: web.Request) -> web.StreamResponse:
+        self._count("chat")
+        body = await request.json()
+        model = body.get('model')
+        if model not in self.models:
+            return web.json_response({'error': f"model '{model}' not found"}, status=404)
+        started = time.monotonic()
+        load_time = await self._load(model)
+        await asyncio.sleep(self.prompt_latency)
+        prompt_tokens = sum(len(message.get('content') or "") // 4 + 4 for message in body.get('messages', []))
+        num_predict = (body.get('options') or {}).get('num_predict') or -1
+        response_tokens = self.response_tokens if num_predict < 0 else min(self.response_tokens, num_predict)
+        thinking_tokens = self.thinking_tokens if body.get('think') else 0
+        tokens = [("thinking", "hmm ")] * thinking_tokens + [
+            ("content", "\n\n" if index % 60 == 59 else f"word{index % 10} ") for index in range(response_tokens)
+        ]
+        generation_started = time.monotonic()
+
+        def final_chunk() -> dict:
+            return {
+                'model': model, 'created_at': self._timestamp(), 'message': {'role': "assistant", 'content': ""},
+                'done': True, 'done_reason': "length" if response_tokens < self.response_tokens else "stop",
+                'total_duration': int((time.monotonic() - started) * 10 ** 9),
+                'load_duration': int(load_time * 10 ** 9), 'prompt_eval_count': prompt_tokens,
+                'prompt_eval_duration': int(self.prompt_latency * 10 ** 9), 'eval_count': len(tokens),
+                'eval_duration': int(max(time.monotonic() - generation_started, 1e-6) * 10 ** 9)
+            }
+
+        if not body.get('stream', True):
+            await asyncio.sleep(len(tokens) / self.token_rate)
+            response = final_chunk()
+            response['message']['content'] = "".join(text for kind, text in tokens if kind == "content")
+            response['message']['thinking'] = "".join(text for kind, text in tokens if kind == "thinking") or None
+            return web.json_response(response)
+        stream = web.StreamResponse(headers={'Content-Type': "application/x-ndjson"})
+        await stream.prepare(request)
+        try:
+            # tokens are written in small batches, since sleeping for every token is less accurate than the rate
+            batch_size = max(1, int(self.token_rate / 50))
+            for index in range(0, len(tokens), batch_size):
+                for kind, text in tokens[index:index + batch_size]:
+                    chunk = {
+                        'model': model, 'created_at': self._timestamp(), 'done': False,
+                        'message': {'role': "assistant", 'content': text if kind == "content" else "",
+                                    'thinking': text if kind == "thinking" else None}
+                    }
+                    await stream.write(json.dumps(chunk).encode() + b"\n")
+                await asyncio.sleep(batch_size / self.token_rate)
+            await stream.write(json.dumps(final_chunk()).encode() + b"\n")
+            await stream.write_eof()
+        except ConnectionResetError:
+            pass
+        return stream
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""Measures the overhead the bot adds to LLM requests by running the Ollama cog's commands against a stand-in ollama
+server, see ``python -m benchmarks.llm_benchmark --help``. Run it from the root of the repository. The stand-in server
+runs in the same process, so the CPU time includes the time spent generating its responses."""
+import argparse
+import asyncio
+import contextlib
+import copy
+import io
+import os
+import sys
+import time
+import tracemalloc
+import types
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BOT_TOKEN", "benchmark")
+import discord
+import config
+from benchmarks.fake_ollama import FakeOllamaServer
+
+
+class FakeMessage(discord.Message):
+    """A message that records edits instead of sending them to discord"""
+    # noinspection PyMissingConstructor
+    def __init__(self, context: "FakeContext", **kwargs):
+        self.context = context
+        self.id = len(context.api_calls)
+        self.contents = kwargs
+
+    async def edit(self, **kwargs) -> "FakeMessage":
+        await self.context.api_call("edit")
+        self.contents.update(kwargs)
+        return self
+
+
+class FakeAttachment:
+    def __init__(self, data: bytes, filename: str = "image.png"):
+        self.data = data
+        self.filename = filename
+        self.size = len(data)
+
+    async def read(self) -> bytes:
+        return self.data
+
+
+class FakeBot:
+    def __init__(self):
+        self.user = types.SimpleNamespace(name="SomeRandomLlamaBot", display_avatar=types.SimpleNamespace(url=None))
+        self.owner = types.SimpleNamespace(id=0, mention="<@0>")
+
+    async def is_owner(self, user) -> bool:
+        return user.id == self.owner.id
+
+    async def application_info(self):
+        return types.SimpleNamespace(owner=self.owner)
+
+    def get_guild(self, _):
+        return None
+
+    async def wait_until_ready(self):
+        # the bot never becomes ready, so the cog's housekeeping loops stay out of the measurements
+        await asyncio.Event().wait()
+
+
+class FakeContext:
+    """Stands in for the bridge context a command is invoked with, recording the discord API calls the command makes
+    Args:
+        bot (FakeBot): The bot the command was invoked on
+        command_name (str): The name of the invoked command
+        channel_id (int): The id of the channel the command was invoked in
+        user_id (int): The id of the user that invoked the command
+        attachment (Optional[FakeAttachment]): The file attached to the message that invoked the command
+        api_latency (float): The amount of seconds each discord API call takes
+    """
+    def __init__(self, bot: FakeBot, command_name: str, channel_id: int, user_id: int, *,
+                 attachment: Optional[FakeAttachment] = None, api_latency: float = 0.0):
+        self.bot = bot
+        self.command = types.SimpleNamespace(name=command_name, qualified_name=command_name)
+        self.channel = types.SimpleNamespace(id=channel_id)
+        self.author = types.SimpleNamespace(id=user_id, mention=f"<@{user_id}>")
+        self.guild = types.SimpleNamespace(id=channel_id // 10)
+        self.message = types.SimpleNamespace(attachments=[attachment] if attachment else [])
+        self.api_latency = api_latency
+        self.api_calls: list[str] = []
+
+    async def api_call(self, kind: str):
+        self.api_calls.append(kind)
+        if self.api_latency:
+            await asyncio.sleep(self.api_latency)
+
+    async def defer(self):
+        await self.api_call("defer")
+
+    async def respond(self, *_, **kwargs) -> FakeMessage:
+        await self.api_call("respond")
+        return FakeMessage(self, **kwargs)
+
+    async def send(self, *_, **kwargs) -> FakeMessage:
+        return await self.respond(**kwargs)
+
+    @staticmethod
+    def typing():
+        return contextlib.AsyncExitStack()
+
+
+def percentile(values: list[float], percent: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(percent / 100 * len(ordered)))] if ordered else 0.0
+
+
+def test_image(size: int) -> bytes:
+    from PIL import Image
+    image = Image.effect_noise((size, size), 64).convert("RGB")
+    output = io.BytesIO()
+    image.save(output, "PNG")
+    return output.getvalue()
+
+
+class Benchmark:
+    """Runs the scenarios against a fresh Ollama cog each, all sharing one stand-in ollama server
+    Args:
+        server (FakeOllamaServer): The stand-in ollama server
+        api_latency (float): The amount of seconds each discord API call takes
+    """
+    def __init__(self, server: FakeOllamaServer, api_latency: float):
+        self.server = server
+        self.api_latency = api_latency
+        self.bot = FakeBot()
+        self.scenarios = {
+            "long-responses": self.long_responses,
+            "many-channels": self.many_channels,
+            "vision": self.vision,
+            "burst": self.burst
+        }
+
+    def new_cog(self):
+        from cogs import llama
+        llama.context_bank.clear()
+        return llama.Ollama(self.bot)
+
+    async def invoke(self, cog, latencies: list[float], contexts: list[FakeContext], command_name: str,
+                     channel_id: int, user_id: int, prompt: str, attachment: FakeAttachment = None):
+        ctx = FakeContext(
+            self.bot, command_name, channel_id, user_id, attachment=attachment, api_latency=self.api_latency
+        )
+        contexts.append(ctx)
+        command = getattr(cog, f"{command_name.replace('-', '_')}_cmd")
+        started = time.perf_counter()
+        await command.callback(cog, ctx, prompt=prompt)
+        latencies.append(time.perf_counter() - started)
+
+    async def long_responses(self, cog, latencies, contexts):
+        self.server.response_tokens = 4000
+        for turn in range(3):
+            await self.invoke(cog, latencies, contexts, "ask-llama", 100, 1, f"Write a long story, part {turn}")
+
+    async def many_channels(self, cog, latencies, contexts):
+        self.server.response_tokens = 200
+        await asyncio.gather(*(
+            self.invoke(cog, latencies, contexts, "ask-llama", 200 + channel, channel, f"Hello from {channel}")
+            for channel in range(50)
+        ))
+
+    async def vision(self, cog, latencies, contexts):
+        self.server.response_tokens = 200
+        image = FakeAttachment(test_image(3000))
+        await asyncio.gather(*(
+            self.invoke(cog, latencies, contexts, "ask-llama-vision", 300 + channel, channel, "What is this?", image)
+            for channel in range(8)
+        ))
+
+    async def burst(self, cog, latencies, contexts):
+        self.server.response_tokens = 100
+        commands = ["ask-llama", "ask-mistral", "ask-gemma3"]
+        await asyncio.gather(*(
+            self.invoke(cog, latencies, contexts, commands[request % 3], 400 + request % 10, request % 25,
+                        f"Burst request {request}")
+            for request in range(100)
+        ))
+
+    async def run(self, name: str) -> dict:
+        cog = self.new_cog()
+        latencies: list[float] = []
+        contexts: list[FakeContext] = []
+        tracemalloc.start()
+        started_cpu = time.process_time()
+        started = time.perf_counter()
+        try:
+            await self.scenarios[name](cog, latencies, contexts)
+            elapsed = time.perf_counter() - started
+            cpu_time = time.process_time() - started_cpu
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+            # stops the cog's background tasks and workers, which would otherwise outlive the scenario
+            cog.cog_unload()
+        return {
+            'scenario': name, 'requests': len(latencies), 'elapsed': elapsed,
+            'throughput': len(latencies) / elapsed if elapsed else 0.0,
+            'p50': percentile(latencies, 50), 'p95': percentile(latencies, 95), 'max': max(latencies, default=0.0),
+            'cpu': cpu_time, 'peak_memory': peak_memory,
+            'api_calls': sum(len(ctx.api_calls) for ctx in contexts)
+        }
+
+
+def configure(server: FakeOllamaServer, args: argparse.Namespace):
+    """Points the bot's configuration at the stand-in server and turns off everything that writes to disk or sends
+    requests of its own, so the scenarios only measure the commands themselves"""
+    profile = copy.deepcopy(config.profile_template)
+    config.ollama_server = server.url
+    config.server_profiles = {server.url: profile}
+    config.current_profile = profile
+    config.conversation_database = None
+    config.metrics_snapshot = None
+    config.response_cache = False
+    config.memory_embedding_model = None
+    config.context_summary_model = None
+    config.text_attachments = False
+    config.stream_responses = not args.no_stream
+    config.stream_edit_interval = args.edit_interval
+    config.model_concurrency = args.model_concurrency
+    config.max_active_models = args.max_active_models
+
+
+async def main(args: argparse.Namespace):
+    server = FakeOllamaServer(
+        list(config.profile_template['available'].values()), prompt_latency=args.prompt_latency,
+        token_rate=args.token_rate, load_time=args.load_time
+    )
+    await server.start()
+    configure(server, args)
+    benchmark = Benchmark(server, args.api_latency)
+    scenarios = list(benchmark.scenarios) if "all" in args.scenario else args.scenario
+    print(f"{'scenario':<16}{'requests':>9}{'elapsed':>10}{'req/s':>8}{'p50':>9}{'p95':>9}{'max':>9}"
+          f"{'cpu':>9}{'peak mem':>11}{'api calls':>11}")
+    try:
+        for name in scenarios:
+            result = await benchmark.run(name)
+            print(f"{result['scenario']:<16}{result['requests']:>9}{result['elapsed']:>9.2f}s"
+                  f"{result['throughput']:>8.1f}{result['p50']:>8.2f}s{result['p95']:>8.2f}s{result['max']:>8.2f}s"
+                  f"{result['cpu']:>8.2f}s{result['peak_memory'] / 1024 ** 2:>8.1f}MiB{result['api_calls']:>11}")
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("scenario", nargs="*", default="all",
+                        choices=["all", "long-responses", "many-channels", "vision", "burst"])
+    parser.add_argument("--token-rate", type=float, default=500.0, help="tokens generated per second")
+    parser.add_argument("--prompt-latency", type=float, default=0.05, help="seconds to evaluate a prompt")
+    parser.add_argument("--load-time", type=float, default=0.5, help="seconds to load a model")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="seconds each discord API call takes")
+    parser.add_argument("--edit-interval", type=float, default=config.stream_edit_interval,
+                        help="seconds between edits of a streamed response")
+    parser.add_argument("--no-stream", action="store_true", help="don't stream the responses")
+    parser.add_argument("--model-concurrency", type=int, default=config.model_concurrency)
+    parser.add_argument("--max-active-models", type=int, default=config.max_active_models)
+    asyncio.run(main(parser.parse_args()))
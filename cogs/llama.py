@@ -1,14 +1,106 @@
-from contextlib import nullcontext
-from typing import Union
+import asyncio
+import inspect
+from typing import Optional, Union
 import discord
-import httpx
-import ollama
-from discord.ext import commands, bridge, pages
+from discord.ext import commands, bridge, pages, tasks
 from discord.ext.bridge import BridgeOption
 import config
 import utils
+from llm import (
+    admission, attachments, cache, compare, context, images, memory, metrics, persistence, pipeline, pool, residency,
+    summarizer
+)
 
-context_bank: dict[int, list] = {}
+context_bank = context.ConversationStore(
+    config.context_token_budget, config.context_memory_cap, config.context_ttl,
+    log=persistence.ConversationLog(config.conversation_database) if config.conversation_database else None,
+    trim_ratio=config.context_trim_ratio
+)
+
+
+def model_autocomplete(command_entry: dict):
+    """Generates the autocomplete of the model option of an LLM command, which lists the model options that are
+    installed on a server in the pool, loaded ones first, along with the estimated wait. It only reads the cached
+    inventory, so it answers within the time discord allows without probing the servers."""
+    async def autocomplete(ctx: discord.AutocompleteContext) -> list[discord.OptionChoice]:
+        choices = []
+        for order, (option, model_name) in enumerate(command_entry['options'].items()):
+            if (ctx.value or "").lower() not in option.lower():
+                continue
+            server, wait = ctx.cog.pool.estimate_wait(model_name)
+            if server is None:
+                continue
+            loaded = server.model_id(model_name) in server.scheduler.resident_models
+            status = "loaded" if loaded else "not loaded"
+            if wait is not None:
+                status += f", ~{wait:.0f}s wait" if wait >= 1 else ", no wait"
+            choices.append((not loaded, wait if wait is not None else float("inf"), order, option, status))
+        return [discord.OptionChoice(f"{option} ({status})", option) for *_, option, status in sorted(choices)[:25]]
+    return autocomplete
+
+
+def llm_command(command_name: str, command_entry: dict) -> bridge.BridgeCommand:
+    """Generates the bridge command for an LLM from its entry in the server profile. The options of the command
+    depend on the entry: a model option autocompleted with the installed models if there is more than one, an image if
+    the model accepts images and a thinking toggle if the model thinks. A file option is added if text attachments are
+    enabled and a cache bypass option if response caching is enabled."""
+    async def callback(self: "Ollama", ctx: bridge.Context, **options):
+        await self.pipeline.run(ctx, command_name, **options)
+
+    title = command_entry['title']
+    parameters = [
+        inspect.Parameter("self", inspect.Parameter.POSITIONAL_OR_KEYWORD),
+        inspect.Parameter("ctx", inspect.Parameter.POSITIONAL_OR_KEYWORD, annotation=bridge.Context),
+        inspect.Parameter(
+            "prompt", inspect.Parameter.KEYWORD_ONLY, annotation=BridgeOption(str, f"Prompt to send to {title}")
+        )
+    ]
+    if len(command_entry['options']) > 1:
+        parameters.append(inspect.Parameter(
+            "model", inspect.Parameter.KEYWORD_ONLY, default=command_entry['default'], annotation=BridgeOption(
+                str, f"The {title} model to use", default=command_entry['default'],
+                autocomplete=model_autocomplete(command_entry)
+            )
+        ))
+    if command_entry.get('images'):
+        parameters.append(inspect.Parameter(
+            "image", inspect.Parameter.KEYWORD_ONLY, default=None, annotation=BridgeOption(
+                discord.Attachment, "The image to show the model", required=False
+            )
+        ))
+    if config.text_attachments:
+        parameters.append(inspect.Parameter(
+            "file", inspect.Parameter.KEYWORD_ONLY, default=None, annotation=BridgeOption(
+                discord.Attachment, "A text, code or log file to show the model", required=False
+            )
+        ))
+    if command_entry.get('thinking') == "tags":
+        parameters.append(inspect.Parameter(
+            "show_thinking", inspect.Parameter.KEYWORD_ONLY, default=True, annotation=BridgeOption(
+                bool, "Add a button that shows the <think></think> part of the response", default=True,
+                name="show-thinking"
+            )
+        ))
+    elif command_entry.get('thinking') == "toggle":
+        parameters.append(inspect.Parameter(
+            "enable_thinking", inspect.Parameter.KEYWORD_ONLY, default=True, annotation=BridgeOption(
+                bool, "Enable the LLM to output thinking", default=True, name="enable-thinking"
+            )
+        ))
+    if config.response_cache:
+        parameters.append(inspect.Parameter(
+            "use_cache", inspect.Parameter.KEYWORD_ONLY, default=True, annotation=BridgeOption(
+                bool, "Use a cached response to the same prompt if there is one", default=True, name="use-cache"
+            )
+        ))
+    callback.__signature__ = inspect.Signature(parameters)
+    callback.__name__ = f"{command_name.replace('-', '_')}_cmd"
+    callback.__doc__ = command_entry['description']
+    return bridge.bridge_command(
+        name=command_name,
+        description=command_entry['description'],
+        integration_types={discord.IntegrationType.guild_install, discord.IntegrationType.user_install}
+    )(commands.cooldown(**config.default_cooldown_options)(callback))
 
 
 class Ollama(config.RevnobotCog):
@@ -18,1476 +110,269 @@ class Ollama(config.RevnobotCog):
         self.description = "Commands to interact with ollama LLMs"
         self.icon = "\U0001f999"
         self.hidden = False
-        self.ollama_client = ollama.AsyncClient(config.ollama_server)
+        self.pool = pool.ServerPool(
+            config.server_profiles, config.ollama_server, per_model=config.model_concurrency,
+            max_active_models=config.max_active_models, max_wait=config.max_queue_wait
+        )
+        self.ollama_client = self.pool.primary.client
+        self.response_cache = cache.ResponseCache(
+            config.response_cache_size, config.response_cache_ttl, config.response_cache_spill
+        ) if config.response_cache else None
+        self.residency = residency.ResidencyManager(
+            self.pool, config.hot_model_keep_alive, config.hot_model_uses, config.model_usage_window,
+            config.model_memory_limit
+        )
+        self.image_preprocessor = images.ImagePreprocessor(
+            config.image_workers, config.image_cache_size
+        ) if config.preprocess_images else None
+        self.summarizer = summarizer.ConversationSummarizer(
+            self.pool, context_bank, config.context_summary_model, config.context_summary_threshold,
+            config.context_summary_keep
+        ) if config.context_summary_model else None
+        self.metrics = metrics.Metrics(config.metrics_snapshot)
+        self.admission = admission.AdmissionController(
+            config.user_token_budget, config.guild_token_budget, config.token_budget_refill_time,
+            config.priority_guilds
+        )
+        self.memory = memory.ChannelMemory(
+            self.pool, config.memory_embedding_model, config.memory_directory, config.memory_top_k,
+            config.memory_min_score, max_batch=config.embedding_batch_size, window=config.embedding_batch_window,
+            max_pending=config.embedding_queue_size
+        ) if config.memory_embedding_model else None
+        self.attachments = attachments.AttachmentIngestor(
+            self.pool, config.attachment_max_bytes, config.attachment_token_budget, config.attachment_summary_model
+        ) if config.text_attachments else None
+        self.pipeline = pipeline.Pipeline(
+            self.pool, context_bank, self.response_cache, self.residency, self.image_preprocessor, self.summarizer,
+            self.metrics, self.admission, self.memory, self.attachments
+        )
+        self.prewarming: Optional[asyncio.Task] = None
+        # the loops are started here rather than in on_ready, which doesn't fire again when the extension is reloaded
+        if context_bank.log is not None:
+            self.flush_conversations.start()
+            self.compact_conversations.start()
+        if config.response_cache_spill and self.response_cache is not None:
+            self.flush_response_cache.start()
+        if config.metrics_snapshot:
+            self.save_metrics.start()
+        self.refresh_inventory.start()
+
+    def cog_unload(self):
+        if self.prewarming is not None:
+            self.prewarming.cancel()
+        self.refresh_inventory.cancel()
+        self.flush_conversations.cancel()
+        self.compact_conversations.cancel()
+        self.flush_response_cache.cancel()
+        self.save_metrics.cancel()
+        self.metrics.save()
+        if context_bank.log is not None:
+            context_bank.log.close()
+        if self.response_cache is not None:
+            self.response_cache.close()
+        if self.image_preprocessor is not None:
+            self.image_preprocessor.close()
+        if self.summarizer is not None:
+            self.summarizer.cancel()
+        if self.memory is not None:
+            self.memory.cancel()
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        if config.prewarm_models and self.prewarming is None:
+            # the models are loaded one at a time, so they are loaded in the background
+            self.prewarming = asyncio.create_task(self.residency.prewarm([
+                command_entry['options'][command_entry['default']]
+                for command_entry in config.current_profile['commands'].values() if command_entry['enabled']
+            ]))
+
+    @tasks.loop(seconds=config.inventory_refresh_interval)
+    async def refresh_inventory(self):
+        await self.pool.refresh()
+        await self.residency.rebalance()
+        self.admission.compact()
+
+    @tasks.loop(seconds=1)
+    async def flush_conversations(self):
+        if context_bank.log.pending:
+            await asyncio.to_thread(context_bank.log.flush)
+
+    @tasks.loop(minutes=10)
+    async def compact_conversations(self):
+        await asyncio.to_thread(context_bank.log.compact, config.context_ttl)
+
+    @tasks.loop(minutes=1)
+    async def flush_response_cache(self):
+        await asyncio.to_thread(self.response_cache.flush)
+
+    @tasks.loop(seconds=config.metrics_snapshot_interval)
+    async def save_metrics(self):
+        await asyncio.to_thread(self.metrics.save, self.metrics.snapshot())
+
+    @refresh_inventory.before_loop
+    @flush_conversations.before_loop
+    @compact_conversations.before_loop
+    @flush_response_cache.before_loop
+    @save_metrics.before_loop
+    async def wait_until_ready(self):
+        await self.client.wait_until_ready()
 
     @staticmethod
     async def cog_check(ctx: Union[discord.ApplicationContext, commands.Context]) -> bool:
-        if ctx.command.qualified_name in ['clear-context']:
+        if ctx.command.qualified_name in ['clear-context', 'stop-generating', 'llm-metrics', 'compare']:
             return True
         command_entry = config.current_profile["commands"].get(ctx.command.qualified_name)
         if command_entry is None or (not command_entry["enabled"]):
             raise commands.DisabledCommand('This LLM is disabled in the current configuration')
         return True
 
-    # noinspection SpellCheckingInspection,PyTypeHints
-    @bridge.bridge_command(
-        name='ask-llama',
-        description="Ask the llama llm",
-        integration_types={discord.IntegrationType.guild_install, discord.IntegrationType.user_install}
-    )
-    @commands.cooldown(**config.default_cooldown_options)
-    async def ask_llama_cmd(
-            self, ctx: bridge.Context, *, prompt: BridgeOption(str, "Prompt to send to llama"),
-            model: BridgeOption(
-                str, "The llama model to use",
-                default=config.current_profile['commands']['ask-llama']['default'],
-                choices=config.current_profile['commands']['ask-llama']['options'].keys()
-            ) = config.current_profile['commands']['ask-llama']['default'],
-    ):
-        """About the bot?"""
-        await ctx.defer()
-        try:
-            await self.ollama_client.ps()
-        except (httpx.ConnectError, httpx.TimeoutException, ConnectionError):
-            app = await ctx.bot.application_info()
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Cannot Connect to Ollama Server.",
-                "Unable to connect to ollama server as it is probably not running. "
-                f"Please ask {app.owner.mention} to start the ollama server."
-            ))
-            return
-        except httpx.HTTPError as error:
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Error Connecting to Ollama Server.",
-                f"There was a problem trying to connect to the ollama server: {error}"
-            ))
-            return
-        available_models = [model.model for model in (await self.ollama_client.list()).models]
-        if prompt.split()[0].upper() in config.current_profile['commands'][
-            ctx.command.qualified_name
-        ]['options'].keys():
-            model = prompt.split()[0].upper()
-        model_id = config.current_profile['available'][
-            config.current_profile['commands'][ctx.command.qualified_name]['options'][model]
-        ]
-        if model_id not in available_models:
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Model Not Found",
-                f"The model ``{model}`` is not available. "
-            ))
-            return
-        try:
-            async with ctx.typing() if not isinstance(ctx, discord.ApplicationContext) else nullcontext():
-                message = {
-                    'role': 'user',
-                    'content': prompt,
-                    'system': 'your response will be sent over discord, so please make sure your entire '
-                              'response is limited to 4096 characters'
-                }
-                if ctx.channel.id not in context_bank:
-                    context_bank[ctx.channel.id] = []
-                context_bank[ctx.channel.id].append(message)
-                response = await self.ollama_client.chat(
-                    model=model_id, messages=context_bank[ctx.channel.id]
-                )
-        except ollama.ResponseError as error:
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Error Genrating Response",
-                f"{error.error}"
-            ))
-            return
-        context_bank[ctx.channel.id].append({'role': 'assistant', 'content': response.message.content})
-        if len(response.message.content) <= 2000:
-            await ctx.respond(f"{response.message.content}")
-        elif len(response.message.content) <= 4096:
-            await ctx.respond(
-                embed=utils.default_embed(ctx, "Llama Response", f"{response.message.content}")
-            )
-        else:
-            language_buffer_size = 16
-            max_length = 4096
-            max_length -= language_buffer_size + 8
-            embed_pages = []
-            response_pages = [
-                response.message.content[x:x + max_length] for x in range(0, len(response.message.content), max_length)
-            ]
-            unfinished_codeblock = ""
-            unfinished_backtick = False
-            for index, response_page in enumerate(response_pages):
-                if unfinished_codeblock:
-                    response_page = "```" + unfinished_codeblock + '\n' + response_page
-                    unfinished_codeblock = ""
-                elif unfinished_backtick:
-                    response_page = '`' + response_page
-                    unfinished_backtick = False
-                if response_page.count("```") & 1:
-                    unfinished_codeblock = "c"
-                    response_page += "```"
-                elif response_page.count("`") - 3 * response_page.count("```") & 1:
-                    unfinished_backtick = True
-                    response_page += "`"
-                embed_pages.append(
-                    utils.default_embed(
-                        ctx, f"Llama Response {index+1}/{len(response_pages)}", f"{response_page}"
-                    )
-                )
-            paginator = pages.Paginator(pages=embed_pages)
-            if isinstance(ctx, discord.ApplicationContext):
-                await paginator.respond(ctx.interaction)
-            else:
-                await paginator.send(ctx)
-
-    # noinspection SpellCheckingInspection,PyTypeHints
-    @bridge.bridge_command(
-        name='ask-llama-vision',
-        description="Ask the llama-vision llm",
-        integration_types={discord.IntegrationType.guild_install, discord.IntegrationType.user_install}
-    )
-    @commands.cooldown(**config.default_cooldown_options)
-    async def ask_llama_vision_cmd(
-            self, ctx: bridge.Context, *, prompt: BridgeOption(str, "Prompt to send to llama"),
-            model: BridgeOption(
-                str, "The llama model to use",
-                default=config.current_profile['commands']['ask-llama-vision']['default'],
-                choices=config.current_profile['commands']['ask-llama-vision']['options'].keys()
-            ) = config.current_profile['commands']['ask-llama-vision']['default'],
-            image: BridgeOption(
-                discord.Attachment, "The image to show the model", required=False
-            ) = None
-    ):
-        """About the bot?"""
-        await ctx.defer()
-        images = []
-        if (ctx.message and len(ctx.message.attachments) > 0) or image:
-            image_bytes = await (
-                ctx.message.attachments[0] if ctx.message and len(ctx.message.attachments) > 0
-                else image
-            ).read()
-            images.append(image_bytes)
-        try:
-            await self.ollama_client.ps()
-        except (httpx.ConnectError, httpx.TimeoutException, ConnectionError):
-            app = await ctx.bot.application_info()
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Cannot Connect to Ollama Server.",
-                "Unable to connect to ollama server as it is probably not running. "
-                f"Please ask {app.owner.mention} to start the ollama server."
-            ))
-            return
-        except httpx.HTTPError as error:
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Error Connecting to Ollama Server.",
-                f"There was a problem trying to connect to the ollama server: {error}"
-            ))
-            return
-        available_models = [model.model for model in (await self.ollama_client.list()).models]
-
-        if prompt.split()[0].upper() in config.current_profile['commands'][
-            ctx.command.qualified_name
-        ]['options'].keys():
-            model = prompt.split()[0].upper()
-        print("attempted to use:")
-        print(config.current_profile['commands'][ctx.command.qualified_name]['options'][model])
-        print("but only these keys existied")
-        print(config.current_profile['available'].keys())
-        model_id = config.current_profile['available'][
-            config.current_profile['commands'][ctx.command.qualified_name]['options'][model]
-        ]
-        if model_id not in available_models:
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Model Not Found",
-                f"The model ``{model}`` is not available. "
-            ))
-            return
-        try:
-            async with ctx.typing() if not isinstance(ctx, discord.ApplicationContext) else nullcontext():
-                message = {
-                    'role': 'user',
-                    'content': prompt,
-                    'images': images,
-                    'system': 'your response will be sent over discord, so please make sure your entire '
-                              'response is limited to 4096 characters'
-                }
-                if ctx.channel.id not in context_bank:
-                    context_bank[ctx.channel.id] = []
-                context_bank[ctx.channel.id].append(message)
-                response = await self.ollama_client.chat(
-                    model=model_id, messages=context_bank[ctx.channel.id]
-                )
-        except ollama.ResponseError as error:
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Error Genrating Response",
-                f"{error.error}"
-            ))
-            return
-        context_bank[ctx.channel.id].append({'role': 'assistant', 'content': response.message.content})
-        if len(response.message.content) <= 2000:
-            await ctx.respond(f"{response.message.content}")
-        elif len(response.message.content) <= 4096:
-            await ctx.respond(
-                embed=utils.default_embed(ctx, "Llama Response", f"{response.message.content}")
-            )
-        else:
-            language_buffer_size = 16
-            max_length = 4096
-            max_length -= language_buffer_size + 8
-            embed_pages = []
-            response_pages = [
-                response.message.content[x:x + max_length] for x in range(0, len(response.message.content), max_length)
-            ]
-            unfinished_codeblock = ""
-            unfinished_backtick = False
-            for index, response_page in enumerate(response_pages):
-                if unfinished_codeblock:
-                    response_page = "```" + unfinished_codeblock + '\n' + response_page
-                    unfinished_codeblock = ""
-                elif unfinished_backtick:
-                    response_page = '`' + response_page
-                    unfinished_backtick = False
-                if response_page.count("```") & 1:
-                    unfinished_codeblock = "c"
-                    response_page += "```"
-                elif response_page.count("`") - 3 * response_page.count("```") & 1:
-                    unfinished_backtick = True
-                    response_page += "`"
-                embed_pages.append(
-                    utils.default_embed(
-                        ctx, f"Llama Response {index + 1}/{len(response_pages)}", f"{response_page}"
-                    )
-                )
-            paginator = pages.Paginator(pages=embed_pages)
-            if isinstance(ctx, discord.ApplicationContext):
-                await paginator.respond(ctx.interaction)
-            else:
-                await paginator.send(ctx)
-
-    # noinspection SpellCheckingInspection,PyTypeHints
-    @bridge.bridge_command(
-        name='llama-text',
-        description="Send a sample of text for llama to extend",
-        integration_types={discord.IntegrationType.guild_install, discord.IntegrationType.user_install}
-    )
-    @commands.cooldown(**config.default_cooldown_options)
-    async def llama_text_cmd(
-            self, ctx: bridge.Context, *, prompt: BridgeOption(str, "Prompt to send to llama"),
-            model: BridgeOption(
-                str, "The llama model to use",
-                default=config.current_profile['commands']['llama-text']['default'],
-                choices=config.current_profile['commands']['llama-text']['options'].keys()
-            ) = config.current_profile['commands']['llama-text']['default'],
-    ):
-        """About the bot?"""
-        await ctx.defer()
-        try:
-            await self.ollama_client.ps()
-        except (httpx.ConnectError, httpx.TimeoutException, ConnectionError):
-            app = await ctx.bot.application_info()
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Cannot Connect to Ollama Server.",
-                "Unable to connect to ollama server as it is probably not running. "
-                f"Please ask {app.owner.mention} to start the ollama server."
-            ))
-            return
-        except httpx.HTTPError as error:
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Error Connecting to Ollama Server.",
-                f"There was a problem trying to connect to the ollama server: {error}"
-            ))
-            return
-        available_models = [model.model for model in (await self.ollama_client.list()).models]
-        if prompt.split()[0].upper() in config.current_profile['commands'][
-            ctx.command.qualified_name
-        ]['options'].keys():
-            model = prompt.split()[0].upper()
-        model_id = config.current_profile['available'][
-            config.current_profile['commands'][ctx.command.qualified_name]['options'][model]
-        ]
-        if model_id not in available_models:
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Model Not Found",
-                f"The model ``{model}`` is not available. "
-            ))
-            return
-        try:
-            async with ctx.typing() if not isinstance(ctx, discord.ApplicationContext) else nullcontext():
-                message = {
-                    'role': 'user',
-                    'content': prompt,
-                    'system': 'your response will be sent over discord, so please make sure your entire '
-                              'response is limited to 4096 characters'
-                }
-                if ctx.channel.id not in context_bank:
-                    context_bank[ctx.channel.id] = []
-                context_bank[ctx.channel.id].append(message)
-                response = await self.ollama_client.chat(
-                    model=model_id, messages=context_bank[ctx.channel.id]
-                )
-        except ollama.ResponseError as error:
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Error Genrating Response",
-                f"{error.error}"
-            ))
-            return
-        context_bank[ctx.channel.id].append({'role': 'assistant', 'content': response.message.content})
-        if len(response.message.content) <= 2000:
-            await ctx.respond(f"{response.message.content}")
-        elif len(response.message.content) <= 4096:
-            await ctx.respond(
-                embed=utils.default_embed(ctx, "Llama Response", f"{response.message.content}")
-            )
-        else:
-            language_buffer_size = 16
-            max_length = 4096
-            max_length -= language_buffer_size + 8
-            embed_pages = []
-            response_pages = [
-                response.message.content[x:x + max_length] for x in range(0, len(response.message.content), max_length)
-            ]
-            unfinished_codeblock = ""
-            unfinished_backtick = False
-            for index, response_page in enumerate(response_pages):
-                if unfinished_codeblock:
-                    response_page = "```" + unfinished_codeblock + '\n' + response_page
-                    unfinished_codeblock = ""
-                elif unfinished_backtick:
-                    response_page = '`' + response_page
-                    unfinished_backtick = False
-                if response_page.count("```") & 1:
-                    unfinished_codeblock = "c"
-                    response_page += "```"
-                elif response_page.count("`") - 3 * response_page.count("```") & 1:
-                    unfinished_backtick = True
-                    response_page += "`"
-                embed_pages.append(
-                    utils.default_embed(
-                        ctx, f"Llama Response {index + 1}/{len(response_pages)}", f"{response_page}"
-                    )
-                )
-            paginator = pages.Paginator(pages=embed_pages)
-            if isinstance(ctx, discord.ApplicationContext):
-                await paginator.respond(ctx.interaction)
-            else:
-                await paginator.send(ctx)
-
-    # noinspection SpellCheckingInspection,PyTypeHints
-    @bridge.bridge_command(
-        name='ask-llama-3-3',
-        description="Ask the llama 3.3 llm",
-        integration_types={discord.IntegrationType.guild_install, discord.IntegrationType.user_install}
-    )
-    @commands.cooldown(**config.default_cooldown_options)
-    async def ask_llama_3_3_cmd(
-            self, ctx: bridge.Context, *, prompt: BridgeOption(str, "Prompt to send to llama"),
-    ):
-        """About the bot?"""
-        await ctx.defer()
-        try:
-            await self.ollama_client.ps()
-        except (httpx.ConnectError, httpx.TimeoutException, ConnectionError):
-            app = await ctx.bot.application_info()
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Cannot Connect to Ollama Server.",
-                "Unable to connect to ollama server as it is probably not running. "
-                f"Please ask {app.owner.mention} to start the ollama server."
-            ))
-            return
-        except httpx.HTTPError as error:
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Error Connecting to Ollama Server.",
-                f"There was a problem trying to connect to the ollama server: {error}"
-            ))
-            return
-        try:
-            async with ctx.typing() if not isinstance(ctx, discord.ApplicationContext) else nullcontext():
-                message = {
-                    'role': 'user',
-                    'content': prompt,
-                    'system': 'your response will be sent over discord, so please make sure your entire '
-                              'response is limited to 4096 characters'
-                }
-                if ctx.channel.id not in context_bank:
-                    context_bank[ctx.channel.id] = []
-                context_bank[ctx.channel.id].append(message)
-                response = await self.ollama_client.chat(
-                    model=config.current_profile['available'][
-                        next(iter(config.current_profile['commands'][ctx.command.qualified_name]['options'].values()))
-                    ],
-                    messages=context_bank[ctx.channel.id]
-                )
-        except ollama.ResponseError as error:
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Error Genrating Response",
-                f"{error.error}"
-            ))
-            return
-        context_bank[ctx.channel.id].append({'role': 'assistant', 'content': response.message.content})
-        if len(response.message.content) <= 2000:
-            await ctx.respond(f"{response.message.content}")
-        elif len(response.message.content) <= 4096:
-            await ctx.respond(
-                embed=utils.default_embed(ctx, "Llama 3.3 Response", f"{response.message.content}")
-            )
-        else:
-            language_buffer_size = 16
-            max_length = 4096
-            max_length -= language_buffer_size + 8
-            embed_pages = []
-            response_pages = [
-                response.message.content[x:x + max_length] for x in range(0, len(response.message.content), max_length)
-            ]
-            unfinished_codeblock = ""
-            unfinished_backtick = False
-            for index, response_page in enumerate(response_pages):
-                if unfinished_codeblock:
-                    response_page = "```" + unfinished_codeblock + '\n' + response_page
-                    unfinished_codeblock = ""
-                elif unfinished_backtick:
-                    response_page = '`' + response_page
-                    unfinished_backtick = False
-                if response_page.count("```") & 1:
-                    unfinished_codeblock = "c"
-                    response_page += "```"
-                elif response_page.count("`") - 3 * response_page.count("```") & 1:
-                    unfinished_backtick = True
-                    response_page += "`"
-                embed_pages.append(
-                    utils.default_embed(
-                        ctx, f"Llama 3.3 Response {index + 1}/{len(response_pages)}", f"{response_page}"
-                    )
-                )
-            paginator = pages.Paginator(pages=embed_pages)
-            if isinstance(ctx, discord.ApplicationContext):
-                await paginator.respond(ctx.interaction)
-            else:
-                await paginator.send(ctx)
+    # the LLM commands are generated from the current server profile, see llm_command()
+    locals().update({
+        f"{command_name.replace('-', '_')}_cmd": llm_command(command_name, command_entry)
+        for command_name, command_entry in config.current_profile['commands'].items()
+    })
 
     # noinspection SpellCheckingInspection,PyTypeHints
     @bridge.bridge_command(
-        name='ask-qwq',
-        description="Ask the qwq llm",
+        name='clear-context',
+        description="Clears the message context from the llms",
         integration_types={discord.IntegrationType.guild_install, discord.IntegrationType.user_install}
     )
     @commands.cooldown(**config.default_cooldown_options)
-    async def ask_qwq_cmd(
-            self, ctx: bridge.Context, *, prompt: BridgeOption(str, "Prompt to send to qwq"),
-            show_thinking: BridgeOption(
-                bool, "Show <think></think> part of the response", default=True, name="show-thinking"
-            ) = True
+    async def clear_context_cmd(
+            self, ctx: bridge.Context,
+            scope: BridgeOption(
+                str, "The scope of context to clear", default="Current Channel", name="scope",
+                choices=["Current Channel", "All"]
+            ) = "Current Channel"
     ):
-        """About the bot?"""
-        await ctx.defer()
-        try:
-            await self.ollama_client.ps()
-        except (httpx.ConnectError, httpx.TimeoutException, ConnectionError):
-            app = await ctx.bot.application_info()
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Cannot Connect to Ollama Server.",
-                "Unable to connect to ollama server as it is probably not running. "
-                f"Please ask {app.owner.mention} to start the ollama server."
-            ))
-            return
-        except httpx.HTTPError as error:
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Error Connecting to Ollama Server.",
-                f"There was a problem trying to connect to the ollama server: {error}"
-            ))
-            return
-        try:
-            async with ctx.typing() if not isinstance(ctx, discord.ApplicationContext) else nullcontext():
-                message = {
-                    'role': 'user',
-                    'content': prompt,
-                    'system': 'your response will be sent over discord, so please make sure your entire '
-                              'response is limited to 4096 characters'
-                }
-                if ctx.channel.id not in context_bank:
-                    context_bank[ctx.channel.id] = []
-                context_bank[ctx.channel.id].append(message)
-                response = await self.ollama_client.chat(
-                    model=config.current_profile['available'][
-                        next(iter(config.current_profile['commands'][ctx.command.qualified_name]['options'].values()))
-                    ],
-                    messages=context_bank[ctx.channel.id]
-                )
-        except ollama.ResponseError as error:
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Error Genrating Response",
-                f"{error.error}"
-            ))
+        if scope.lower() == "all":
+            owner_check = await ctx.bot.is_owner(ctx.author)
+            if not owner_check:
+                raise commands.NotOwner()
+            await ctx.defer()
+            context_bank.clear()
+            if self.memory is not None:
+                await self.memory.forget()
+            await ctx.respond("Cleared all session context")
             return
-        context_bank[ctx.channel.id].append({'role': 'assistant', 'content': response.message.content})
-        thinking_part = None
-        if show_thinking:
-            thinking_part = (
-                "-# **Thinking**...\n-# " +
-                response.message.content.split("\n</think>")[0].replace("<think>\n\n", "").replace(
-                    "<think>\n", ""
-                ).replace(
-                    "\n", "\n-# "
-                ).replace("\n-# \n", "\n-# ** **\n").rsplit("-# ", 1)[0]
-            )
-            response_content = thinking_part + "\n" + response.message.content.split("</think>\n\n")[-1]
-        else:
-            response_content = response.message.content.split("</think>\n\n")[-1]
-        if len(response_content) <= 2000:
-            await ctx.respond(f"{response_content}")
-        elif len(response_content) <= 4096:
-            await ctx.respond(
-                embed=utils.default_embed(ctx, "QwQ Response", f"{response_content}")
-            )
-        else:
-            language_buffer_size = 16
-            max_length = 4093 if thinking_part else 4096
-            max_length -= language_buffer_size + 8
-            embed_pages = []
-            response_pages = [
-                response_content[x:x + max_length] for x in range(0, len(response_content), max_length)
-            ]
-            unfinished_codeblock = ""
-            unfinished_backtick = False
-            for index, response_page in enumerate(response_pages):
-                part_of_thinking = (
-                        thinking_part and index and max_length * index < len(thinking_part)
-                )
-                if unfinished_codeblock:
-                    response_page = "```" + unfinished_codeblock + '\n' + response_page
-                    unfinished_codeblock = ""
-                elif unfinished_backtick:
-                    response_page = '`' + response_page
-                    unfinished_backtick = False
-                if response_page.count("```") & 1:
-                    unfinished_codeblock = "c"
-                    response_page += "```"
-                elif response_page.count("`") - 3 * response_page.count("```") & 1:
-                    unfinished_backtick = True
-                    response_page += "`"
-                embed_pages.append(
-                    utils.default_embed(
-                        ctx, f"QwQ Response {index + 1}/{len(response_pages)}",
-                        f"-# {response_page}" if part_of_thinking else f"{response_page}"
-                    )
-                )
-            paginator = pages.Paginator(pages=embed_pages)
-            if isinstance(ctx, discord.ApplicationContext):
-                await paginator.respond(ctx.interaction)
-            else:
-                await paginator.send(ctx)
-
-    # noinspection SpellCheckingInspection,PyTypeHints
-    @bridge.bridge_command(
-        name='ask-deepseek',
-        description="Ask the deepseek-r1 llm",
-        integration_types={discord.IntegrationType.guild_install, discord.IntegrationType.user_install}
-    )
-    @commands.cooldown(**config.default_cooldown_options)
-    async def ask_deepseek_cmd(
-            self, ctx: bridge.Context, *, prompt: BridgeOption(str, "Prompt to send to deepseek"),
-            enable_thinking: BridgeOption(
-                bool, "Enable the LLM to output thinking", default=True, name="enable-thinking"
-            ) = True
-    ):
         await ctx.defer()
-        try:
-            await self.ollama_client.ps()
-        except (httpx.ConnectError, httpx.TimeoutException, ConnectionError):
-            app = await ctx.bot.application_info()
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Cannot Connect to Ollama Server.",
-                "Unable to connect to ollama server as it is probably not running. "
-                f"Please ask {app.owner.mention} to start the ollama server."
-            ))
-            return
-        except httpx.HTTPError as error:
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Error Connecting to Ollama Server.",
-                f"There was a problem trying to connect to the ollama server: {error}"
-            ))
-            return
-        try:
-            async with ctx.typing() if not isinstance(ctx, discord.ApplicationContext) else nullcontext():
-                message = {
-                    'role': 'user',
-                    'content': prompt,
-                    'system': 'your response will be sent over discord, so please make sure your entire '
-                              'response is limited to 4096 characters'
-                }
-                if ctx.channel.id not in context_bank:
-                    context_bank[ctx.channel.id] = []
-                context_bank[ctx.channel.id].append(message)
-                response = await self.ollama_client.chat(
-                    model=config.current_profile['available'][
-                        next(iter(config.current_profile['commands'][ctx.command.qualified_name]['options'].values()))
-                    ],
-                    messages=context_bank[ctx.channel.id],
-                    think=enable_thinking
-                )
-        except ollama.ResponseError as error:
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Error Genrating Response",
-                f"{error.error}"
-            ))
-            return
-        context_bank[ctx.channel.id].append({'role': 'assistant', 'content': response.message.content})
-        thinking_part = None
-        if response.message.thinking:
-            thinking_part = (
-                "-# **Thinking**...\n-# " +
-                response.message.thinking.replace(
-                    "\n", "\n-# "
-                ).replace("\n-# \n", "\n-# ** **\n").rsplit("-# ", 1)[0]
-            )
-            response_content = thinking_part + "\n" + response.message.content
-        elif enable_thinking and not response.message.thinking:
-            response_content = (
-                    ":warning: **WARNING**: thinking associated with the response is missing\n\n"
-                    + response.message.content
-            )
-        else:
-            response_content = response.message.content
-        if len(response_content) <= 2000:
-            await ctx.respond(f"{response_content}")
-        elif len(response_content) <= 4096:
-            await ctx.respond(
-                embed=utils.default_embed(ctx, "Deepseek-R1 Response", f"{response_content}")
-            )
-        else:
-            language_buffer_size = 16
-            max_length = 4093 if thinking_part else 4096
-            max_length -= language_buffer_size + 8
-            embed_pages = []
-            response_pages = [
-                response_content[x:x + max_length] for x in range(0, len(response_content), max_length)
-            ]
-            unfinished_codeblock = ""
-            unfinished_backtick = False
-            for index, response_page in enumerate(response_pages):
-                part_of_thinking = (
-                        thinking_part and index and max_length * index < len(thinking_part)
-                )
-                if unfinished_codeblock:
-                    response_page = "```" + unfinished_codeblock + '\n' + response_page
-                    unfinished_codeblock = ""
-                elif unfinished_backtick:
-                    response_page = '`' + response_page
-                    unfinished_backtick = False
-                if response_page.count("```") & 1:
-                    unfinished_codeblock = "c"
-                    response_page += "```"
-                elif response_page.count("`") - 3 * response_page.count("```") & 1:
-                    unfinished_backtick = True
-                    response_page += "`"
-                embed_pages.append(
-                    utils.default_embed(
-                        ctx, f"Deepseek-R1 Response {index + 1}/{len(response_pages)}",
-                        f"-# {response_page}" if part_of_thinking else f"{response_page}"
-                    )
-                )
-            paginator = pages.Paginator(pages=embed_pages)
-            if isinstance(ctx, discord.ApplicationContext):
-                await paginator.respond(ctx.interaction)
-            else:
-                await paginator.send(ctx)
-
-    # noinspection SpellCheckingInspection,PyTypeHints
-    @bridge.bridge_command(
-        name='ask-gemma3',
-        description="Ask the gemma 3 llm",
-        integration_types={discord.IntegrationType.guild_install, discord.IntegrationType.user_install}
-    )
-    @commands.cooldown(**config.default_cooldown_options)
-    async def ask_gemma3_cmd(
-            self, ctx: bridge.Context, *, prompt: BridgeOption(str, "Prompt to send to gemma3"),
-            image: BridgeOption(
-                discord.Attachment, "The image to show the model", required=False
-            ) = None
-    ):
-        """About the bot?"""
-        await ctx.defer()
-        images = []
-        if (ctx.message and len(ctx.message.attachments) > 0) or image:
-            image_bytes = await (
-                ctx.message.attachments[0] if ctx.message and len(ctx.message.attachments) > 0
-                else image
-            ).read()
-            images.append(image_bytes)
-        try:
-            await self.ollama_client.ps()
-        except (httpx.ConnectError, httpx.TimeoutException, ConnectionError):
-            app = await ctx.bot.application_info()
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Cannot Connect to Ollama Server.",
-                "Unable to connect to ollama server as it is probably not running. "
-                f"Please ask {app.owner.mention} to start the ollama server."
-            ))
-            return
-        except httpx.HTTPError as error:
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Error Connecting to Ollama Server.",
-                f"There was a problem trying to connect to the ollama server: {error}"
-            ))
-            return
-        try:
-            async with ctx.typing() if not isinstance(ctx, discord.ApplicationContext) else nullcontext():
-                message = {
-                    'role': 'user',
-                    'content': prompt,
-                    'images': images,
-                    'system': 'your response will be sent over discord, so please make sure your entire '
-                              'response is limited to 4096 characters'
-                }
-                if ctx.channel.id not in context_bank:
-                    context_bank[ctx.channel.id] = []
-                context_bank[ctx.channel.id].append(message)
-                response = await self.ollama_client.chat(
-                    model=config.current_profile['available'][
-                        next(iter(config.current_profile['commands'][ctx.command.qualified_name]['options'].values()))
-                    ],
-                    messages=context_bank[ctx.channel.id]
-                )
-        except ollama.ResponseError as error:
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Error Genrating Response",
-                f"{error.error}"
-            ))
+        if self.memory is not None:
+            await self.memory.forget(ctx.guild.id if ctx.guild else None, ctx.channel.id)
+        await context_bank.load(ctx.channel.id)
+        if not context_bank.history(ctx.channel.id):
+            await ctx.respond("There was no context to clear in this channel")
             return
-        context_bank[ctx.channel.id].append({'role': 'assistant', 'content': response.message.content})
-        if len(response.message.content) <= 2000:
-            await ctx.respond(f"{response.message.content}")
-        elif len(response.message.content) <= 4096:
-            await ctx.respond(
-                embed=utils.default_embed(ctx, "Gemma 3 Response", f"{response.message.content}")
-            )
-        else:
-            language_buffer_size = 16
-            max_length = 4096
-            max_length -= language_buffer_size + 8
-            embed_pages = []
-            response_pages = [
-                response.message.content[x:x + max_length] for x in range(0, len(response.message.content), max_length)
-            ]
-            unfinished_codeblock = ""
-            unfinished_backtick = False
-            for index, response_page in enumerate(response_pages):
-                if unfinished_codeblock:
-                    response_page = "```" + unfinished_codeblock + '\n' + response_page
-                    unfinished_codeblock = ""
-                elif unfinished_backtick:
-                    response_page = '`' + response_page
-                    unfinished_backtick = False
-                if response_page.count("```") & 1:
-                    unfinished_codeblock = "c"
-                    response_page += "```"
-                elif response_page.count("`") - 3 * response_page.count("```") & 1:
-                    unfinished_backtick = True
-                    response_page += "`"
-                embed_pages.append(
-                    utils.default_embed(
-                        ctx, f"Gemma 3 Response {index + 1}/{len(response_pages)}", f"{response_page}"
-                    )
-                )
-            paginator = pages.Paginator(pages=embed_pages)
-            if isinstance(ctx, discord.ApplicationContext):
-                await paginator.respond(ctx.interaction)
-            else:
-                await paginator.send(ctx)
+        context_bank.clear(ctx.channel.id)
+        await ctx.respond("Cleared the context for the current channel")
 
-    # noinspection SpellCheckingInspection,PyTypeHints
     @bridge.bridge_command(
-        name='ask-llama4',
-        description="Ask the llama4 llm",
+        name='compare',
+        description="Sends a prompt to several LLMs at once and compares their responses",
         integration_types={discord.IntegrationType.guild_install, discord.IntegrationType.user_install}
     )
     @commands.cooldown(**config.default_cooldown_options)
-    async def ask_llama4_cmd(
-            self, ctx: bridge.Context, *, prompt: BridgeOption(str, "Prompt to send to llama4"),
-            model: BridgeOption(
-                str, "The llama4 model to use",
-                default=config.current_profile['commands']['ask-llama4']['default'],
-                choices=config.current_profile['commands']['ask-llama4']['options'].keys()
-            ) = config.current_profile['commands']['ask-llama4']['default'],
-            image: BridgeOption(
-                discord.Attachment, "The image to show the model", required=False
+    async def compare_cmd(
+            self, ctx: bridge.Context, *,
+            prompt: BridgeOption(str, "Prompt to send to every model"),
+            models: BridgeOption(
+                str, "Comma separated names of the models to compare", required=False, default=None
             ) = None
     ):
-        """About the bot?"""
-        await ctx.defer()
-        images = []
-        if (ctx.message and len(ctx.message.attachments) > 0) or image:
-            image_bytes = await (
-                ctx.message.attachments[0] if ctx.message and len(ctx.message.attachments) > 0
-                else image
-            ).read()
-            images.append(image_bytes)
-        try:
-            await self.ollama_client.ps()
-        except (httpx.ConnectError, httpx.TimeoutException, ConnectionError):
-            app = await ctx.bot.application_info()
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Cannot Connect to Ollama Server.",
-                "Unable to connect to ollama server as it is probably not running. "
-                f"Please ask {app.owner.mention} to start the ollama server."
-            ))
-            return
-        except httpx.HTTPError as error:
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Error Connecting to Ollama Server.",
-                f"There was a problem trying to connect to the ollama server: {error}"
-            ))
-            return
-        available_models = [model.model for model in (await self.ollama_client.list()).models]
-
-        if prompt.split()[0].upper() in config.current_profile['commands'][
-            ctx.command.qualified_name
-        ]['options'].keys():
-            model = prompt.split()[0].upper()
-        model_id = config.current_profile['available'][
-            config.current_profile['commands'][ctx.command.qualified_name]['options'][model]
-        ]
-        if model_id not in available_models:
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Model Not Found",
-                f"The model ``{model}`` is not available. "
-            ))
-            return
-        try:
-            async with ctx.typing() if not isinstance(ctx, discord.ApplicationContext) else nullcontext():
-                message = {
-                    'role': 'user',
-                    'content': prompt,
-                    'images': images,
-                    'system': 'your response will be sent over discord, so please make sure your entire '
-                              'response is limited to 4096 characters'
-                }
-                if ctx.channel.id not in context_bank:
-                    context_bank[ctx.channel.id] = []
-                context_bank[ctx.channel.id].append(message)
-                response = await self.ollama_client.chat(
-                    model=model_id, messages=context_bank[ctx.channel.id]
-                )
-        except ollama.ResponseError as error:
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Error Genrating Response",
-                f"{error.error}"
-            ))
-            return
-        context_bank[ctx.channel.id].append({'role': 'assistant', 'content': response.message.content})
-        if len(response.message.content) <= 2000:
-            await ctx.respond(f"{response.message.content}")
-        elif len(response.message.content) <= 4096:
-            await ctx.respond(
-                embed=utils.default_embed(ctx, "Llama 4 Response", f"{response.message.content}")
-            )
-        else:
-            language_buffer_size = 16
-            max_length = 4096
-            max_length -= language_buffer_size + 8
-            embed_pages = []
-            response_pages = [
-                response.message.content[x:x + max_length] for x in range(0, len(response.message.content), max_length)
-            ]
-            unfinished_codeblock = ""
-            unfinished_backtick = False
-            for index, response_page in enumerate(response_pages):
-                if unfinished_codeblock:
-                    response_page = "```" + unfinished_codeblock + '\n' + response_page
-                    unfinished_codeblock = ""
-                elif unfinished_backtick:
-                    response_page = '`' + response_page
-                    unfinished_backtick = False
-                if response_page.count("```") & 1:
-                    unfinished_codeblock = "c"
-                    response_page += "```"
-                elif response_page.count("`") - 3 * response_page.count("```") & 1:
-                    unfinished_backtick = True
-                    response_page += "`"
-                embed_pages.append(
-                    utils.default_embed(
-                        ctx, f"Llama 4 Response {index + 1}/{len(response_pages)}", f"{response_page}"
-                    )
-                )
-            paginator = pages.Paginator(pages=embed_pages)
-            if isinstance(ctx, discord.ApplicationContext):
-                await paginator.respond(ctx.interaction)
-            else:
-                await paginator.send(ctx)
-
-    # noinspection SpellCheckingInspection,PyTypeHints
-    @bridge.bridge_command(
-        name='ask-qwen3',
-        description="Ask the qwen3 llm",
-        integration_types={discord.IntegrationType.guild_install, discord.IntegrationType.user_install}
-    )
-    @commands.cooldown(**config.default_cooldown_options)
-    async def ask_qwen3_cmd(
-            self, ctx: bridge.Context, *, prompt: BridgeOption(str, "Prompt to send to qwen3"),
-            model: BridgeOption(
-                str, "The qwen3 model to use",
-                default=config.current_profile['commands']['ask-qwen3']['default'],
-                choices=config.current_profile['commands']['ask-qwen3']['options'].keys()
-            ) = config.current_profile['commands']['ask-qwen3']['default'],
-            enable_thinking: BridgeOption(
-                bool, "Enable the LLM to output thinking", default=True, name="enable-thinking"
-            ) = True
-    ):
-        await ctx.defer()
-        try:
-            await self.ollama_client.ps()
-        except (httpx.ConnectError, httpx.TimeoutException, ConnectionError):
-            app = await ctx.bot.application_info()
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Cannot Connect to Ollama Server.",
-                "Unable to connect to ollama server as it is probably not running. "
-                f"Please ask {app.owner.mention} to start the ollama server."
-            ))
-            return
-        except httpx.HTTPError as error:
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Error Connecting to Ollama Server.",
-                f"There was a problem trying to connect to the ollama server: {error}"
-            ))
-            return
-        available_models = [model.model for model in (await self.ollama_client.list()).models]
-
-        if prompt.split()[0].upper() in config.current_profile['commands'][
-            ctx.command.qualified_name
-        ]['options'].keys():
-            model = prompt.split()[0].upper()
-        model_id = config.current_profile['available'][
-            config.current_profile['commands'][ctx.command.qualified_name]['options'][model]
-        ]
-        if model_id not in available_models:
+        model_names = [
+            model_name.strip() for model_name in models.split(",") if model_name.strip()
+        ] if models else config.compare_models
+        unknown = [model_name for model_name in model_names if model_name not in config.current_profile['available']]
+        if unknown or not model_names:
             await ctx.respond(embed=utils.default_embed(
-                ctx, "Model Not Found",
-                f"The model ``{model}`` is not available. "
+                ctx, "Unknown Models",
+                f"Unknown models: ``{', '.join(unknown)}``. Available models: ``"
+                f"{', '.join(config.current_profile['available'])}``" if unknown else "There are no models to compare"
             ))
             return
-        try:
-            async with ctx.typing() if not isinstance(ctx, discord.ApplicationContext) else nullcontext():
-                message = {
-                    'role': 'user',
-                    'content': prompt,
-                    'system': 'your response will be sent over discord, so please make sure your entire '
-                              'response is limited to 4096 characters'
-                }
-                if ctx.channel.id not in context_bank:
-                    context_bank[ctx.channel.id] = []
-                context_bank[ctx.channel.id].append(message)
-                response = await self.ollama_client.chat(
-                    model=model_id,
-                    messages=context_bank[ctx.channel.id],
-                    think=enable_thinking
-                )
-        except ollama.ResponseError as error:
+        if len(model_names) > config.max_compare_models:
             await ctx.respond(embed=utils.default_embed(
-                ctx, "Error Genrating Response",
-                f"{error.error}"
+                ctx, "Too Many Models", f"At most {config.max_compare_models} models can be compared at once"
             ))
             return
-        context_bank[ctx.channel.id].append({'role': 'assistant', 'content': response.message.content})
-        thinking_part = None
-        if response.message.thinking:
-            thinking_part = (
-                    "-# **Thinking**...\n-# " +
-                    response.message.thinking.replace(
-                        "\n", "\n-# "
-                    ).replace("\n-# \n", "\n-# ** **\n").rsplit("-# ", 1)[0]
-            )
-            response_content = thinking_part + "\n" + response.message.content
-        elif enable_thinking and not response.message.thinking:
-            response_content = (
-                    ":warning: **WARNING**: thinking associated with the response is missing\n\n"
-                    + response.message.content
-            )
-        else:
-            response_content = response.message.content
-        if len(response_content) <= 2000:
-            await ctx.respond(f"{response_content}")
-        elif len(response_content) <= 4096:
-            await ctx.respond(
-                embed=utils.default_embed(ctx, "Qwen 3 Response", f"{response_content}")
-            )
-        else:
-            language_buffer_size = 16
-            max_length = 4093 if thinking_part else 4096
-            max_length -= language_buffer_size + 8
-            embed_pages = []
-            response_pages = [
-                response_content[x:x + max_length] for x in range(0, len(response_content), max_length)
-            ]
-            unfinished_codeblock = ""
-            unfinished_backtick = False
-            for index, response_page in enumerate(response_pages):
-                part_of_thinking = (
-                        thinking_part and index and max_length * index < len(thinking_part)
-                )
-                if unfinished_codeblock:
-                    response_page = "```" + unfinished_codeblock + '\n' + response_page
-                    unfinished_codeblock = ""
-                elif unfinished_backtick:
-                    response_page = '`' + response_page
-                    unfinished_backtick = False
-                if response_page.count("```") & 1:
-                    unfinished_codeblock = "c"
-                    response_page += "```"
-                elif response_page.count("`") - 3 * response_page.count("```") & 1:
-                    unfinished_backtick = True
-                    response_page += "`"
-                embed_pages.append(
-                    utils.default_embed(
-                        ctx, f"Qwen 3 Response {index + 1}/{len(response_pages)}",
-                        f"-# {response_page}" if part_of_thinking else f"{response_page}"
-                    )
-                )
-            paginator = pages.Paginator(pages=embed_pages)
-            if isinstance(ctx, discord.ApplicationContext):
-                await paginator.respond(ctx.interaction)
-            else:
-                await paginator.send(ctx)
+        await compare.Comparison(
+            self.pipeline, ctx, prompt, model_names, edit_interval=config.stream_edit_interval
+        ).run()
 
-    # noinspection SpellCheckingInspection,PyTypeHints
     @bridge.bridge_command(
-        name='ask-magistral',
-        description="Ask the magistral llm",
+        name='stop-generating',
+        description="Stops every response the LLMs are generating",
         integration_types={discord.IntegrationType.guild_install, discord.IntegrationType.user_install}
     )
-    @commands.cooldown(**config.default_cooldown_options)
-    async def ask_magistral_cmd(
-            self, ctx: bridge.Context, *, prompt: BridgeOption(str, "Prompt to send to magistral"),
-            enable_thinking: BridgeOption(
-                bool, "Enable the LLM to output thinking", default=True, name="enable-thinking"
-            ) = True
+    @commands.is_owner()
+    async def stop_generating_cmd(
+            self, ctx: bridge.Context,
+            scope: BridgeOption(
+                str, "The scope of responses to stop", default="All", name="scope", choices=["Current Channel", "All"]
+            ) = "All"
     ):
-        await ctx.defer()
-        try:
-            await self.ollama_client.ps()
-        except (httpx.ConnectError, httpx.TimeoutException, ConnectionError):
-            app = await ctx.bot.application_info()
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Cannot Connect to Ollama Server.",
-                "Unable to connect to ollama server as it is probably not running. "
-                f"Please ask {app.owner.mention} to start the ollama server."
-            ))
-            return
-        except httpx.HTTPError as error:
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Error Connecting to Ollama Server.",
-                f"There was a problem trying to connect to the ollama server: {error}"
-            ))
+        stopped = self.pipeline.stop(ctx.channel.id if scope.lower() == "current channel" else None)
+        if not stopped:
+            await ctx.respond("There were no responses being generated")
             return
-        try:
-            async with ctx.typing() if not isinstance(ctx, discord.ApplicationContext) else nullcontext():
-                message = {
-                    'role': 'user',
-                    'content': prompt,
-                    'system': 'your response will be sent over discord, so please make sure your entire '
-                              'response is limited to 4096 characters'
-                }
-                if ctx.channel.id not in context_bank:
-                    context_bank[ctx.channel.id] = []
-                context_bank[ctx.channel.id].append(message)
-                response = await self.ollama_client.chat(
-                    model=config.current_profile['available'][
-                        next(iter(
-                            config.current_profile['commands'][ctx.command.qualified_name]['options'].values()))
-                    ],
-                    messages=context_bank[ctx.channel.id],
-                    think=enable_thinking
-                )
-        except ollama.ResponseError as error:
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Error Genrating Response",
-                f"{error.error}"
-            ))
-            return
-        context_bank[ctx.channel.id].append({'role': 'assistant', 'content': response.message.content})
-        thinking_part = None
-        if response.message.thinking:
-            thinking_part = (
-                    "-# **Thinking**...\n-# " +
-                    response.message.thinking.replace(
-                        "\n", "\n-# "
-                    ).replace("\n-# \n", "\n-# ** **\n").rsplit("-# ", 1)[0]
-            )
-            response_content = thinking_part + "\n" + response.message.content
-        elif enable_thinking and not response.message.thinking:
-            response_content = (
-                    ":warning: **WARNING**: thinking associated with the response is missing\n\n"
-                    + response.message.content
-            )
-        else:
-            response_content = response.message.content
-        if len(response_content) <= 2000:
-            await ctx.respond(f"{response_content}")
-        elif len(response_content) <= 4096:
-            await ctx.respond(
-                embed=utils.default_embed(ctx, "Magistral Response", f"{response_content}")
-            )
-        else:
-            language_buffer_size = 16
-            max_length = 4093 if thinking_part else 4096
-            max_length -= language_buffer_size + 8
-            embed_pages = []
-            response_pages = [
-                response_content[x:x + max_length] for x in range(0, len(response_content), max_length)
-            ]
-            unfinished_codeblock = ""
-            unfinished_backtick = False
-            for index, response_page in enumerate(response_pages):
-                part_of_thinking = (
-                        thinking_part and index and max_length * index < len(thinking_part)
-                )
-                if unfinished_codeblock:
-                    response_page = "```" + unfinished_codeblock + '\n' + response_page
-                    unfinished_codeblock = ""
-                elif unfinished_backtick:
-                    response_page = '`' + response_page
-                    unfinished_backtick = False
-                if response_page.count("```") & 1:
-                    unfinished_codeblock = "c"
-                    response_page += "```"
-                elif response_page.count("`") - 3 * response_page.count("```") & 1:
-                    unfinished_backtick = True
-                    response_page += "`"
-                embed_pages.append(
-                    utils.default_embed(
-                        ctx, f"Magistral Response {index + 1}/{len(response_pages)}",
-                        f"-# {response_page}" if part_of_thinking else f"{response_page}"
-                    )
-                )
-            paginator = pages.Paginator(pages=embed_pages)
-            if isinstance(ctx, discord.ApplicationContext):
-                await paginator.respond(ctx.interaction)
-            else:
-                await paginator.send(ctx)
+        await ctx.respond(f"Stopped {stopped} response{'s' if stopped != 1 else ''}")
 
-    # noinspection SpellCheckingInspection,PyTypeHints
     @bridge.bridge_command(
-        name='ask-mistral',
-        description="Ask the mistral llm",
+        name='llm-metrics',
+        description="Shows how fast the LLMs have been responding",
         integration_types={discord.IntegrationType.guild_install, discord.IntegrationType.user_install}
     )
-    @commands.cooldown(**config.default_cooldown_options)
-    async def ask_mistral_cmd(
-            self, ctx: bridge.Context, *, prompt: BridgeOption(str, "Prompt to send to mistral"),
+    @commands.is_owner()
+    async def llm_metrics_cmd(
+            self, ctx: bridge.Context,
+            group: BridgeOption(
+                str, "What to group the metrics by", default="Model", name="group",
+                choices=["Model", "Server", "Command", "Guild"]
+            ) = "Model"
     ):
-        await ctx.defer()
-        try:
-            await self.ollama_client.ps()
-        except (httpx.ConnectError, httpx.TimeoutException, ConnectionError):
-            app = await ctx.bot.application_info()
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Cannot Connect to Ollama Server.",
-                "Unable to connect to ollama server as it is probably not running. "
-                f"Please ask {app.owner.mention} to start the ollama server."
-            ))
-            return
-        except httpx.HTTPError as error:
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Error Connecting to Ollama Server.",
-                f"There was a problem trying to connect to the ollama server: {error}"
-            ))
-            return
-        try:
-            async with ctx.typing() if not isinstance(ctx, discord.ApplicationContext) else nullcontext():
-                message = {
-                    'role': 'user',
-                    'content': prompt,
-                    'system': 'your response will be sent over discord, so please make sure your entire '
-                              'response is limited to 4096 characters'
-                }
-                if ctx.channel.id not in context_bank:
-                    context_bank[ctx.channel.id] = []
-                context_bank[ctx.channel.id].append(message)
-                response = await self.ollama_client.chat(
-                    model=config.current_profile['available'][
-                        next(iter(
-                            config.current_profile['commands'][ctx.command.qualified_name]['options'].values()))
-                    ],
-                    messages=context_bank[ctx.channel.id]
-                )
-        except ollama.ResponseError as error:
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Error Genrating Response",
-                f"{error.error}"
-            ))
-            return
-        context_bank[ctx.channel.id].append({'role': 'assistant', 'content': response.message.content})
-        if len(response.message.content) <= 2000:
-            await ctx.respond(f"{response.message.content}")
-        elif len(response.message.content) <= 4096:
-            await ctx.respond(
-                embed=utils.default_embed(ctx, "Mistral Response", f"{response.message.content}")
-            )
-        else:
-            language_buffer_size = 16
-            max_length = 4096
-            max_length -= language_buffer_size + 8
-            embed_pages = []
-            response_pages = [
-                response.message.content[x:x + max_length] for x in range(0, len(response.message.content), max_length)
-            ]
-            unfinished_codeblock = ""
-            unfinished_backtick = False
-            for index, response_page in enumerate(response_pages):
-                if unfinished_codeblock:
-                    response_page = "```" + unfinished_codeblock + '\n' + response_page
-                    unfinished_codeblock = ""
-                elif unfinished_backtick:
-                    response_page = '`' + response_page
-                    unfinished_backtick = False
-                if response_page.count("```") & 1:
-                    unfinished_codeblock = "c"
-                    response_page += "```"
-                elif response_page.count("`") - 3 * response_page.count("```") & 1:
-                    unfinished_backtick = True
-                    response_page += "`"
-                embed_pages.append(
-                    utils.default_embed(
-                        ctx, f"Mistral Response {index + 1}/{len(response_pages)}", f"{response_page}"
-                    )
-                )
-            paginator = pages.Paginator(pages=embed_pages)
-            if isinstance(ctx, discord.ApplicationContext):
-                await paginator.respond(ctx.interaction)
-            else:
-                await paginator.send(ctx)
+        def seconds(value) -> str:
+            return f"{value:.2f}s" if value is not None else "N/A"
 
-    # noinspection SpellCheckingInspection,PyTypeHints
-    @bridge.bridge_command(
-        name='ask-mistral-nemo',
-        description="Ask the mistral nemo llm",
-        integration_types={discord.IntegrationType.guild_install, discord.IntegrationType.user_install}
-    )
-    @commands.cooldown(**config.default_cooldown_options)
-    async def ask_mistral_nemo_cmd(
-            self, ctx: bridge.Context, *, prompt: BridgeOption(str, "Prompt to send to mistral nemo"),
-    ):
-        await ctx.defer()
-        try:
-            await self.ollama_client.ps()
-        except (httpx.ConnectError, httpx.TimeoutException, ConnectionError):
-            app = await ctx.bot.application_info()
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Cannot Connect to Ollama Server.",
-                "Unable to connect to ollama server as it is probably not running. "
-                f"Please ask {app.owner.mention} to start the ollama server."
-            ))
-            return
-        except httpx.HTTPError as error:
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Error Connecting to Ollama Server.",
-                f"There was a problem trying to connect to the ollama server: {error}"
-            ))
-            return
-        try:
-            async with ctx.typing() if not isinstance(ctx, discord.ApplicationContext) else nullcontext():
-                message = {
-                    'role': 'user',
-                    'content': prompt,
-                    'system': 'your response will be sent over discord, so please make sure your entire '
-                              'response is limited to 4096 characters'
-                }
-                if ctx.channel.id not in context_bank:
-                    context_bank[ctx.channel.id] = []
-                context_bank[ctx.channel.id].append(message)
-                response = await self.ollama_client.chat(
-                    model=config.current_profile['available'][
-                        next(iter(
-                            config.current_profile['commands'][ctx.command.qualified_name]['options'].values()))
-                    ],
-                    messages=context_bank[ctx.channel.id]
-                )
-        except ollama.ResponseError as error:
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Error Genrating Response",
-                f"{error.error}"
-            ))
-            return
-        context_bank[ctx.channel.id].append({'role': 'assistant', 'content': response.message.content})
-        if len(response.message.content) <= 2000:
-            await ctx.respond(f"{response.message.content}")
-        elif len(response.message.content) <= 4096:
-            await ctx.respond(
-                embed=utils.default_embed(ctx, "Mistral NeMo Response", f"{response.message.content}")
-            )
-        else:
-            language_buffer_size = 16
-            max_length = 4096
-            max_length -= language_buffer_size + 8
-            embed_pages = []
-            response_pages = [
-                response.message.content[x:x + max_length] for x in range(0, len(response.message.content), max_length)
-            ]
-            unfinished_codeblock = ""
-            unfinished_backtick = False
-            for index, response_page in enumerate(response_pages):
-                if unfinished_codeblock:
-                    response_page = "```" + unfinished_codeblock + '\n' + response_page
-                    unfinished_codeblock = ""
-                elif unfinished_backtick:
-                    response_page = '`' + response_page
-                    unfinished_backtick = False
-                if response_page.count("```") & 1:
-                    unfinished_codeblock = "c"
-                    response_page += "```"
-                elif response_page.count("`") - 3 * response_page.count("```") & 1:
-                    unfinished_backtick = True
-                    response_page += "`"
-                embed_pages.append(
-                    utils.default_embed(
-                        ctx, f"Mistral NeMo Response {index + 1}/{len(response_pages)}", f"{response_page}"
-                    )
-                )
-            paginator = pages.Paginator(pages=embed_pages)
-            if isinstance(ctx, discord.ApplicationContext):
-                await paginator.respond(ctx.interaction)
-            else:
-                await paginator.send(ctx)
+        def rate(value) -> str:
+            return f"{value:.1f}" if value is not None else "N/A"
 
-    # noinspection SpellCheckingInspection,PyTypeHints
-    @bridge.bridge_command(
-        name='ask-gpt-oss',
-        description="Ask the gpt-oss llm",
-        integration_types={discord.IntegrationType.guild_install, discord.IntegrationType.user_install}
-    )
-    @commands.cooldown(**config.default_cooldown_options)
-    async def ask_gpt_oss_cmd(
-            self, ctx: bridge.Context, *, prompt: BridgeOption(str, "Prompt to send to gpt-oss"),
-            enable_thinking: BridgeOption(
-                bool, "Enable the LLM to output thinking", default=True, name="enable-thinking"
-            ) = True
-    ):
-        await ctx.defer()
-        try:
-            await self.ollama_client.ps()
-        except (httpx.ConnectError, httpx.TimeoutException, ConnectionError):
-            app = await ctx.bot.application_info()
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Cannot Connect to Ollama Server.",
-                "Unable to connect to ollama server as it is probably not running. "
-                f"Please ask {app.owner.mention} to start the ollama server."
-            ))
-            return
-        except httpx.HTTPError as error:
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Error Connecting to Ollama Server.",
-                f"There was a problem trying to connect to the ollama server: {error}"
-            ))
-            return
-        try:
-            async with ctx.typing() if not isinstance(ctx, discord.ApplicationContext) else nullcontext():
-                message = {
-                    'role': 'user',
-                    'content': prompt,
-                    'system': 'your response will be sent over discord, so please make sure your entire '
-                              'response is limited to 4096 characters'
-                }
-                if ctx.channel.id not in context_bank:
-                    context_bank[ctx.channel.id] = []
-                context_bank[ctx.channel.id].append(message)
-                response = await self.ollama_client.chat(
-                    model=config.current_profile['available'][
-                        next(iter(
-                            config.current_profile['commands'][ctx.command.qualified_name]['options'].values()))
-                    ],
-                    messages=context_bank[ctx.channel.id],
-                    think=enable_thinking
-                )
-        except ollama.ResponseError as error:
-            await ctx.respond(embed=utils.default_embed(
-                ctx, "Error Genrating Response",
-                f"{error.error}"
-            ))
-            return
-        context_bank[ctx.channel.id].append({'role': 'assistant', 'content': response.message.content})
-        thinking_part = None
-        if response.message.thinking:
-            thinking_part = (
-                    "-# **Thinking**...\n-# " +
-                    response.message.thinking.replace(
-                        "\n", "\n-# "
-                    ).replace("\n-# \n", "\n-# ** **\n").rsplit("-# ", 1)[0]
-            )
-            response_content = thinking_part + "\n" + response.message.content
-        elif enable_thinking and not response.message.thinking:
-            response_content = (
-                    ":warning: **WARNING**: thinking associated with the response is missing\n\n"
-                    + response.message.content
+        labels = self.metrics.series.get(group.lower(), {})
+        if not labels:
+            await ctx.respond("No generations have been recorded yet")
+            return
+        embed_pages = []
+        for label, series in sorted(labels.items(), key=lambda item: item[1].requests, reverse=True):
+            if group.lower() == "guild" and label.isdigit():
+                guild = ctx.bot.get_guild(int(label))
+                label = guild.name if guild else label
+            ttft = series.histograms['ttft']
+            queue_wait = series.histograms['queue_wait']
+            tokens_per_second = series.histograms['tokens_per_second']
+            name = label[:256]
+            value = (
+                f"**Requests**: {series.requests} ({series.cold_loads} cold loads)\n"
+                f"**Time to first token**: p50 {seconds(ttft.percentile(50))}, p95 {seconds(ttft.percentile(95))}\n"
+                f"**Tokens/sec**: p50 {rate(tokens_per_second.percentile(50))}, "
+                f"p95 {rate(tokens_per_second.percentile(95))}\n"
+                f"**Queue wait**: p50 {seconds(queue_wait.percentile(50))}, "
+                f"p95 {seconds(queue_wait.percentile(95))}\n"
+                f"**Tokens**: {series.prompt_tokens} prompt, {series.generated_tokens} generated"
             )
+            # discord rejects embeds with more than 25 fields or 6000 characters in total
+            if not embed_pages or len(embed_pages[-1].fields) == 25 or \
+                    len(embed_pages[-1]) + len(name) + len(value) > 6000:
+                embed_pages.append(utils.default_embed(
+                    ctx, f"LLM Metrics by {group}", "Percentiles are estimated to within 25%"
+                ))
+            embed_pages[-1].add_field(name=name, value=value, inline=False)
+        if len(embed_pages) == 1:
+            await ctx.respond(embed=embed_pages[0])
+            return
+        paginator = pages.Paginator(pages=embed_pages)
+        if isinstance(ctx, discord.ApplicationContext):
+            await paginator.respond(ctx.interaction)
         else:
-            response_content = response.message.content
-        if len(response_content) <= 2000:
-            await ctx.respond(f"{response_content}")
-        elif len(response_content) <= 4096:
-            await ctx.respond(
-                embed=utils.default_embed(ctx, "GPT-OSS Response", f"{response_content}")
-            )
-        else:
-            language_buffer_size = 16
-            max_length = 4093 if thinking_part else 4096
-            max_length -= language_buffer_size + 8
-            embed_pages = []
-            response_pages = [
-                response_content[x:x + max_length] for x in range(0, len(response_content), max_length)
-            ]
-            unfinished_codeblock = ""
-            unfinished_backtick = False
-            for index, response_page in enumerate(response_pages):
-                part_of_thinking = (
-                        thinking_part and index and max_length * index < len(thinking_part)
-                )
-                if unfinished_codeblock:
-                    response_page = "```" + unfinished_codeblock + '\n' + response_page
-                    unfinished_codeblock = ""
-                elif unfinished_backtick:
-                    response_page = '`' + response_page
-                    unfinished_backtick = False
-                if response_page.count("```") & 1:
-                    unfinished_codeblock = "c"
-                    response_page += "```"
-                elif response_page.count("`") - 3 * response_page.count("```") & 1:
-                    unfinished_backtick = True
-                    response_page += "`"
-                embed_pages.append(
-                    utils.default_embed(
-                        ctx, f"GPT-OSS Response {index + 1}/{len(response_pages)}",
-                        f"-# {response_page}" if part_of_thinking else f"{response_page}"
-                    )
-                )
-            paginator = pages.Paginator(pages=embed_pages)
-            if isinstance(ctx, discord.ApplicationContext):
-                await paginator.respond(ctx.interaction)
-            else:
-                await paginator.send(ctx)
-
-    # noinspection SpellCheckingInspection,PyTypeHints
-    @bridge.bridge_command(
-        name='clear-context',
-        description="Clears the message context from the llms",
-        integration_types={discord.IntegrationType.guild_install, discord.IntegrationType.user_install}
-    )
-    @commands.cooldown(**config.default_cooldown_options)
-    async def clear_context_cmd(
-            self, ctx: bridge.Context,
-            scope: BridgeOption(
-                str, "The scope of context to clear", default="Current Channel", name="scope",
-                choices=["Current Channel", "All"]
-            ) = "Current Channel"
-    ):
-        if scope.lower() == "all":
-            owner_check = await ctx.bot.is_owner(ctx.author)
-            if not owner_check:
-                raise commands.NotOwner()
-            await ctx.defer()
-            context_bank.clear()
-            await ctx.respond("Cleared all session context")
-            return
-        await ctx.defer()
-        if not context_bank.get(ctx.channel.id):
-            await ctx.respond("There was no context to clear in this channel")
-            return
-        context_bank[ctx.channel.id].clear()
-        await ctx.respond("Cleared the context for the current channel")
+            await paginator.send(ctx)
 
 
 def setup(client):
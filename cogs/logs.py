@@ -442,6 +442,16 @@ class Logging(config.RevnobotCog):
                     await message.guild.leave()
                 except discord.HTTPException:
                     pass
+                return
+
+        # feed the LLMs' channel memory, which embeds the messages in batches in the background
+        ollama_cog = self.client.get_cog("Ollama")
+        if config.memory_index_messages and getattr(ollama_cog, "memory", None) is not None and \
+                not message.author.bot and message.content and not message.content.startswith(config.prefix):
+            ollama_cog.memory.remember_message(
+                message.guild.id if message.guild else None, message.channel.id, message.author.display_name,
+                message.content
+            )
 
 
 def setup(client):
@@ -1,7 +1,7 @@
 import datetime
 import os
 import sys
-from typing import Optional, Literal, NamedTuple
+from typing import Optional, Literal, NamedTuple, Union
 from discord.ext import commands
 from dotenv import load_dotenv
 import json
@@ -77,6 +77,58 @@ debug_mode: bool = sysinfo["debug mode"]
 log_messages: bool = sysinfo["log messages"]
 logging_excluded: list = sysinfo["logging excluded"]
 ollama_server: str = sysinfo["ollama_server"]
+stream_responses: bool = sysinfo["stream responses"]
+stream_edit_interval: float = float(sysinfo["stream edit interval"])
+model_concurrency: int = int(sysinfo["model concurrency"])
+max_active_models: int = int(sysinfo["max active models"])
+max_queue_wait: float = float(sysinfo["max queue wait"])
+default_num_predict: int = int(sysinfo["default num predict"])
+default_deadline: float = float(sysinfo["default deadline"])
+tight_budget_wait: float = float(sysinfo["tight budget wait"])
+tight_budget_ratio: float = float(sysinfo["tight budget ratio"])
+context_token_budget: int = int(sysinfo["context token budget"])
+context_memory_cap: int = int(sysinfo["context memory cap"]) * 1024 ** 2
+context_ttl: float = float(sysinfo["context ttl"])
+context_trim_ratio: float = float(sysinfo["context trim ratio"])
+context_summary_model: Optional[str] = sysinfo["context summary model"] or None
+context_summary_threshold: float = float(sysinfo["context summary threshold"])
+context_summary_keep: int = int(sysinfo["context summary keep"])
+inventory_refresh_interval: float = float(sysinfo["inventory refresh interval"])
+conversation_database: Optional[str] = sysinfo["conversation database"] or None
+metrics_snapshot: Optional[str] = sysinfo["metrics snapshot"] or None
+metrics_snapshot_interval: float = float(sysinfo["metrics snapshot interval"])
+response_cache: bool = sysinfo["response cache"]
+response_cache_size: int = int(sysinfo["response cache size"])
+response_cache_ttl: float = float(sysinfo["response cache ttl"])
+response_cache_spill: Optional[str] = sysinfo["response cache spill"] or None
+response_cache_seed: int = int(sysinfo["response cache seed"])
+prewarm_models: bool = sysinfo["prewarm models"]
+hot_model_keep_alive: Union[float, str] = sysinfo["hot model keep alive"]
+hot_model_uses: int = int(sysinfo["hot model uses"])
+model_usage_window: float = float(sysinfo["model usage window"])
+model_memory_limit: int = int(float(sysinfo["model memory limit"]) * 1024 ** 3)
+preprocess_images: bool = sysinfo["preprocess images"]
+image_max_size: int = int(sysinfo["image max size"])
+image_workers: int = int(sysinfo["image workers"])
+image_cache_size: int = int(sysinfo["image cache size"])
+user_token_budget: float = float(sysinfo["user token budget"])
+guild_token_budget: float = float(sysinfo["guild token budget"])
+token_budget_refill_time: float = float(sysinfo["token budget refill time"])
+priority_guilds: list[int] = [int(guild_id) for guild_id in sysinfo["priority guilds"]]
+compare_models: list[str] = sysinfo["compare models"]
+max_compare_models: int = int(sysinfo["max compare models"])
+memory_embedding_model: Optional[str] = sysinfo["memory embedding model"] or None
+memory_directory: str = sysinfo["memory directory"]
+memory_top_k: int = int(sysinfo["memory top k"])
+memory_min_score: float = float(sysinfo["memory min score"])
+memory_index_messages: bool = sysinfo["memory index messages"]
+embedding_batch_size: int = int(sysinfo["embedding batch size"])
+embedding_batch_window: float = float(sysinfo["embedding batch window"])
+embedding_queue_size: int = int(sysinfo["embedding queue size"])
+text_attachments: bool = sysinfo["text attachments"]
+attachment_max_bytes: int = int(sysinfo["attachment max size"]) * 1024
+attachment_token_budget: int = int(sysinfo["attachment token budget"])
+attachment_summary_model: Optional[str] = sysinfo["attachment summary model"] or None
 
 with open("./json/server-profile-template.json") as profile_template_fp:
     profile_template: dict = json.load(profile_template_fp)
@@ -92,6 +144,18 @@ if not os.path.isfile('./json/server-profiles.json'):
 with open('./json/server-profiles.json') as r_server_profiles:
     server_profiles: dict = json.load(r_server_profiles)
 
+for profile in server_profiles.values():
+    for command_name, command_entry in profile["commands"].items():
+        template_entry = profile_template["commands"].get(command_name)
+        if template_entry is None or not set(template_entry.keys()).difference(command_entry.keys()):
+            continue
+        print(f"New command field for {command_name} not present in old server-profiles.json!\n"
+              "Attempting to fix the issue by copying the field from the template...")
+        for key in set(template_entry.keys()).difference(command_entry.keys()):
+            command_entry[key] = template_entry[key]
+        with open('./json/server-profiles.json', "w") as w_server_profiles:
+            json.dump(server_profiles, w_server_profiles, indent=2)
+
 if ollama_server not in server_profiles:
     server_profiles[ollama_server] = profile_template
     with open('./json/server-profiles.json', "w") as w_server_profiles:
@@ -0,0 +1,161 @@
+import time
+from typing import Iterable, Optional
+import ollama
+
+
+class TokenBucket:
+    """A budget that refills continuously up to its capacity. It can be charged more than it holds, in which case it
+    has to refill past zero before it can be charged again.
+    Args:
+        capacity (float): The most the budget can hold
+        refill_time (float): The amount of seconds it takes to refill from empty to full
+    """
+    def __init__(self, capacity: float, refill_time: float):
+        self.capacity = capacity
+        self.rate = capacity / refill_time if refill_time > 0 else float("inf")
+        self._level = capacity
+        self._updated_at = time.monotonic()
+
+    @property
+    def level(self) -> float:
+        now = time.monotonic()
+        self._level = min(self.capacity, self._level + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+        return self._level
+
+    def retry_after(self, cost: float) -> float:
+        """The amount of seconds until the budget can be charged the cost, or 0 if it can be charged now"""
+        needed = min(cost, self.capacity)
+        level = self.level
+        return 0.0 if level >= needed else (needed - level) / self.rate
+
+    def charge(self, cost: float):
+        self._level = self.level - cost
+
+    @property
+    def full(self) -> bool:
+        return self.level >= self.capacity
+
+
+class Charge:
+    """What a request was charged on admission, so the charge can be settled against the tokens it actually used
+    Args:
+        model_id (str): The id of the model the request was charged for
+        weight (float): The cost of a single token of the model
+        prompt_tokens (int): The estimated amount of prompt tokens
+        output_tokens (int): The estimated amount of generated tokens
+        buckets (list[TokenBucket]): The budgets that were charged
+    """
+    def __init__(self, model_id: str, weight: float, prompt_tokens: int, output_tokens: int,
+                 buckets: list[TokenBucket]):
+        self.model_id = model_id
+        self.weight = weight
+        self.prompt_tokens = prompt_tokens
+        self.output_tokens = output_tokens
+        self.buckets = buckets
+
+    @property
+    def cost(self) -> float:
+        return (self.prompt_tokens + self.output_tokens) * self.weight
+
+
+class AdmissionController:
+    """Shares the capacity of the ollama servers between users and guilds on purpose instead of first come, first
+    served. Requests are charged their expected cost, which is the amount of tokens they are expected to evaluate and
+    generate weighted by the size of the model in GiB, against a budget of the user and of the guild that refills over
+    time. Once the request is done, the charge is corrected to the tokens it actually used. Requests from the bot owner
+    and the priority guilds aren't charged and jump the queue of the model they run on.
+    Args:
+        user_budget (float): The budget of each user, or 0 for no limit
+        guild_budget (float): The budget of each guild, or 0 for no limit
+        refill_time (float): The amount of seconds it takes an empty budget to refill
+        priority_guilds (Iterable[int]): The ids of the guilds whose requests are prioritized
+        default_output_tokens (int): The amount of tokens a model is expected to generate before any of its responses
+            have been observed
+    """
+    def __init__(self, user_budget: float = 0, guild_budget: float = 0, refill_time: float = 3600.0,
+                 priority_guilds: Iterable[int] = (), default_output_tokens: int = 512):
+        self.user_budget = user_budget
+        self.guild_budget = guild_budget
+        self.refill_time = refill_time
+        self.priority_guilds = set(priority_guilds)
+        self.default_output_tokens = default_output_tokens
+        self._users: dict[int, TokenBucket] = {}
+        self._guilds: dict[int, TokenBucket] = {}
+        self._output_tokens: dict[str, float] = {}
+
+    def is_priority(self, guild_id: Optional[int], owner: bool) -> bool:
+        return owner or guild_id in self.priority_guilds
+
+    @staticmethod
+    def weight(size: Optional[int]) -> float:
+        """The cost of a single token of a model that takes up ``size`` bytes, at least that of a 1 GiB model"""
+        return max(1.0, (size or 0) / 1024 ** 3)
+
+    def expected_output(self, model_id: str, num_predict: Optional[int] = None) -> int:
+        """The amount of tokens a model is expected to generate, from the responses it has generated so far"""
+        expected = int(self._output_tokens.get(model_id, self.default_output_tokens))
+        return min(expected, num_predict) if num_predict and num_predict > 0 else expected
+
+    def _buckets(self, user_id: int, guild_id: Optional[int]) -> list[TokenBucket]:
+        buckets = []
+        if self.user_budget:
+            buckets.append(self._users.setdefault(user_id, TokenBucket(self.user_budget, self.refill_time)))
+        if self.guild_budget and guild_id is not None:
+            buckets.append(self._guilds.setdefault(guild_id, TokenBucket(self.guild_budget, self.refill_time)))
+        return buckets
+
+    def admit(self, user_id: int, guild_id: Optional[int], model_id: str, size: Optional[int], prompt_tokens: int,
+              num_predict: Optional[int] = None) -> tuple[Optional[Charge], float]:
+        """Charges a request its expected cost if the budgets of the user and guild allow it
+        Args:
+            user_id (int): The id of the user that made the request
+            guild_id (Optional[int]): The id of the guild the request was made in, or ``None`` in DMs
+            model_id (str): The id of the model the request will run on
+            size (Optional[int]): The amount of bytes the model takes up, if known
+            prompt_tokens (int): The estimated amount of tokens in the prompt
+            num_predict (Optional[int]): The maximum amount of tokens the request can generate
+        Returns:
+            tuple[Optional[Charge], float]: The charge, or ``None`` if the request was turned away, and the amount of
+            seconds until the budgets allow it
+        """
+        buckets = self._buckets(user_id, guild_id)
+        charge = Charge(
+            model_id, self.weight(size), prompt_tokens, self.expected_output(model_id, num_predict), buckets
+        )
+        retry_after = max((bucket.retry_after(charge.cost) for bucket in buckets), default=0.0)
+        if retry_after > 0:
+            return None, retry_after
+        for bucket in buckets:
+            bucket.charge(charge.cost)
+        return charge, 0.0
+
+    def bill(self, charge: Charge, tokens: int, size: Optional[int] = None):
+        """Charges a request for tokens it used on another model along the way, e.g. to summarize its attached files.
+        Settling the charge doesn't refund them."""
+        for bucket in charge.buckets:
+            bucket.charge(tokens * self.weight(size))
+
+    def settle(self, charge: Charge, response: Optional[ollama.ChatResponse] = None):
+        """Corrects a charge to the tokens the request actually used, refunding it entirely if it generated nothing,
+        e.g. because it failed or was served from the response cache"""
+        if response is not None and response.eval_count:
+            previous = self._output_tokens.get(charge.model_id)
+            self._output_tokens[charge.model_id] = (
+                response.eval_count if previous is None else 0.8 * previous + 0.2 * response.eval_count
+            )
+        used = 0.0
+        if response is not None:
+            # a stopped response doesn't report its token counts, so they are estimated from what it holds
+            prompt_tokens = response.prompt_eval_count
+            output_tokens = response.eval_count
+            if output_tokens is None:
+                output_tokens = len((response.message.content or "") + (response.message.thinking or "")) // 4
+            used = ((charge.prompt_tokens if prompt_tokens is None else prompt_tokens) + output_tokens) * charge.weight
+        for bucket in charge.buckets:
+            bucket.charge(used - charge.cost)
+
+    def compact(self):
+        """Forgets the budgets that have refilled completely"""
+        self._users = {user_id: bucket for user_id, bucket in self._users.items() if not bucket.full}
+        self._guilds = {guild_id: bucket for guild_id, bucket in self._guilds.items() if not bucket.full}
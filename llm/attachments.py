@@ -0,0 +1,184 @@
+import asyncio
+import codecs
+import hashlib
+import os
+from typing import Callable, Optional
+import discord
+import httpx
+import ollama
+from llm import pool
+
+TEXT_EXTENSIONS = frozenset({
+    "txt", "md", "rst", "log", "csv", "tsv", "json", "jsonl", "yaml", "yml", "toml", "ini", "cfg", "conf", "env", "xml",
+    "html", "htm", "css", "scss", "js", "mjs", "ts", "tsx", "jsx", "py", "pyi", "rb", "php", "java", "kt", "kts",
+    "scala", "go", "rs", "c", "h", "cc", "cpp", "hpp", "cs", "swift", "m", "lua", "pl", "r", "jl", "dart", "sh",
+    "bash", "zsh", "fish", "ps1", "bat", "cmd", "sql", "graphql", "proto", "gradle", "cmake", "mk", "diff", "patch",
+    "tex", "srt", "vtt"
+})
+TEXT_FILE_NAMES = frozenset({"dockerfile", "makefile", "readme", "license", "requirements.txt", ".gitignore"})
+TEXT_CONTENT_TYPES = (
+    "text/", "application/json", "application/xml", "application/yaml", "application/x-yaml", "application/toml",
+    "application/javascript", "application/x-sh", "application/sql"
+)
+SUMMARY_PROMPT = (
+    'Summarize the following file so someone can answer questions about it without reading it. Keep the names, '
+    'numbers, errors, code structure and anything unusual. Only reply with the summary.'
+)
+
+
+def is_text(attachment: discord.Attachment) -> bool:
+    """Whether an attachment is a text, code or log file, judging by its content type and file name"""
+    content_type = (getattr(attachment, "content_type", None) or "").split(";")[0].strip().lower()
+    file_name = attachment.filename.lower()
+    return (
+        content_type.startswith(TEXT_CONTENT_TYPES) or os.path.splitext(file_name)[1].lstrip(".") in TEXT_EXTENSIONS
+        or file_name in TEXT_FILE_NAMES
+    )
+
+
+def marker(file_name: str, digest: str) -> str:
+    """The line an attached file starts with in a prompt, which is how a file attached again is recognised"""
+    return f"--- Attached file {file_name} (sha256 {digest[:16]}) ---"
+
+
+def decode(data: bytes) -> tuple[str, Optional[str]]:
+    """Hashes and decodes the contents of a file. Meant to be run off the event loop.
+    Returns:
+        tuple[str, Optional[str]]: The SHA-256 of the data and the text, or ``None`` if the data isn't text
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    if data.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return digest, data.decode("utf-16", errors="replace").replace("\r\n", "\n")
+    if b"\x00" in data[:8192]:
+        return digest, None
+    # a file that was only partly read can end halfway through a character, which is replaced
+    return digest, data.decode("utf-8-sig", errors="replace").replace("\r\n", "\n")
+
+
+def truncate(text: str, max_chars: int) -> str:
+    """Cuts the middle out of a text that is too long, keeping whole lines from its start and end since both the
+    setup of a file and the end of a log tend to matter"""
+    if len(text) <= max_chars:
+        return text
+    head = text[:max_chars * 2 // 3]
+    head = head[:head.rfind("\n") + 1] or head
+    tail = text[len(text) - (max_chars - len(head)):]
+    tail = tail[tail.find("\n") + 1:] or tail
+    omitted = text.count("\n", len(head), len(text) - len(tail))
+    return f"{head}[... {omitted} lines omitted ...]\n{tail}"
+
+
+class AttachmentIngestor:
+    """Reads the text, code and log files attached to prompts into the prompt. Files are streamed in chunks and only
+    read up to ``max_bytes``, hashed and decoded in a thread, and cut down to the token budget by summarizing them with
+    a small model if one is configured, or by cutting out their middle. A file that is still in a channel's history
+    is not added again.
+    Args:
+        server_pool (pool.ServerPool): The ollama servers to run the summaries on
+        max_bytes (int): The maximum amount of bytes read of each file
+        token_budget (int): The amount of tokens all the files attached to a prompt can take up together
+        summary_model (Optional[str]): The name of the model in the server profiles that summarizes files that are
+            over the budget, or ``None`` to truncate them instead
+        chunk_size (int): The amount of bytes read at a time
+    """
+    def __init__(self, server_pool: pool.ServerPool, max_bytes: int = 1024 ** 2, token_budget: int = 4096,
+                 summary_model: Optional[str] = None, chunk_size: int = 65536):
+        self.pool = server_pool
+        self.max_bytes = max_bytes
+        self.token_budget = token_budget
+        self.summary_model = summary_model
+        self.chunk_size = chunk_size
+
+    async def _read(self, client: httpx.AsyncClient, attachment: discord.Attachment) -> bytes:
+        chunks = []
+        received = 0
+        async with client.stream("GET", attachment.url) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(self.chunk_size):
+                chunks.append(chunk[:self.max_bytes - received])
+                received += len(chunks[-1])
+                if received >= self.max_bytes:
+                    # leaving the stream early closes the connection instead of downloading the rest
+                    break
+        return b"".join(chunks)
+
+    async def summarize(self, file_name: str, text: str, max_tokens: int,
+                        on_usage: Callable[[int, Optional[int]], None] = None) -> Optional[str]:
+        """Summarizes a file with the summary model
+        Args:
+            file_name (str): The name of the file
+            text (str): The contents of the file
+            max_tokens (int): The maximum amount of tokens the summary can take up
+            on_usage (Callable[[int, Optional[int]], None]): Called with the amount of tokens the summary used and the
+                size of the summary model in bytes, if known, so they can be charged to the request
+        Returns:
+            Optional[str]: The summary, or ``None`` if no server could summarize it
+        """
+        server, model_id = self.pool.route(self.summary_model)
+        if server is None:
+            return None
+        try:
+            async with server.scheduler.slot(model_id, 0, 0):
+                response = await server.client.chat(model=model_id, messages=[
+                    {'role': 'system', 'content': SUMMARY_PROMPT},
+                    # the summary model only sees as much of the file as fits a few times the budget
+                    {'role': 'user', 'content': f"{file_name}:\n\n{truncate(text, max_tokens * 16)}"}
+                ], options={'num_predict': max_tokens, 'temperature': 0})
+        except (httpx.HTTPError, ConnectionError, ollama.ResponseError):
+            server.inventory.invalidate()
+            return None
+        if on_usage is not None:
+            on_usage(
+                (response.prompt_eval_count or 0) + (response.eval_count or 0), server.inventory.sizes.get(model_id)
+            )
+        return (response.message.content or "").strip() or None
+
+    async def _ingest(self, client: httpx.AsyncClient, attachment: discord.Attachment, history_text: str,
+                      max_tokens: int, on_usage: Callable[[int, Optional[int]], None] = None) -> Optional[str]:
+        try:
+            data = await self._read(client, attachment)
+        except httpx.HTTPError:
+            return f"[The attached file {attachment.filename} could not be read]"
+        digest, text = await asyncio.to_thread(decode, data)
+        if text is None:
+            return None
+        header = marker(attachment.filename, digest)
+        if header in history_text:
+            return f"[The attached file {attachment.filename} is the same as the one attached earlier]"
+        notes = []
+        if attachment.size > self.max_bytes:
+            notes.append(f"[Only the first {self.max_bytes // 1024} KiB of {attachment.size // 1024} KiB were read]")
+        if len(text) > max_tokens * 4:
+            summary = await self.summarize(
+                attachment.filename, text, max_tokens, on_usage
+            ) if self.summary_model else None
+            if summary is not None:
+                notes.append("[The file is too long to include, so this is a summary of it]")
+                text = summary
+            else:
+                text = await asyncio.to_thread(truncate, text, max_tokens * 4)
+        return "\n".join([header, *notes, text])
+
+    async def ingest(self, attachments: list[discord.Attachment], history: list[dict],
+                     on_usage: Callable[[int, Optional[int]], None] = None) -> list[str]:
+        """Reads the text files among the attachments of a prompt, sharing the token budget between them
+        Args:
+            attachments (list[discord.Attachment]): The files attached to the prompt
+            history (list[dict]): The history of the channel, whose files aren't added again
+            on_usage (Callable[[int, Optional[int]], None]): Called with the tokens used by each summary, see
+                :meth:`summarize`
+        Returns:
+            list[str]: The text to add to the prompt for each file
+        """
+        text_files = [attachment for attachment in attachments if is_text(attachment)]
+        if not text_files:
+            return []
+        history_text = "\n".join(
+            message.get('content') or "" for message in history if message.get('role') == 'user'
+        )
+        async with httpx.AsyncClient(follow_redirects=True) as client:
+            blocks = await asyncio.gather(*(
+                self._ingest(client, attachment, history_text, self.token_budget // len(text_files), on_usage)
+                for attachment in text_files
+            ))
+        return [block for block in blocks if block]
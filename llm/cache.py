@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+import ollama
+
+
+def normalize(content: str) -> str:
+    return " ".join(content.split())
+
+
+def cache_key(model_id: str, messages: list[dict], options: dict) -> str:
+    """Hashes a chat request into the key of its cached response. The content of the messages is normalized so
+    differences in whitespace still hit, and images are hashed by their bytes."""
+    digest = hashlib.sha256(model_id.encode())
+    for message in messages:
+        digest.update(b"\0" + message.get('role', '').encode() + b"\0" + normalize(message.get('content', '')).encode())
+        for image in message.get('images') or []:
+            digest.update(b"\0" + hashlib.sha256(image if isinstance(image, bytes) else str(image).encode()).digest())
+    digest.update(b"\0" + json.dumps(options, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def cacheable(chat_kwargs: dict) -> bool:
+    """Whether a response to a request with these chat arguments is deterministic enough to be cached, which it only is
+    with a temperature of 0 or a fixed seed. Ollama samples with a non-zero temperature by default, so any other
+    response would be replayed as if it were the only answer."""
+    options = chat_kwargs.get('options') or {}
+    return options.get('temperature') == 0 or options.get('seed') is not None
+
+
+class ResponseCache:
+    """An in memory LRU cache of finished chat responses, for prompts that are sent over and over again. Entries
+    evicted to make room can optionally be spilled to an SQLite database and are read back from there on a miss.
+    Spilled entries are queued and written by :meth:`flush`, which along with :meth:`load` is meant to be run off the
+    event loop.
+    Args:
+        max_entries (int): The amount of responses kept in memory
+        max_age (float): The amount of seconds a response is served for after it was generated
+        spill_path (Optional[str]): The path of the SQLite database evicted responses are spilled to
+    """
+    def __init__(self, max_entries: int = 256, max_age: float = 3600.0, spill_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.spill_path = spill_path
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._spilled: list[tuple[str, float, str]] = []
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        if spill_path:
+            if os.path.dirname(spill_path):
+                os.makedirs(os.path.dirname(spill_path), exist_ok=True)
+            self._connection = sqlite3.connect(spill_path, check_same_thread=False)
+            with self._lock, self._connection:
+                self._connection.execute("PRAGMA journal_mode=WAL")
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS responses "
+                    "(key TEXT PRIMARY KEY, created REAL NOT NULL, response TEXT NOT NULL)"
+                )
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def pending(self) -> int:
+        return len(self._spilled)
+
+    def get(self, key: str) -> Optional[ollama.ChatResponse]:
+        """Looks a response up in memory"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.time() - self.max_age:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return ollama.ChatResponse.model_validate(entry[1])
+
+    def put(self, key: str, response: ollama.ChatResponse, created: float = None):
+        self._entries[key] = (created or time.time(), response.model_dump(mode="json", exclude_none=True))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            evicted_key, (evicted_created, evicted) = self._entries.popitem(last=False)
+            if self._connection is not None and evicted_created >= time.time() - self.max_age:
+                self._spilled.append((evicted_key, evicted_created, json.dumps(evicted)))
+
+    def load(self, key: str) -> Optional[ollama.ChatResponse]:
+        """Looks a response up in the spill database, moving it back into memory if it is found"""
+        if self._connection is None:
+            return None
+        if self._spilled:
+            self.flush()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT created, response FROM responses WHERE key = ? AND created >= ?",
+                (key, time.time() - self.max_age)
+            ).fetchone()
+        if row is None:
+            return None
+        response = ollama.ChatResponse.model_validate(json.loads(row[1]))
+        self.put(key, response, row[0])
+        return response
+
+    def flush(self):
+        """Writes the spilled responses to the database and removes the ones that are too old to be served"""
+        if self._connection is None:
+            return
+        with self._lock:
+            spilled, self._spilled = self._spilled, []
+            with self._connection:
+                self._connection.executemany("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", spilled)
+                self._connection.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.max_age,))
+
+    def clear(self):
+        self._entries.clear()
+        self._spilled.clear()
+        if self._connection is not None:
+            with self._lock, self._connection:
+                self._connection.execute("DELETE FROM responses")
+
+    def close(self):
+        if self._connection is None:
+            return
+        self.flush()
+        with self._lock:
+            self._connection.close()
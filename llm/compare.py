@@ -0,0 +1,304 @@
+import asyncio
+import time
+from typing import Optional, Union
+import discord
+import httpx
+import ollama
+from discord.ext import commands, pages
+import config
+import utils
+from llm import admission, context, paginator, pipeline, streaming
+
+# the most characters of each model's summary shown, so the summaries leave room for the response in an embed
+SUMMARY_LIMIT = 200
+# discord rejects embeds with more characters than this in total
+EMBED_LIMIT = 6000
+
+
+def clip(text: str, limit: int = SUMMARY_LIMIT) -> str:
+    return text if len(text) <= limit else text[:limit - 3] + "..."
+
+
+class ComparisonView(streaming.StopView):
+    """The view of a comparison, with buttons to flip between the models and to stop every response"""
+    def __init__(self, comparison: "Comparison"):
+        super().__init__(comparison)
+        self.comparison = comparison
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.grey, emoji="◀️")
+    async def previous_button(self, _: discord.ui.Button, interaction: discord.Interaction):
+        self.comparison.page = (self.comparison.page - 1) % len(self.comparison.streams)
+        await interaction.response.edit_message(embed=self.comparison.embed(), view=self)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.grey, emoji="▶️")
+    async def next_button(self, _: discord.ui.Button, interaction: discord.Interaction):
+        self.comparison.page = (self.comparison.page + 1) % len(self.comparison.streams)
+        await interaction.response.edit_message(embed=self.comparison.embed(), view=self)
+
+
+class ComparisonStream(streaming.StreamingResponse):
+    """The response of one of the models in a comparison, which is rendered into the comparison's message instead of
+    its own
+    Args:
+        comparison (Comparison): The comparison the response belongs to
+        model_name (str): The name of the model in the server profiles
+        model_id (str): The id of the model on the server it is expected to run on
+        size (int): The amount of bytes the model takes up, or 0 if it isn't known
+    Attributes:
+        status (str): Whether the response is ``"queued"``, ``"generating"``, ``"done"``, ``"failed"`` or
+            ``"out of budget"``
+        error (Optional[str]): What went wrong if the response failed
+        response (Optional[ollama.ChatResponse]): The response once it is done
+        started_at (Optional[float]): The monotonic time the request was sent at
+        finished_at (Optional[float]): The monotonic time the response was done at
+        charge (Optional[admission.Charge]): What the request was charged on admission
+    """
+    def __init__(self, comparison: "Comparison", model_name: str, model_id: str, size: int = 0):
+        super().__init__(comparison.ctx, model_name, edit_interval=comparison.edit_interval,
+                         page_limit=comparison.page_limit)
+        self.comparison = comparison
+        self.model_id = model_id
+        self.size = size
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.response: Optional[ollama.ChatResponse] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.charge: Optional[admission.Charge] = None
+
+    @property
+    def view(self) -> ComparisonView:
+        return self.comparison.view
+
+    async def _render(self):
+        if self.status == "queued":
+            self.status = "generating"
+        self.comparison.schedule_render()
+
+    def show_queue_position(self, position: int):
+        self.queue_position = position
+        self.comparison.schedule_render()
+
+    def close(self):
+        pass
+
+    def summary(self) -> str:
+        if self.status == "queued":
+            return f"Queued (position {self.queue_position})" if self.queue_position else "Queued"
+        if self.status == "generating":
+            return f"Generating... {time.monotonic() - self.started_at:.1f}s"
+        if self.status in ("failed", "out of budget"):
+            return self.error or self.status.capitalize()
+        response = self.response
+        lines = [f"**Latency**: {self.finished_at - self.started_at:.2f}s"]
+        if self.first_token_at is not None:
+            lines.append(f"**First token**: {self.first_token_at - self.started_at:.2f}s")
+        if response.eval_count and response.eval_duration:
+            lines.append(f"**Tokens/sec**: {response.eval_count / (response.eval_duration / 10 ** 9):.1f}")
+            lines.append(f"**Tokens**: {response.eval_count}")
+        if response.done_reason in ("stopped", "deadline", "length"):
+            lines.append(f"-# {'Stopped' if response.done_reason == 'stopped' else 'Truncated'}")
+        return "\n".join(lines)
+
+    def text(self) -> str:
+        """The response as it should be shown, without any thinking"""
+        if self.response is None:
+            return self.error or ""
+        return pipeline.split_thinking(self.response.message.content or "")[1]
+
+
+class Comparison:
+    """Sends the same prompt to several models at once and shows their responses side by side in a single message,
+    one model per page, along with each model's latency and generation speed. The requests are sent smallest model
+    first, so the fastest responses show up first. The history of the channel is neither used nor changed.
+    Args:
+        llm_pipeline (pipeline.Pipeline): The pipeline whose servers, admission controller and generations the
+            requests share
+        ctx (Union[commands.Context, discord.ApplicationContext]): The context the command was invoked in
+        prompt (str): The prompt to send to every model
+        model_names (list[str]): The names of the models in the server profiles to compare
+        edit_interval (float): The minimum amount of seconds between edits of the message
+        page_limit (int): The most characters of a response shown on a page. It is lowered to the room the summaries
+            of the models leave in an embed
+    Attributes:
+        streams (list[ComparisonStream]): The response of each model, smallest model first
+        missing (list[str]): The names of the models that aren't installed on any server
+        message (Optional[discord.Message]): The message the comparison is rendered in, if one was sent yet
+        page (int): The index of the model currently shown
+    """
+    def __init__(self, llm_pipeline: pipeline.Pipeline, ctx: Union[commands.Context, discord.ApplicationContext],
+                 prompt: str, model_names: list[str], *, edit_interval: float = 1.5, page_limit: int = 3584):
+        self.pipeline = llm_pipeline
+        self.ctx = ctx
+        self.prompt = prompt
+        self.model_names = model_names
+        self.edit_interval = edit_interval
+        self.page_limit = page_limit
+        self.streams: list[ComparisonStream] = []
+        self.missing: list[str] = []
+        self.message: Optional[discord.Message] = None
+        self.page = 0
+        self.view = ComparisonView(self)
+        self._last_edit = 0.0
+        self._pending_edit: Optional[asyncio.Task] = None
+
+    def fields(self) -> list[discord.EmbedField]:
+        fields = [
+            discord.EmbedField(name=clip(stream.title, 256), value=clip(stream.summary()), inline=True)
+            for stream in self.streams
+        ]
+        if self.missing:
+            fields.append(discord.EmbedField(name="Not Available", value=clip(", ".join(self.missing))))
+        return fields
+
+    def _fit_page_limit(self, titles: list[str]):
+        """Lowers the page limit so a page of a response, the summaries of the models and the rest of the embed fit in
+        a single embed"""
+        reserved = len(utils.default_embed(self.ctx, "", ""))
+        # the title of the longest model name along with the page numbers and generating status
+        reserved += max(len(title) for title in titles) + 32
+        reserved += sum(len(clip(title, 256)) + SUMMARY_LIMIT for title in titles)
+        if self.missing:
+            reserved += len("Not Available") + SUMMARY_LIMIT
+        self.page_limit = min(self.page_limit, EMBED_LIMIT - reserved)
+
+    def embed(self) -> discord.Embed:
+        stream = self.streams[self.page]
+        if stream.status == "generating":
+            text = stream._visible_text()
+        elif stream.status == "queued":
+            text = "Waiting for the model to become available."
+        else:
+            text = paginator.paginate(stream.text() or "No response", self.page_limit)[0]
+        generating = any(stream.status in ("queued", "generating") for stream in self.streams)
+        return utils.default_embed(
+            self.ctx, f"{stream.title} ({self.page + 1}/{len(self.streams)})" + (" (Generating...)" * generating),
+            text or "** **", fields=self.fields()
+        )
+
+    async def _show(self):
+        try:
+            if self.message is None:
+                self.message = await self.ctx.respond(embed=self.embed(), view=self.view)
+                if isinstance(self.message, discord.Interaction):
+                    self.message = await self.message.original_response()
+            else:
+                await self.message.edit(embed=self.embed(), view=self.view)
+        except discord.HTTPException:
+            pass
+
+    def schedule_render(self):
+        if self._pending_edit and not self._pending_edit.done():
+            return
+        if time.monotonic() - self._last_edit < self.edit_interval:
+            return
+        self._last_edit = time.monotonic()
+        self._pending_edit = asyncio.create_task(self._show())
+
+    def stop(self):
+        for stream in self.streams:
+            stream.stop()
+
+    async def _resolve(self):
+        """Adds a stream for every model that is installed, smallest first"""
+        installed = []
+        for model_name in dict.fromkeys(self.model_names):
+            if not await self.pipeline.pool.has_model(model_name):
+                self.missing.append(model_name)
+                continue
+            server, model_id = self.pipeline.pool.route(model_name)
+            installed.append((model_name, model_id, server.inventory.sizes.get(model_id, 0)))
+        if not installed:
+            return
+        # the streams paginate their responses as they come in, so the limit has to be known before they are made
+        self._fit_page_limit([model_name for model_name, _, _ in installed])
+        self.streams = sorted(
+            (ComparisonStream(self, *model) for model in installed), key=lambda stream: stream.size
+        )
+
+    def _admit(self, stream: ComparisonStream, priority: bool, prompt_tokens: int):
+        if self.pipeline.admission is None or priority:
+            return
+        ctx = self.ctx
+        stream.charge, retry_after = self.pipeline.admission.admit(
+            ctx.author.id, ctx.guild.id if ctx.guild else None, stream.model_id, stream.size, prompt_tokens,
+            config.default_num_predict
+        )
+        if stream.charge is None:
+            stream.status = "out of budget"
+            stream.error = f"Out of budget, try again {utils.discord_ts(int(time.time() + retry_after), 'R')}"
+
+    async def _generate(self, stream: ComparisonStream, priority: bool, messages: list[dict]):
+        stream.started_at = time.monotonic()
+        try:
+            stream.response, _ = await self.pipeline.chat(
+                self.ctx, stream.title, stream.title, deadline=config.default_deadline or None, priority=priority,
+                stream=stream, messages=messages, options={'num_predict': config.default_num_predict}
+            )
+            stream.status = "done"
+        except ollama.ResponseError as error:
+            stream.status = "failed"
+            stream.error = f"Failed: {error.error}"
+        except (httpx.HTTPError, ConnectionError):
+            stream.status = "failed"
+            stream.error = "Failed: lost the connection to the ollama server"
+        except BaseException:
+            stream.status = "failed"
+            raise
+        finally:
+            stream.finished_at = time.monotonic()
+            if stream.charge is not None:
+                self.pipeline.admission.settle(stream.charge, stream.response)
+        self.schedule_render()
+
+    async def run(self):
+        ctx = self.ctx
+        await ctx.defer()
+        if not await self.pipeline.check_servers(ctx):
+            return
+        await self._resolve()
+        if not self.streams:
+            await ctx.respond(embed=utils.default_embed(
+                ctx, "Models Not Found", "None of the models to compare are available."
+            ))
+            return
+        messages = [{'role': 'system', 'content': pipeline.SYSTEM_PROMPT}, {'role': 'user', 'content': self.prompt}]
+        prompt_tokens = sum(context.estimate_tokens(message) for message in messages)
+        priority = self.pipeline.admission is not None and self.pipeline.admission.is_priority(
+            ctx.guild.id if ctx.guild else None, await ctx.bot.is_owner(ctx.author)
+        )
+        for stream in self.streams:
+            self._admit(stream, priority, prompt_tokens)
+        await self._show()
+        # the requests are started smallest model first, so the scheduler queues them in that order. One of them
+        # failing unexpectedly doesn't abandon the others, and the comparison is finished before the error is raised
+        results = await asyncio.gather(*(
+            self._generate(stream, priority, messages) for stream in self.streams if stream.status == "queued"
+        ), return_exceptions=True)
+        self.view.stop()
+        if self._pending_edit:
+            await asyncio.gather(self._pending_edit, return_exceptions=True)
+        await self.finish()
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    async def finish(self):
+        """Replaces the live comparison with a paginator of the full responses"""
+        fields = self.fields()
+        embed_pages = []
+        for stream in self.streams:
+            response_pages = paginator.paginate(stream.text() or "No response", self.page_limit)
+            embed_pages.extend(
+                utils.default_embed(
+                    self.ctx, stream.title + (f" {index + 1}/{len(response_pages)}" if len(response_pages) > 1 else ""),
+                    response_page, fields=fields
+                ) for index, response_page in enumerate(response_pages)
+            )
+        response_paginator = pages.Paginator(pages=embed_pages)
+        if isinstance(self.message, discord.Message):
+            await response_paginator.edit(self.message, user=self.ctx.author)
+        elif isinstance(self.ctx, discord.ApplicationContext):
+            await response_paginator.respond(self.ctx.interaction)
+        else:
+            await response_paginator.send(self.ctx)
@@ -0,0 +1,207 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+from llm import persistence
+
+
+def estimate_tokens(message: dict, image_tokens: int = 768) -> int:
+    """Roughly estimates the amount of tokens a chat message takes up in the prompt (about 4 characters per token)"""
+    return len(message.get('content') or "") // 4 + 4 + len(message.get('images') or []) * image_tokens
+
+
+def estimate_size(message: dict) -> int:
+    """Roughly estimates the amount of memory in bytes a chat message is holding on to"""
+    return len(message.get('content') or "") + sum(len(image) for image in message.get('images') or []) + 64
+
+
+def fingerprint(messages: list[dict]) -> str:
+    """Hashes a list of chat messages exactly, so two prompts can be checked for sharing a prefix that the ollama
+    server has already evaluated"""
+    digest = hashlib.sha256()
+    for message in messages:
+        digest.update(f"{message.get('role')}\0{message.get('content') or ''}\0".encode())
+        for image in message.get('images') or []:
+            digest.update(hashlib.sha256(image if isinstance(image, bytes) else str(image).encode()).digest())
+    return digest.hexdigest()
+
+
+class _Conversation:
+    def __init__(self):
+        self.messages: deque[dict] = deque()
+        self.tokens = 0
+        self.size = 0
+        self.first_seq = 0
+        self.last_used = time.monotonic()
+
+
+class ConversationStore:
+    """Holds the message history sent to the LLMs for each channel, keeping it bounded so prompt evaluation time and
+    memory usage don't keep growing the longer a channel chats.
+    Args:
+        token_budget (int): The estimated amount of tokens of history kept per channel, the oldest turns are trimmed
+            once this is exceeded
+        trim_ratio (float): The fraction of the token budget the history is trimmed down to once it is exceeded.
+            Trimming well below the budget at once keeps the start of the history the same for the following turns,
+            so the ollama server can reuse the prompt it already evaluated
+        memory_cap (int): The estimated amount of bytes all conversations can use before the least recently used
+            channels are evicted
+        ttl (float): The amount of seconds a channel can be idle before its conversation is forgotten
+        image_tokens (int): The estimated amount of tokens each image in a message takes up
+        log (Optional[persistence.ConversationLog]): Where conversations are persisted to. Channels evicted from
+            memory are loaded back from it by :meth:`load`, which :meth:`append` does before it adds to a channel, so
+            the event loop never waits on the database
+    """
+    def __init__(self, token_budget: int = 8192, memory_cap: int = 256 * 1024 ** 2, ttl: float = 86400.0,
+                 image_tokens: int = 768, log: Optional[persistence.ConversationLog] = None, trim_ratio: float = 0.75):
+        self.token_budget = token_budget
+        self.trim_ratio = trim_ratio
+        self.memory_cap = memory_cap
+        self.ttl = ttl
+        self.image_tokens = image_tokens
+        self.log = log
+        self.size = 0
+        self._conversations: OrderedDict[int, _Conversation] = OrderedDict()
+
+    def __contains__(self, channel_id: int) -> bool:
+        return channel_id in self._conversations or bool(self.history(channel_id))
+
+    def __len__(self) -> int:
+        return len(self._conversations)
+
+    def _expire(self):
+        expiry = time.monotonic() - self.ttl
+        while self._conversations:
+            channel_id, conversation = next(iter(self._conversations.items()))
+            if conversation.last_used > expiry:
+                break
+            self._evict(channel_id)
+
+    def _evict(self, channel_id: int):
+        conversation = self._conversations.pop(channel_id)
+        self.size -= conversation.size
+
+    def _restore(self, channel_id: int, first_seq: int, messages: list[dict]) -> Optional[_Conversation]:
+        if not messages:
+            return None
+        conversation = self._conversations[channel_id] = _Conversation()
+        conversation.first_seq = first_seq
+        for message in messages:
+            conversation.messages.append(message)
+            conversation.tokens += estimate_tokens(message, self.image_tokens)
+            conversation.size += estimate_size(message)
+        self.size += conversation.size
+        # the budget may have been lowered since the history was saved
+        self._trim(channel_id, conversation)
+        return conversation
+
+    def _touch(self, channel_id: int) -> Optional[_Conversation]:
+        self._expire()
+        conversation = self._conversations.get(channel_id)
+        if conversation is not None:
+            conversation.last_used = time.monotonic()
+            self._conversations.move_to_end(channel_id)
+        return conversation
+
+    def _pop_oldest(self, conversation: _Conversation):
+        removed = conversation.messages.popleft()
+        conversation.tokens -= estimate_tokens(removed, self.image_tokens)
+        removed_size = estimate_size(removed)
+        conversation.size -= removed_size
+        conversation.first_seq += 1
+        self.size -= removed_size
+
+    def _trim(self, channel_id: int, conversation: _Conversation):
+        first_seq = conversation.first_seq
+        if conversation.tokens > self.token_budget:
+            while len(conversation.messages) > 1 and conversation.tokens > self.token_budget * self.trim_ratio:
+                self._pop_oldest(conversation)
+        # the history should never start with an assistant turn after trimming
+        while len(conversation.messages) > 1 and conversation.messages[0].get('role') == 'assistant':
+            self._pop_oldest(conversation)
+        if self.log is not None and conversation.first_seq != first_seq:
+            self.log.trim(channel_id, conversation.first_seq)
+
+    async def load(self, channel_id: int):
+        """Reads a channel's history back from the log in a thread if it isn't in memory, so using the channel
+        afterwards doesn't block the event loop on the database"""
+        if self.log is None or channel_id in self._conversations:
+            return
+        first_seq, messages = await asyncio.to_thread(self.log.load, channel_id, self.ttl)
+        # the channel may have been loaded by another request while the log was read
+        if channel_id not in self._conversations:
+            self._restore(channel_id, first_seq, messages)
+
+    async def append(self, channel_id: int, message: dict):
+        """Adds a message to the end of a channel's history, trimming and evicting older history if needed. The
+        history is loaded first if the channel was evicted, since appending without it would overwrite it in the log."""
+        await self.load(channel_id)
+        conversation = self._touch(channel_id)
+        if conversation is None:
+            conversation = self._conversations[channel_id] = _Conversation()
+        if self.log is not None:
+            self.log.append(channel_id, conversation.first_seq + len(conversation.messages), message)
+        conversation.messages.append(message)
+        conversation.tokens += estimate_tokens(message, self.image_tokens)
+        message_size = estimate_size(message)
+        conversation.size += message_size
+        self.size += message_size
+        self._trim(channel_id, conversation)
+        while self.size > self.memory_cap and next(iter(self._conversations)) != channel_id:
+            self._evict(next(iter(self._conversations)))
+
+    def history(self, channel_id: int) -> list[dict]:
+        """Returns the messages to send to the LLM for a channel, which are only those in memory, see :meth:`load`"""
+        conversation = self._touch(channel_id)
+        return list(conversation.messages) if conversation else []
+
+    def tokens(self, channel_id: int) -> int:
+        """The estimated amount of tokens a channel's history takes up"""
+        conversation = self._conversations.get(channel_id)
+        return conversation.tokens if conversation else 0
+
+    def snapshot(self, channel_id: int) -> tuple[int, list[dict]]:
+        """Returns the sequence number of the first message in a channel's history along with the history, to be
+        passed back to :meth:`replace_oldest`"""
+        conversation = self._touch(channel_id)
+        return (conversation.first_seq, list(conversation.messages)) if conversation else (0, [])
+
+    def replace_oldest(self, channel_id: int, first_seq: int, count: int, message: dict) -> bool:
+        """Replaces the oldest messages of a channel's history with a single message, e.g. a summary of them
+        Args:
+            channel_id (int): The id of the channel
+            first_seq (int): The sequence number of the first message in the history when it was read with
+                :meth:`snapshot`
+            count (int): The amount of messages to replace
+            message (dict): The message to replace them with
+        Returns:
+            bool: Whether the messages were replaced, which they aren't if the history was trimmed or cleared since
+            it was read
+        """
+        conversation = self._conversations.get(channel_id)
+        if conversation is None or conversation.first_seq != first_seq or len(conversation.messages) <= count:
+            return False
+        for _ in range(count):
+            self._pop_oldest(conversation)
+        # the message takes the place of the last message it replaces, so the sequence numbers stay contiguous
+        conversation.first_seq -= 1
+        conversation.messages.appendleft(message)
+        conversation.tokens += estimate_tokens(message, self.image_tokens)
+        message_size = estimate_size(message)
+        conversation.size += message_size
+        self.size += message_size
+        if self.log is not None:
+            self.log.append(channel_id, conversation.first_seq, message)
+            self.log.trim(channel_id, conversation.first_seq)
+        return True
+
+    def clear(self, channel_id: int = None):
+        """Forgets the history of a channel, or of every channel if no channel is specified"""
+        if self.log is not None:
+            self.log.clear(channel_id)
+        if channel_id is None:
+            self._conversations.clear()
+            self.size = 0
+        elif channel_id in self._conversations:
+            self._evict(channel_id)
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional
+import httpx
+import numpy
+import ollama
+from llm import pool
+
+error_logging = logging.getLogger('errors')
+
+
+def normalize(embeddings: list[list[float]]) -> numpy.ndarray:
+    """Scales embeddings to unit length, so their dot products are their cosine similarities"""
+    vectors = numpy.array(embeddings, dtype=numpy.float32)
+    vectors /= numpy.maximum(numpy.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    return vectors
+
+
+class EmbeddingWorker:
+    """Embeds texts in the background in micro-batches, so embedding every message of a busy guild takes one embed
+    request per batch instead of one per message. A batch is sent once it is full or the oldest text in it has waited
+    for ``window`` seconds, and is held back while the server it would run on has chat requests running or queued, for
+    up to ``max_defer`` seconds, so interactive chat keeps priority over batch work.
+    Args:
+        server_pool (pool.ServerPool): The ollama servers to run the embedding models on
+        sink (Callable[[str, numpy.ndarray, list[Any]], Awaitable]): Called with the id of the model, the unit length
+            vectors and the payloads of the texts of every embedded batch
+        max_batch (int): The maximum amount of texts in a batch
+        max_batch_chars (int): The maximum amount of characters in a batch
+        window (float): The maximum amount of seconds a text waits for its batch to fill up
+        max_pending (int): The maximum amount of texts waiting to be embedded per model
+        max_defer (float): The maximum amount of seconds a batch is held back for chat requests
+        retry_interval (float): The amount of seconds to wait before retrying a batch the server couldn't be reached
+            for
+    Attributes:
+        dropped (int): The amount of texts that were dropped because too many were waiting or they couldn't be embedded
+    """
+    def __init__(self, server_pool: pool.ServerPool, sink: Callable[[str, numpy.ndarray, list[Any]], Awaitable],
+                 max_batch: int = 64, max_batch_chars: int = 32768, window: float = 0.5, max_pending: int = 4096,
+                 max_defer: float = 30.0, retry_interval: float = 5.0):
+        self.pool = server_pool
+        self.sink = sink
+        self.max_batch = max_batch
+        self.max_batch_chars = max_batch_chars
+        self.window = window
+        self.max_pending = max_pending
+        self.max_defer = max_defer
+        self.retry_interval = retry_interval
+        self.dropped = 0
+        self._queues: dict[str, deque[tuple[str, Any, float]]] = {}
+        self._events: dict[str, asyncio.Event] = {}
+        self._runners: dict[str, asyncio.Task] = {}
+
+    def pending(self, model_name: str = None) -> int:
+        return sum(len(queue) for name, queue in self._queues.items() if model_name is None or name == model_name)
+
+    def _queue(self, model_name: str) -> deque[tuple[str, Any, float]]:
+        if model_name not in self._runners or self._runners[model_name].done():
+            self._queues.setdefault(model_name, deque())
+            self._events.setdefault(model_name, asyncio.Event())
+            self._runners[model_name] = asyncio.create_task(self._run(model_name))
+        return self._queues[model_name]
+
+    def submit(self, model_name: str, text: str, payload: Any) -> bool:
+        """Queues a text to be embedded without waiting, dropping it if too many texts are already waiting
+        Returns:
+            bool: Whether the text was queued
+        """
+        queue = self._queue(model_name)
+        if len(queue) >= self.max_pending:
+            self.dropped += 1
+            return False
+        queue.append((text, payload, time.monotonic()))
+        self._events[model_name].set()
+        return True
+
+    def _batch_full(self, queue: deque[tuple[str, Any, float]]) -> bool:
+        return len(queue) >= self.max_batch or sum(len(text) for text, _, _ in queue) >= self.max_batch_chars
+
+    def _take(self, queue: deque[tuple[str, Any, float]]) -> list[tuple[str, Any, float]]:
+        batch = [queue.popleft()]
+        characters = len(batch[0][0])
+        while queue and len(batch) < self.max_batch and characters + len(queue[0][0]) <= self.max_batch_chars:
+            characters += len(queue[0][0])
+            batch.append(queue.popleft())
+        return batch
+
+    async def _yield_to_chat(self, model_name: str) -> tuple[Optional[pool.OllamaServer], str]:
+        """Waits until the server the batch would run on has no chat requests, or for at most ``max_defer``"""
+        deferred_at = time.monotonic()
+        delay = 0.1
+        while True:
+            server, model_id = self.pool.route(model_name)
+            if server is None or not server.pending or time.monotonic() - deferred_at >= self.max_defer:
+                return server, model_id
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 2.0)
+
+    async def _run(self, model_name: str):
+        queue = self._queues[model_name]
+        event = self._events[model_name]
+        while True:
+            while not queue:
+                event.clear()
+                await event.wait()
+            deadline = queue[0][2] + self.window
+            while not self._batch_full(queue) and (remaining := deadline - time.monotonic()) > 0:
+                event.clear()
+                try:
+                    await asyncio.wait_for(event.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            server, model_id = await self._yield_to_chat(model_name)
+            batch = self._take(queue)
+            if server is None:
+                self.dropped += len(batch)
+                continue
+            try:
+                response = await server.client.embed(model=model_id, input=[text for text, _, _ in batch])
+            except (httpx.ConnectError, httpx.TimeoutException, ConnectionError):
+                server.inventory.invalidate()
+                # put the batch back in front to retry it once the server can be reached again
+                queue.extendleft(reversed(batch))
+                await asyncio.sleep(self.retry_interval)
+                continue
+            except (httpx.HTTPError, ollama.ResponseError):
+                server.inventory.invalidate()
+                self.dropped += len(batch)
+                continue
+            try:
+                await self.sink(model_id, normalize(response.embeddings), [payload for _, payload, _ in batch])
+            except Exception as error:
+                # e.g. an index whose vectors don't match the size of the embeddings after a model change. The batch
+                # is dropped, but the runner keeps going so the rest of the model's texts are still embedded
+                self.dropped += len(batch)
+                error_logging.error(
+                    f'Embedding Batch Dropped ({type(error).__name__}: {error}). Details: Model: {model_id}, '
+                    f'Texts: {len(batch)}'
+                )
+
+    def stop(self):
+        for runner in self._runners.values():
+            runner.cancel()
+        self._runners.clear()
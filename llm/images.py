@@ -0,0 +1,63 @@
+import asyncio
+import hashlib
+import io
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+from PIL import Image, ImageOps
+
+
+def preprocess(data: bytes, max_size: int, quality: int = 85) -> bytes:
+    """Downscales an image so neither side is larger than ``max_size`` and re-encodes it as a JPEG without its
+    metadata. Data that can't be decoded as an image is returned unchanged and left to the ollama server to reject."""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image.convert("RGBA"), mask=image.convert("RGBA").getchannel("A"))
+                image = background
+            elif image.mode != "RGB":
+                image = image.convert("RGB")
+            image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+            output = io.BytesIO()
+            image.save(output, "JPEG", quality=quality, optimize=True)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return data
+    return output.getvalue()
+
+
+class ImagePreprocessor:
+    """Shrinks images attached to prompts before they are sent to vision models and stored in the conversation
+    history. The decoding and encoding is done in a pool of worker processes so large images don't block the event
+    loop, and results are cached by the hash of the image.
+    Args:
+        workers (int): The amount of worker processes
+        cache_size (int): The amount of preprocessed images to keep
+    """
+    def __init__(self, workers: int = 2, cache_size: int = 64):
+        self.workers = workers
+        self.cache_size = cache_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._cache: OrderedDict[tuple[str, int], bytes] = OrderedDict()
+
+    async def process(self, data: bytes, max_size: int) -> bytes:
+        """Preprocesses an image for a model whose native input resolution is ``max_size`` pixels"""
+        key = hashlib.sha256(data).hexdigest(), max_size
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        if self._executor is None:
+            # spawn the workers so they don't inherit the bot's threads and connections
+            self._executor = ProcessPoolExecutor(self.workers, multiprocessing.get_context("spawn"))
+        processed = await asyncio.get_running_loop().run_in_executor(self._executor, preprocess, data, max_size)
+        self._cache[key] = processed
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return processed
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
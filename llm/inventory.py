@@ -0,0 +1,86 @@
+import asyncio
+import time
+from typing import Callable, Optional
+import httpx
+import ollama
+
+
+class ModelInventory:
+    """A cached view of an ollama server's health, installed models and the models currently loaded in memory, so
+    commands don't have to query the server before every request. It is refreshed in the background and whenever a
+    request runs into an error.
+    Args:
+        client (ollama.AsyncClient): The client of the ollama server to probe
+        retry_interval (float): The minimum amount of seconds between probes made on demand, e.g. while the server is
+            unreachable or when a model can't be found
+    Attributes:
+        available (set[str]): The names of the models installed on the server
+        sizes (dict[str, int]): The amount of bytes each installed model takes up on disk
+        resident (dict[str, ollama.ProcessResponse.Model]): The models loaded on the server, keyed by name
+        error (Optional[Exception]): The error the last probe ran into, if it failed
+        updated_at (Optional[float]): The monotonic time of the last probe, or ``None`` if it needs to be probed again
+        listeners (list[Callable[[ModelInventory], None]]): Called after every probe
+    """
+    def __init__(self, client: ollama.AsyncClient, retry_interval: float = 5.0):
+        self.client = client
+        self.retry_interval = retry_interval
+        self.available: set[str] = set()
+        self.sizes: dict[str, int] = {}
+        self.resident: dict[str, ollama.ProcessResponse.Model] = {}
+        self.error: Optional[Exception] = None
+        self.updated_at: Optional[float] = None
+        self.listeners: list[Callable[[ModelInventory], None]] = []
+        self._refreshing: Optional[asyncio.Task] = None
+
+    @property
+    def healthy(self) -> bool:
+        return self.updated_at is not None and self.error is None
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.updated_at if self.updated_at is not None else float("inf")
+
+    async def _refresh(self):
+        try:
+            process_response, list_response = await asyncio.gather(self.client.ps(), self.client.list())
+        except (httpx.HTTPError, ConnectionError, ollama.ResponseError) as error:
+            self.error = error
+        else:
+            self.error = None
+            self.available = {model.model for model in list_response.models}
+            self.sizes = {model.model: model.size or 0 for model in list_response.models}
+            self.resident = {model.model: model for model in process_response.models}
+        self.updated_at = time.monotonic()
+        for listener in self.listeners:
+            listener(self)
+
+    async def refresh(self):
+        """Probes the server, sharing the probe with any other caller that is already waiting on one"""
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.create_task(self._refresh())
+        await asyncio.shield(self._refreshing)
+
+    def invalidate(self):
+        """Marks the cached state as stale and probes the server again in the background"""
+        self.updated_at = None
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.create_task(self._refresh())
+
+    async def check(self):
+        """Raises the error the server ran into if it was unreachable, probing it first if the cached state is stale
+        or the last failed probe is old enough to retry"""
+        if self.updated_at is None or (self.error is not None and self.age > self.retry_interval):
+            await self.refresh()
+        if self.error is not None:
+            raise self.error.with_traceback(None)
+
+    async def has_model(self, model_id: str) -> bool:
+        """Whether a model is installed on the server. A miss is double-checked with a fresh probe in case the model
+        was installed since the last one."""
+        if model_id not in self.available and self.age > self.retry_interval:
+            await self.refresh()
+        return model_id in self.available
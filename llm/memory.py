@@ -0,0 +1,275 @@
+import asyncio
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+import httpx
+import numpy
+import ollama
+from llm import embedder, pool
+
+MEMORY_PREFIX = "Relevant messages from earlier in this channel:\n\n"
+
+
+def turn_text(prompt: str, response: str, limit: int = 1000) -> str:
+    """The text a turn of a conversation is remembered as"""
+    return f"User: {prompt[:limit // 2]}\nAssistant: {response[:limit - min(len(prompt), limit // 2)]}"
+
+
+def history_turns(history: list[dict], limit: int = 1000) -> set[str]:
+    """The texts of the turns in a channel's history, which don't have to be recalled since they are still in it"""
+    return {
+        turn_text(message.get('content') or "", history[index + 1].get('content') or "", limit)
+        for index, message in enumerate(history[:-1])
+        if message.get('role') == 'user' and history[index + 1].get('role') == 'assistant'
+    }
+
+
+class VectorIndex:
+    """An append-only index of unit length vectors stored as a float16 matrix in a file that is memory-mapped when
+    searched, so it takes up little memory no matter how much it holds. What each vector was embedded from is stored
+    alongside it in a JSON lines file. The methods block, so they are meant to be run off the event loop.
+    Args:
+        path (str): The path of the index without an extension
+        model (str): The id of the model the vectors are embedded with. The index is started over if it was built
+            with a different model or dimensions
+    """
+    def __init__(self, path: str, model: str):
+        self.path = path
+        self.model = model
+        self.dimensions: Optional[int] = None
+        self._lock = threading.Lock()
+        self._entries: list[dict] = []
+        self._channels = numpy.zeros(0, dtype=numpy.int64)
+        self._matrix: Optional[numpy.memmap] = None
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _load(self):
+        if not os.path.isfile(self.path + ".json"):
+            return
+        with open(self.path + ".json") as header_file:
+            header = json.load(header_file)
+        if header.get('model') != self.model:
+            self._reset()
+            return
+        self.dimensions = header['dimensions']
+        entries = []
+        if os.path.isfile(self.path + ".jsonl"):
+            with open(self.path + ".jsonl") as entries_file:
+                for line in entries_file:
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        break
+        rows = 0
+        if os.path.isfile(self.path + ".f16"):
+            rows = os.path.getsize(self.path + ".f16") // (self.dimensions * 2)
+        # an interrupted write can leave one file longer than the other, so both are cut to the rows they share
+        rows = min(rows, len(entries))
+        self._entries = entries[:rows]
+        if rows < len(entries):
+            self._rewrite_entries()
+        with open(self.path + ".f16", "ab") as matrix_file:
+            matrix_file.truncate(rows * self.dimensions * 2)
+        self._channels = numpy.array([entry['channel'] for entry in self._entries], dtype=numpy.int64)
+
+    def _rewrite_entries(self):
+        with open(self.path + ".jsonl", "w") as entries_file:
+            entries_file.writelines(json.dumps(entry) + "\n" for entry in self._entries)
+
+    def _reset(self):
+        for extension in (".json", ".jsonl", ".f16"):
+            if os.path.isfile(self.path + extension):
+                os.remove(self.path + extension)
+        self.dimensions = None
+        self._entries = []
+        self._channels = numpy.zeros(0, dtype=numpy.int64)
+        self._matrix = None
+
+    def add(self, vectors: numpy.ndarray, entries: list[dict]):
+        """Appends vectors along with what they were embedded from, each entry holding at least its ``channel``"""
+        with self._lock:
+            if self.dimensions is not None and vectors.shape[1] != self.dimensions:
+                self._reset()
+            if self.dimensions is None:
+                self.dimensions = vectors.shape[1]
+                with open(self.path + ".json", "w") as header_file:
+                    json.dump({'model': self.model, 'dimensions': self.dimensions}, header_file)
+            with open(self.path + ".f16", "ab") as matrix_file:
+                matrix_file.write(vectors.astype(numpy.float16).tobytes())
+            with open(self.path + ".jsonl", "a") as entries_file:
+                entries_file.writelines(json.dumps(entry) + "\n" for entry in entries)
+            self._entries.extend(entries)
+            self._channels = numpy.concatenate([
+                self._channels, numpy.array([entry['channel'] for entry in entries], dtype=numpy.int64)
+            ])
+            self._matrix = None
+
+    def search(self, query: numpy.ndarray, k: int, channel_id: int, min_score: float = 0.0,
+               chunk_size: int = 65536) -> list[tuple[float, dict]]:
+        """Finds the entries of a channel whose vectors are most similar to a unit length query vector
+        Returns:
+            list[tuple[float, dict]]: Up to ``k`` entries along with their cosine similarity, most similar first
+        """
+        with self._lock:
+            if not self._entries or query.shape[0] != self.dimensions:
+                return []
+            if self._matrix is None:
+                self._matrix = numpy.memmap(
+                    self.path + ".f16", dtype=numpy.float16, mode="r", shape=(len(self._entries), self.dimensions)
+                )
+            matrix, channels, entries = self._matrix, self._channels, self._entries
+        rows = numpy.flatnonzero(channels == channel_id)
+        if not len(rows):
+            return []
+        query = query.astype(numpy.float32)
+        scores = numpy.empty(len(rows), dtype=numpy.float32)
+        # scored in chunks so only part of the matrix is paged in and converted at a time
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            scores[start:start + len(chunk)] = matrix[chunk].astype(numpy.float32) @ query
+        best = numpy.argsort(-scores)[:k]
+        return [(float(scores[index]), entries[rows[index]]) for index in best if scores[index] >= min_score]
+
+    def forget(self, channel_id: int = None):
+        """Removes the entries of a channel, or every entry if no channel is specified"""
+        with self._lock:
+            if channel_id is None or not self._entries:
+                self._reset()
+                return
+            keep = numpy.flatnonzero(self._channels != channel_id)
+            if len(keep) == len(self._entries):
+                return
+            matrix = numpy.fromfile(self.path + ".f16", dtype=numpy.float16).reshape(-1, self.dimensions)[keep]
+            self._matrix = None
+            matrix.tofile(self.path + ".f16.tmp")
+            os.replace(self.path + ".f16.tmp", self.path + ".f16")
+            self._entries = [self._entries[index] for index in keep]
+            self._channels = self._channels[keep]
+            self._rewrite_entries()
+
+
+class ChannelMemory:
+    """Lets the LLMs recall turns of a channel's conversation that have long left its history. Every turn, and
+    optionally every message sent in the channel, is embedded with an embedding model and stored in an index per
+    guild, and those most relevant to a new prompt are pulled back into the prompt, so long term recall costs a vector
+    lookup instead of a huge prompt.
+    Args:
+        server_pool (pool.ServerPool): The ollama servers to run the embedding model on
+        model_name (str): The name of the embedding model in the server profiles
+        directory (str): The directory the indexes are stored in
+        top_k (int): The maximum amount of turns recalled for a prompt
+        min_score (float): The minimum cosine similarity a turn needs to the prompt to be recalled
+        turn_limit (int): The maximum amount of characters of a turn that are remembered
+        open_indexes (int): The amount of indexes kept open
+        worker_options: See :class:`llm.embedder.EmbeddingWorker`, which embeds the turns and messages to remember
+            in batches
+    """
+    def __init__(self, server_pool: pool.ServerPool, model_name: str, directory: str, top_k: int = 4,
+                 min_score: float = 0.5, turn_limit: int = 1000, open_indexes: int = 32, **worker_options):
+        self.pool = server_pool
+        self.model_name = model_name
+        self.directory = directory
+        self.top_k = top_k
+        self.min_score = min_score
+        self.turn_limit = turn_limit
+        self.open_indexes = open_indexes
+        self._indexes: OrderedDict[str, VectorIndex] = OrderedDict()
+        self._indexes_lock = threading.Lock()
+        self.worker = embedder.EmbeddingWorker(server_pool, self._store, **worker_options)
+
+    @staticmethod
+    def key(guild_id: Optional[int], channel_id: int) -> str:
+        return str(guild_id) if guild_id is not None else f"dm-{channel_id}"
+
+    def _index(self, key: str, model_id: str) -> VectorIndex:
+        with self._indexes_lock:
+            index = self._indexes.get(key)
+            if index is None or index.model != model_id:
+                index = self._indexes[key] = VectorIndex(os.path.join(self.directory, key), model_id)
+            self._indexes.move_to_end(key)
+            while len(self._indexes) > self.open_indexes:
+                self._indexes.popitem(last=False)
+            return index
+
+    async def _run(self, key: str, model_id: str, operation: Callable[[VectorIndex], Any]) -> Any:
+        """Runs an operation on an index in a thread, which is also where the index is opened since that reads its
+        files"""
+        return await asyncio.to_thread(lambda: operation(self._index(key, model_id)))
+
+    async def embed(self, texts: list[str]) -> tuple[Optional[str], Optional[numpy.ndarray]]:
+        """Embeds texts with the embedding model
+        Returns:
+            tuple[Optional[str], Optional[numpy.ndarray]]: The id of the model and the unit length vectors, or
+            ``None`` if no server could embed them
+        """
+        server, model_id = self.pool.route(self.model_name)
+        if server is None:
+            return None, None
+        try:
+            response = await server.client.embed(model=model_id, input=texts)
+        except (httpx.HTTPError, ConnectionError, ollama.ResponseError):
+            server.inventory.invalidate()
+            return None, None
+        return model_id, embedder.normalize(response.embeddings)
+
+    async def _store(self, model_id: str, vectors: numpy.ndarray, payloads: list[tuple[str, dict]]):
+        """Adds a batch of embedded texts to the indexes of their guilds"""
+        for key in dict.fromkeys(key for key, _ in payloads):
+            rows = [row for row, (entry_key, _) in enumerate(payloads) if entry_key == key]
+            entries = [payloads[row][1] for row in rows]
+            await self._run(key, model_id, lambda index: index.add(vectors[rows], entries))
+
+    def _remember(self, guild_id: Optional[int], channel_id: int, text: str):
+        self.worker.submit(
+            self.model_name, text, (self.key(guild_id, channel_id), {'channel': channel_id, 'text': text})
+        )
+
+    def schedule(self, guild_id: Optional[int], channel_id: int, prompt: str, response: str):
+        """Remembers a turn of a channel's conversation in the background"""
+        self._remember(guild_id, channel_id, turn_text(prompt, response, self.turn_limit))
+
+    def remember_message(self, guild_id: Optional[int], channel_id: int, author: str, content: str):
+        """Remembers a message sent in a channel in the background"""
+        self._remember(guild_id, channel_id, f"{author}: {content[:self.turn_limit]}")
+
+    async def recall(self, guild_id: Optional[int], channel_id: int, prompt: str,
+                     history: list[dict] = ()) -> list[str]:
+        """Finds the remembered turns of a channel most relevant to a prompt, leaving out those still in its history"""
+        if not os.path.isfile(os.path.join(self.directory, self.key(guild_id, channel_id) + ".json")):
+            return []
+        model_id, vectors = await self.embed([prompt])
+        if vectors is None:
+            return []
+        in_history = history_turns(list(history), self.turn_limit)
+        results = await self._run(
+            self.key(guild_id, channel_id), model_id,
+            lambda index: index.search(vectors[0], self.top_k + len(in_history), channel_id, self.min_score)
+        )
+        return [entry['text'] for _, entry in results if entry['text'] not in in_history][:self.top_k]
+
+    async def forget(self, guild_id: Optional[int] = None, channel_id: int = None):
+        """Forgets the turns of a channel, or of every channel if no channel is specified"""
+        if channel_id is None:
+            with self._indexes_lock:
+                self._indexes.clear()
+            if os.path.isdir(self.directory):
+                for file_name in os.listdir(self.directory):
+                    if file_name.endswith((".json", ".jsonl", ".f16")):
+                        os.remove(os.path.join(self.directory, file_name))
+            return
+        key = self.key(guild_id, channel_id)
+        if not os.path.isfile(os.path.join(self.directory, key + ".json")):
+            return
+        with open(os.path.join(self.directory, key + ".json")) as header_file:
+            model_id = json.load(header_file)['model']
+        await self._run(key, model_id, lambda index: index.forget(channel_id))
+
+    def cancel(self):
+        self.worker.stop()
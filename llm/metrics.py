@@ -0,0 +1,158 @@
+import json
+import math
+import os
+from typing import Optional
+import ollama
+
+
+class Histogram:
+    """A histogram with logarithmically spaced buckets, so percentiles of values spanning milliseconds to hours can
+    be estimated in constant memory. Estimates are accurate to within the bucket growth factor.
+    Args:
+        minimum (float): The upper bound of the first bucket
+        growth (float): The ratio between the upper bounds of consecutive buckets
+        size (int): The amount of buckets, the last one holding everything above the others
+    """
+    def __init__(self, minimum: float = 0.001, growth: float = 1.25, size: int = 96):
+        self.minimum = minimum
+        self.growth = growth
+        self.counts = [0] * size
+        self.count = 0
+        self.total = 0.0
+
+    def _bucket(self, value: float) -> int:
+        if value <= self.minimum:
+            return 0
+        return min(len(self.counts) - 1, math.ceil(math.log(value / self.minimum, self.growth)))
+
+    def record(self, value: float):
+        self.counts[self._bucket(value)] += 1
+        self.count += 1
+        self.total += value
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """Estimates a percentile as the upper bound of the bucket it falls in"""
+        if not self.count:
+            return None
+        rank = percent / 100 * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.minimum * self.growth ** bucket
+        return self.minimum * self.growth ** (len(self.counts) - 1)
+
+    def to_dict(self) -> dict:
+        return {'counts': self.counts, 'count': self.count, 'total': self.total}
+
+    def load(self, data: dict):
+        if len(data['counts']) == len(self.counts):
+            self.counts, self.count, self.total = list(data['counts']), data['count'], data['total']
+
+
+class Series:
+    """The metrics recorded for a single model, server, command or guild
+    Attributes:
+        requests (int): The amount of generations
+        cold_loads (int): The amount of generations that had to load the model first
+        prompt_tokens (int): The amount of prompt tokens evaluated
+        generated_tokens (int): The amount of tokens generated
+        histograms (dict[str, Histogram]): The distributions of the time to first token, generation speed, prompt
+            evaluation speed, queue wait and load time
+    """
+    HISTOGRAMS = ("ttft", "tokens_per_second", "prompt_tokens_per_second", "queue_wait", "load_time")
+
+    def __init__(self):
+        self.requests = 0
+        self.cold_loads = 0
+        self.prompt_tokens = 0
+        self.generated_tokens = 0
+        self.histograms = {name: Histogram() for name in self.HISTOGRAMS}
+
+    def to_dict(self) -> dict:
+        return {
+            'requests': self.requests, 'cold_loads': self.cold_loads, 'prompt_tokens': self.prompt_tokens,
+            'generated_tokens': self.generated_tokens,
+            'histograms': {name: histogram.to_dict() for name, histogram in self.histograms.items()}
+        }
+
+    def load(self, data: dict):
+        self.requests, self.cold_loads = data['requests'], data['cold_loads']
+        self.prompt_tokens, self.generated_tokens = data['prompt_tokens'], data['generated_tokens']
+        for name, histogram in data['histograms'].items():
+            if name in self.histograms:
+                self.histograms[name].load(histogram)
+
+
+class Metrics:
+    """Records the token counts and timings of every generation per model, server, command and guild, so it can be
+    told whether a slowdown comes from the model, the server or the bot
+    Args:
+        path (Optional[str]): The JSON file the metrics are saved to by :meth:`save` and loaded from on creation
+        cold_load_threshold (float): The amount of seconds loading a model has to take to count as a cold load
+    """
+    DIMENSIONS = ("model", "server", "command", "guild")
+
+    def __init__(self, path: Optional[str] = None, cold_load_threshold: float = 1.0):
+        self.path = path
+        self.cold_load_threshold = cold_load_threshold
+        self.series: dict[str, dict[str, Series]] = {dimension: {} for dimension in self.DIMENSIONS}
+        if path and os.path.isfile(path):
+            with open(path) as metrics_file:
+                for dimension, labels in json.load(metrics_file).items():
+                    for label, data in labels.items():
+                        if dimension in self.series:
+                            self.series[dimension].setdefault(label, Series()).load(data)
+
+    def record(self, labels: dict[str, str], response: ollama.ChatResponse, queue_wait: float,
+               ttft: Optional[float] = None):
+        """Records a finished generation
+        Args:
+            labels (dict[str, str]): The model, server, command and guild the generation belongs to
+            response (ollama.ChatResponse): The final chunk of the response
+            queue_wait (float): The amount of seconds the request waited in the scheduler queue
+            ttft (Optional[float]): The amount of seconds until the first token arrived, including the queue wait.
+                Estimated from the durations the server reports if not given
+        """
+        load_time = (response.load_duration or 0) / 10 ** 9
+        if ttft is None:
+            ttft = queue_wait + load_time + (response.prompt_eval_duration or 0) / 10 ** 9
+        for dimension, label in labels.items():
+            series = self.series[dimension].setdefault(label, Series())
+            series.requests += 1
+            series.cold_loads += load_time >= self.cold_load_threshold
+            series.prompt_tokens += response.prompt_eval_count or 0
+            series.generated_tokens += response.eval_count or 0
+            series.histograms['ttft'].record(ttft)
+            series.histograms['queue_wait'].record(queue_wait)
+            series.histograms['load_time'].record(load_time)
+            if response.eval_count and response.eval_duration:
+                series.histograms['tokens_per_second'].record(response.eval_count / (response.eval_duration / 10 ** 9))
+            if response.prompt_eval_count and response.prompt_eval_duration:
+                series.histograms['prompt_tokens_per_second'].record(
+                    response.prompt_eval_count / (response.prompt_eval_duration / 10 ** 9)
+                )
+
+    def snapshot(self) -> dict:
+        return {
+            dimension: {label: series.to_dict() for label, series in labels.items()}
+            for dimension, labels in self.series.items()
+        }
+
+    def save(self, snapshot: dict = None):
+        """Writes a snapshot of the metrics to disk, replacing the previous one. Meant to be run off the event loop
+        with a snapshot taken on it."""
+        if not self.path:
+            return
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + ".tmp", "w") as metrics_file:
+            json.dump(snapshot or self.snapshot(), metrics_file)
+        os.replace(self.path + ".tmp", self.path)
+
+    def clear(self):
+        self.series = {dimension: {} for dimension in self.DIMENSIONS}
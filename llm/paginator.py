@@ -0,0 +1,206 @@
+from typing import Optional
+
+FENCE = "```"
+# the longest code block language kept when a code block is reopened on the next page
+MAX_LANGUAGE = 32
+# markdown that applies to a single line and has to be repeated when a line is split across pages
+LINE_PREFIXES = ("-# ", "> ")
+
+
+class MarkdownPaginator:
+    """Splits markdown into pages of at most ``limit`` characters in a single pass, so it can be fed a response as it
+    is streamed. Pages are split at paragraph breaks or code block boundaries where possible and at line breaks
+    otherwise, only cutting a line if it doesn't fit on a page by itself. A code block split across pages is closed
+    at the end of the page and reopened with its language on the next one.
+    Args:
+        limit (int): The maximum amount of characters in a page
+    Attributes:
+        pages (list[str]): The pages that are complete so far
+    """
+    def __init__(self, limit: int = 4096):
+        self.limit = limit
+        self.pages: list[str] = []
+        # the lines of the page in progress along with the language of the code block open after each line
+        self._lines: list[tuple[str, Optional[str]]] = []
+        self._length = 0
+        self._start_fence: Optional[str] = None
+        self._fence: Optional[str] = None
+        self._boundary = 0
+        self._boundary_length = 0
+        self._partial: list[str] = []
+        self._partial_length = 0
+        # the fence before the line in progress and whether it is a fence line, once it was cut before it ended
+        self._line_start: Optional[tuple[Optional[str], bool]] = None
+
+    def _language(self, line: str) -> str:
+        """The language of the code block a fence line opens, which is only its first word. Long words are dropped, so
+        reopening the code block on every page takes up little of it."""
+        words = line.lstrip()[len(FENCE):].split(maxsplit=1)
+        return words[0] if words and len(words[0]) <= min(MAX_LANGUAGE, self.limit // 8) else ""
+
+    @staticmethod
+    def _opening(fence: Optional[str]) -> str:
+        return f"{FENCE}{fence}\n" if fence is not None else ""
+
+    @staticmethod
+    def _closing(fence: Optional[str]) -> str:
+        return f"\n{FENCE}" if fence is not None else ""
+
+    def _page_text(self, line_count: int, fence: Optional[str]) -> str:
+        return (
+            self._opening(self._start_fence) + "\n".join(line for line, _ in self._lines[:line_count]) +
+            self._closing(fence)
+        )
+
+    def _split(self, line_count: int):
+        """Completes a page with the first ``line_count`` lines of the page in progress"""
+        fence = self._lines[line_count - 1][1] if line_count else self._start_fence
+        page = self._page_text(line_count, fence)
+        if page.strip():
+            self.pages.append(page)
+        self._lines = self._lines[line_count:]
+        self._start_fence = fence
+        self._length = sum(len(line) + 1 for line, _ in self._lines)
+        self._boundary = 0
+        self._boundary_length = 0
+
+    def _size(self, extra: int, fence: Optional[str]) -> int:
+        return len(self._opening(self._start_fence)) + self._length + extra + len(self._closing(fence))
+
+    def _fence_after(self, line: str) -> Optional[str]:
+        """The language of the code block open after a line, or ``None`` if none is"""
+        if not line.lstrip().startswith(FENCE):
+            return self._fence
+        return self._language(line) if self._fence is None else None
+
+    def _undecided(self) -> bool:
+        """Whether the incomplete line could still turn out to be a fence, which changes how the page ends"""
+        return self._line_start is None and FENCE.startswith("".join(self._partial).lstrip())
+
+    def _partial_fence(self) -> Optional[str]:
+        """The language of the code block open after the incomplete line, as far as it arrived yet"""
+        if self._line_start is not None:
+            return self._fence
+        return self._fence_after("".join(self._partial))
+
+    def _begin_line(self, line: str) -> tuple[Optional[str], bool]:
+        """Opens or closes a code block if the line is a fence
+        Returns:
+            tuple[Optional[str], bool]: The language of the code block open before the line and whether it is a fence
+        """
+        fence_before = self._fence
+        is_fence = line.lstrip().startswith(FENCE)
+        if is_fence:
+            self._fence = self._fence_after(line)
+            if fence_before is None and self._lines:
+                self._boundary, self._boundary_length = len(self._lines), self._length
+        return fence_before, is_fence
+
+    def _add_line(self, line: str):
+        if self._line_start is not None:
+            # the start of the line was already cut off onto earlier pages
+            (fence_before, is_fence), self._line_start = self._line_start, None
+        else:
+            fence_before, is_fence = self._begin_line(line)
+        while self._size(len(line) + 1, self._fence) > self.limit:
+            if self._boundary and self._boundary_length > self.limit // 2:
+                self._split(self._boundary)
+            elif self._lines:
+                self._split(len(self._lines))
+            elif line:
+                line = self._cut(line, fence_before)
+            else:
+                # only a limit too small for the code block markers themselves gets here
+                break
+        self._lines.append((line, self._fence))
+        self._length += len(line) + 1
+        if (not line.strip() and self._fence is None) or (is_fence and self._fence is None):
+            self._boundary, self._boundary_length = len(self._lines), self._length
+
+    def _cut(self, line: str, fence: Optional[str]) -> str:
+        """Completes a page with as much of a line that doesn't fit on a page by itself as possible and returns the
+        rest of the line"""
+        # at least one character is cut off so the line always gets shorter
+        space = max(self.limit - len(self._opening(fence)) - len(self._closing(fence)) - 1, 1)
+        cut = line.rfind(" ", 0, space)
+        if cut <= space // 2:
+            cut = space
+        head, rest = line[:cut], line[cut:].lstrip(" ")
+        prefix = next((prefix for prefix in LINE_PREFIXES if line.startswith(prefix)), "")
+        if len(prefix) + 1 >= cut:
+            prefix = ""
+        elif fence is None and head.count("`") & 1:
+            # close inline code cut in half and reopen it on the next page
+            head += "`"
+            prefix += "`"
+        self._lines.append((head, fence))
+        self._split(1)
+        return prefix + rest
+
+    def feed(self, text: str) -> list[str]:
+        """Adds text to the end of the markdown
+        Returns:
+            list[str]: The pages that were completed by the text
+        """
+        completed = len(self.pages)
+        if "\n" in text:
+            lines = ("".join(self._partial) + text).split("\n")
+            self._partial = [lines.pop()]
+            self._partial_length = len(self._partial[0])
+            for line in lines:
+                self._add_line(line)
+        else:
+            self._partial.append(text)
+            self._partial_length += len(text)
+        if self._lines and not self._undecided():
+            # the page in progress has to fit the incomplete line too, so it can be shown while the line is streamed.
+            # It is split the same way it will be once the line is complete, which can only be longer
+            fence = self._partial_fence()
+            if self._fence is None and fence is not None:
+                # the line opens a code block, which the page will be split before once the line is complete
+                self._boundary, self._boundary_length = len(self._lines), self._length
+            while self._lines and self._size(self._partial_length + 1, fence) > self.limit:
+                if self._boundary and self._boundary_length > self.limit // 2:
+                    self._split(self._boundary)
+                else:
+                    self._split(len(self._lines))
+        if not self._lines and self._size(self._partial_length + 1, self._partial_fence()) > self.limit:
+            # the incomplete line won't fit on a page by itself, so cut it without waiting for the rest of it
+            partial = "".join(self._partial)
+            if self._line_start is None:
+                self._line_start = self._begin_line(partial)
+            while partial and self._size(len(partial) + 1, self._fence) > self.limit:
+                partial = self._cut(partial, self._line_start[0])
+            self._partial, self._partial_length = [partial], len(partial)
+        return self.pages[completed:]
+
+    def finish(self) -> list[str]:
+        """Completes the last page
+        Returns:
+            list[str]: The pages that were completed
+        """
+        completed = len(self.pages)
+        if self._partial_length or self._line_start is not None:
+            self._add_line("".join(self._partial))
+            self._partial, self._partial_length = [], 0
+        if self._lines:
+            self._split(len(self._lines))
+        return self.pages[completed:]
+
+    @property
+    def current(self) -> str:
+        """The page in progress, including the incomplete line at the end"""
+        lines = [line for line, _ in self._lines]
+        fence = self._fence
+        if self._partial_length and not self._undecided():
+            lines.append("".join(self._partial))
+            fence = self._partial_fence()
+        return self._opening(self._start_fence) + "\n".join(lines) + self._closing(fence)
+
+
+def paginate(text: str, limit: int = 4096) -> list[str]:
+    """Splits complete markdown into pages, see :class:`MarkdownPaginator`"""
+    paginator = MarkdownPaginator(limit)
+    paginator.feed(text)
+    paginator.finish()
+    return paginator.pages
@@ -0,0 +1,148 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+
+def pack_images(images: Optional[list[bytes]]) -> Optional[bytes]:
+    if not images:
+        return None
+    return b"".join(len(image).to_bytes(4, "big") + image for image in images)
+
+
+def unpack_images(packed: Optional[bytes]) -> list[bytes]:
+    images = []
+    offset = 0
+    while packed and offset < len(packed):
+        length = int.from_bytes(packed[offset:offset + 4], "big")
+        images.append(packed[offset + 4:offset + 4 + length])
+        offset += 4 + length
+    return images
+
+
+class ConversationLog:
+    """An append-only SQLite log of the conversations in :class:`llm.context.ConversationStore`, so they survive the
+    bot restarting. Writes are queued and written by :meth:`flush`, and trimmed or expired history is only
+    physically removed by :meth:`compact`; both are meant to be run off the event loop.
+    Args:
+        path (str): The path of the SQLite database file
+    """
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._pending: list[tuple] = []
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS channels "
+                "(channel_id INTEGER PRIMARY KEY, first_seq INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS messages (channel_id INTEGER NOT NULL, seq INTEGER NOT NULL, "
+                "message TEXT NOT NULL, images BLOB, PRIMARY KEY (channel_id, seq))"
+            )
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def append(self, channel_id: int, seq: int, message: dict):
+        payload = {key: value for key, value in message.items() if key != 'images'}
+        self._pending.append(("append", channel_id, seq, json.dumps(payload), pack_images(message.get('images'))))
+
+    def trim(self, channel_id: int, first_seq: int):
+        self._pending.append(("trim", channel_id, first_seq))
+
+    def clear(self, channel_id: int = None):
+        self._pending.append(("clear", channel_id))
+
+    def flush(self):
+        """Writes every queued change to the database"""
+        with self._lock:
+            operations, self._pending = self._pending, []
+            if not operations:
+                return
+            now = time.time()
+            with self._connection:
+                for operation, channel_id, *arguments in operations:
+                    if operation == "append":
+                        seq, message, images = arguments
+                        self._connection.execute(
+                            "INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?)", (channel_id, seq, message, images)
+                        )
+                        self._connection.execute(
+                            "INSERT INTO channels VALUES (?, 0, ?) "
+                            "ON CONFLICT(channel_id) DO UPDATE SET last_used = excluded.last_used",
+                            (channel_id, now)
+                        )
+                    elif operation == "trim":
+                        self._connection.execute(
+                            "UPDATE channels SET first_seq = ? WHERE channel_id = ?", (arguments[0], channel_id)
+                        )
+                    elif channel_id is None:
+                        self._connection.execute("DELETE FROM messages")
+                        self._connection.execute("DELETE FROM channels")
+                    else:
+                        self._connection.execute("DELETE FROM messages WHERE channel_id = ?", (channel_id,))
+                        self._connection.execute("DELETE FROM channels WHERE channel_id = ?", (channel_id,))
+
+    def load(self, channel_id: int, max_age: float = None) -> tuple[int, list[dict]]:
+        """Reads the retained history of a channel
+        Args:
+            channel_id (int): The id of the channel to read the history of
+            max_age (float): Ignore the history if the channel has been idle for longer than this many seconds
+        Returns:
+            tuple[int, list[dict]]: The sequence number of the first retained message and the retained messages
+        """
+        if self._pending:
+            self.flush()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT first_seq, last_used FROM channels WHERE channel_id = ?", (channel_id,)
+            ).fetchone()
+            if row is None:
+                return 0, []
+            if max_age is not None and row[1] < time.time() - max_age:
+                # forget the expired history now so the channel starts over from the first sequence number
+                with self._connection:
+                    self._connection.execute("DELETE FROM messages WHERE channel_id = ?", (channel_id,))
+                    self._connection.execute("DELETE FROM channels WHERE channel_id = ?", (channel_id,))
+                return 0, []
+            first_seq = row[0]
+            rows = self._connection.execute(
+                "SELECT seq, message, images FROM messages WHERE channel_id = ? AND seq >= ? ORDER BY seq",
+                (channel_id, first_seq)
+            ).fetchall()
+        messages = []
+        for _, message, images in rows:
+            message = json.loads(message)
+            if images:
+                message['images'] = unpack_images(images)
+            messages.append(message)
+        return first_seq, messages
+
+    def compact(self, ttl: float):
+        """Removes history that was trimmed out of the conversations, forgets channels that have been idle for longer
+        than ``ttl`` seconds and returns the freed pages to the file system"""
+        self.flush()
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM channels WHERE last_used < ?", (time.time() - ttl,))
+            self._connection.execute(
+                "DELETE FROM messages WHERE channel_id NOT IN (SELECT channel_id FROM channels) OR "
+                "seq < (SELECT first_seq FROM channels WHERE channels.channel_id = messages.channel_id)"
+            )
+        with self._lock:
+            self._connection.execute("PRAGMA incremental_vacuum")
+            self._connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,561 @@
+import asyncio
+import datetime
+import functools
+import time
+from contextlib import nullcontext
+from typing import Optional, Union
+import discord
+import httpx
+import ollama
+from discord.ext import commands, pages
+import config
+import utils
+from llm import (
+    admission, attachments, cache, context, images, memory, metrics, paginator, pool, residency, streaming, summarizer
+)
+
+SYSTEM_PROMPT = (
+    'your response will be sent over discord, so please make sure your entire response is limited to 4096 characters'
+)
+
+
+class LLMRequest:
+    """The state of an LLM command invocation as it passes through the stages of the :class:`Pipeline`
+    Args:
+        ctx (Union[commands.Context, discord.ApplicationContext]): The context the command was invoked in
+        command_name (str): The name of the command in the server profile
+        prompt (str): The prompt the user sent
+        model (str): The model option chosen by the user, or the command's default
+        image (Optional[discord.Attachment]): The image attached through the slash command option
+        file (Optional[discord.Attachment]): The text file attached through the slash command option
+        show_thinking (bool): Whether to show the thinking of models that put it in ``<think>`` tags
+        enable_thinking (bool): Whether to enable thinking for models that can toggle it
+        use_cache (bool): Whether a cached response to the same request can be served
+    Attributes:
+        cached (bool): Whether the response was served from the response cache
+        priority (bool): Whether the request jumps the queue without being charged against any budget
+        charge (Optional[admission.Charge]): What the request was charged on admission
+        attachments (list[str]): The text of the files attached to the prompt, as it is added to the prompt
+    """
+    def __init__(self, ctx: Union[commands.Context, discord.ApplicationContext], command_name: str, prompt: str, *,
+                 model: str = None, image: discord.Attachment = None, file: discord.Attachment = None,
+                 show_thinking: bool = True, enable_thinking: bool = True, use_cache: bool = True):
+        self.ctx = ctx
+        self.command_name = command_name
+        self.entry: dict = config.current_profile['commands'][command_name]
+        self.prompt = prompt
+        self.model = model or self.entry['default']
+        self.image = image
+        self.file = file
+        self.show_thinking = show_thinking
+        self.enable_thinking = enable_thinking
+        self.use_cache = use_cache
+        self.cached = False
+        self.priority = False
+        self.charge: Optional[admission.Charge] = None
+        self.attachments: list[str] = []
+        self.model_name: Optional[str] = None
+        self.messages: list[dict] = []
+        self.response: Optional[ollama.ChatResponse] = None
+        self.stream_message: Optional[discord.Message] = None
+
+    @property
+    def content(self) -> str:
+        """The prompt along with the text of the files attached to it"""
+        return "\n\n".join([self.prompt, *self.attachments])
+
+    @property
+    def title(self) -> str:
+        return f"{self.entry['title']} Response"
+
+    @property
+    def think(self) -> Optional[bool]:
+        return self.enable_thinking if self.entry.get('thinking') == "toggle" else None
+
+    def _limit(self, key: str):
+        model_limits = self.entry.get('model limits', {}).get(self.model, {})
+        return model_limits.get(key, self.entry.get(key))
+
+    @property
+    def num_predict(self) -> int:
+        """The maximum amount of tokens to generate, with the model's limit taking precedence over the command's"""
+        return self._limit('num predict') or config.default_num_predict
+
+    @property
+    def deadline(self) -> Optional[float]:
+        """The maximum amount of seconds to spend generating, with the model's limit taking precedence over the
+        command's"""
+        return self._limit('deadline') or config.default_deadline or None
+
+
+async def respond_paginated(
+        ctx: Union[discord.ApplicationContext, commands.Context], title: str, response_content: str, *,
+        message: Optional[discord.Message] = None, view: Optional[discord.ui.View] = None
+):
+    """Sends the response as a message, an embed or a paginator depending on its length. If a message is given
+    (e.g. the one a response was streamed into) it is edited instead of sending a new one. The items of a view are
+    added below the response, or below the paginator's buttons."""
+    if len(response_content) <= 2000:
+        if message:
+            await message.edit(content=f"{response_content}", embed=None, view=view)
+        else:
+            await ctx.respond(f"{response_content}", view=view)
+    elif len(response_content) <= 4096:
+        embed = utils.default_embed(ctx, title, f"{response_content}")
+        if message:
+            await message.edit(embed=embed, view=view)
+        else:
+            await ctx.respond(embed=embed, view=view)
+    else:
+        response_pages = paginator.paginate(response_content, 4096)
+        embed_pages = [
+            utils.default_embed(ctx, f"{title} {index + 1}/{len(response_pages)}", response_page)
+            for index, response_page in enumerate(response_pages)
+        ]
+        response_paginator = pages.Paginator(pages=embed_pages, custom_view=view)
+        if message:
+            await response_paginator.edit(message, user=ctx.author)
+        elif isinstance(ctx, discord.ApplicationContext):
+            await response_paginator.respond(ctx.interaction)
+        else:
+            await response_paginator.send(ctx)
+
+
+def split_thinking(content: str) -> tuple[Optional[str], str]:
+    """Splits the thinking of models that put it in ``<think>`` tags out of the response content"""
+    if "</think>" not in content:
+        return None, content
+    thinking, answer = content.split("</think>", 1)
+    return thinking.replace("<think>", "").strip("\n"), answer.lstrip("\n")
+
+
+def separate_thinking(response: ollama.ChatResponse):
+    """Moves the thinking of models that put it in ``<think>`` tags out of the content of a response that wasn't
+    streamed, so the thinking is kept apart from the answer no matter where the response came from"""
+    thinking, response.message.content = split_thinking(response.message.content or "")
+    if thinking is not None:
+        response.message.thinking = thinking
+
+
+def persisted(messages: list[dict]) -> list[dict]:
+    """The messages of a request that are kept in the channel's history, leaving out the earlier turns recalled from
+    the channel's memory. Only those are fingerprinted, since the recalled turns change every turn and would keep the
+    next turn from being routed to the server that evaluated the rest of the conversation."""
+    return [
+        message for message in messages
+        if message.get('role') != 'system' or not (message.get('content') or "").startswith(memory.MEMORY_PREFIX)
+    ]
+
+
+class Pipeline:
+    """Runs every LLM command through the same stages: resolve the model, load the history, admit the request, build
+    the messages, generate the response, render it, compact the history and remember the turn. Each stage returns
+    whether the request should continue to the next one.
+    Args:
+        server_pool (pool.ServerPool): The ollama servers requests are routed to
+        conversations (context.ConversationStore): The message history of each channel
+        response_cache (Optional[cache.ResponseCache]): The cache responses are served from, if response caching is
+            enabled
+        residency_manager (Optional[residency.ResidencyManager]): Decides the ``keep_alive`` of each request
+        image_preprocessor (Optional[images.ImagePreprocessor]): Shrinks attached images before they are sent
+        conversation_summarizer (Optional[summarizer.ConversationSummarizer]): Compacts long histories
+        generation_metrics (Optional[metrics.Metrics]): Where the token counts and timings of generations are recorded
+        admission_controller (Optional[admission.AdmissionController]): Charges requests against the budgets of
+            their user and guild and decides which requests are prioritized
+        channel_memory (Optional[memory.ChannelMemory]): Recalls turns that have left the history of a channel
+        attachment_ingestor (Optional[attachments.AttachmentIngestor]): Reads the text files attached to prompts
+    """
+    def __init__(self, server_pool: pool.ServerPool, conversations: context.ConversationStore,
+                 response_cache: Optional[cache.ResponseCache] = None,
+                 residency_manager: Optional[residency.ResidencyManager] = None,
+                 image_preprocessor: Optional[images.ImagePreprocessor] = None,
+                 conversation_summarizer: Optional[summarizer.ConversationSummarizer] = None,
+                 generation_metrics: Optional[metrics.Metrics] = None,
+                 admission_controller: Optional[admission.AdmissionController] = None,
+                 channel_memory: Optional[memory.ChannelMemory] = None,
+                 attachment_ingestor: Optional[attachments.AttachmentIngestor] = None):
+        self.pool = server_pool
+        self.conversations = conversations
+        self.response_cache = response_cache
+        self.residency = residency_manager
+        self.images = image_preprocessor
+        self.summarizer = conversation_summarizer
+        self.metrics = generation_metrics
+        self.admission = admission_controller
+        self.memory = channel_memory
+        self.attachments = attachment_ingestor
+        self._in_flight: dict[str, tuple[streaming.StreamingResponse, asyncio.Future]] = {}
+        self.generations: list[streaming.StreamingResponse] = []
+        self.stages = [
+            self.resolve, self.load_history, self.admit, self.ingest, self.build_messages, self.generate, self.render,
+            self.compact, self.remember
+        ]
+
+    async def run(self, ctx: Union[commands.Context, discord.ApplicationContext], command_name: str, **options):
+        await ctx.defer()
+        request = LLMRequest(ctx, command_name, **options)
+        for stage in self.stages:
+            if not await stage(request):
+                return
+
+    async def resolve(self, request: LLMRequest) -> bool:
+        """Picks the model to use, which can be overridden by starting the prompt with one of the model options"""
+        prompt_words = request.prompt.split()
+        if prompt_words and prompt_words[0].upper() in request.entry['options']:
+            request.model = prompt_words[0].upper()
+        if request.model not in request.entry['options']:
+            request.model = request.entry['default']
+        request.model_name = request.entry['options'][request.model]
+        return True
+
+    async def load_history(self, request: LLMRequest) -> bool:
+        """Loads the channel's history back from the conversation log if it was evicted from memory"""
+        await self.conversations.load(request.ctx.channel.id)
+        return True
+
+    @staticmethod
+    def attached(request: LLMRequest) -> list[discord.Attachment]:
+        """The files attached to the message that invoked the command and to the slash command options"""
+        ctx = request.ctx
+        files = list(ctx.message.attachments) if ctx.message and ctx.message.attachments else []
+        return files + [attachment for attachment in (request.file, request.image) if attachment]
+
+    async def ingest(self, request: LLMRequest) -> bool:
+        """Reads the text files attached to the prompt, so they can be added to it. This only happens once the request
+        was admitted, and the tokens spent summarizing the files are charged to it."""
+        if self.attachments is not None:
+            request.attachments = await self.attachments.ingest(
+                self.attached(request), self.conversations.history(request.ctx.channel.id),
+                functools.partial(self.admission.bill, request.charge) if request.charge is not None else None
+            )
+        return True
+
+    async def check_servers(self, ctx: Union[commands.Context, discord.ApplicationContext]) -> bool:
+        """Checks the ollama servers are reachable, telling the user if none of them is"""
+        try:
+            await self.pool.check()
+        except (httpx.ConnectError, httpx.TimeoutException, ConnectionError):
+            app = await ctx.bot.application_info()
+            await ctx.respond(embed=utils.default_embed(
+                ctx, "Cannot Connect to Ollama Server.",
+                "Unable to connect to ollama server as it is probably not running. "
+                f"Please ask {app.owner.mention} to start the ollama server."
+            ))
+            return False
+        except httpx.HTTPError as error:
+            await ctx.respond(embed=utils.default_embed(
+                ctx, "Error Connecting to Ollama Server.",
+                f"There was a problem trying to connect to the ollama server: {error}"
+            ))
+            return False
+        return True
+
+    async def admit(self, request: LLMRequest) -> bool:
+        """Checks the ollama servers are reachable and have the model installed, and charges the request against the
+        budgets of its user and guild"""
+        ctx = request.ctx
+        if not await self.check_servers(ctx):
+            return False
+        if not await self.pool.has_model(request.model_name):
+            await ctx.respond(embed=utils.default_embed(
+                ctx, "Model Not Found",
+                f"The model ``{request.model}`` is not available. "
+            ))
+            return False
+        if self.admission is None:
+            return True
+        guild_id = ctx.guild.id if ctx.guild else None
+        request.priority = self.admission.is_priority(guild_id, await ctx.bot.is_owner(ctx.author))
+        if request.priority:
+            return True
+        server, model_id = self.pool.route(request.model_name)
+        prompt_tokens = context.estimate_tokens({'role': 'system', 'content': SYSTEM_PROMPT}) + sum(
+            context.estimate_tokens(message) for message in self.conversations.history(ctx.channel.id)
+        ) + context.estimate_tokens({'role': 'user', 'content': request.prompt})
+        if self.attachments is not None and any(attachments.is_text(file) for file in self.attached(request)):
+            # the files aren't read until the request is admitted, so it is charged as if they fill their budget
+            prompt_tokens += self.attachments.token_budget
+        request.charge, retry_after = self.admission.admit(
+            ctx.author.id, guild_id, model_id, server.inventory.sizes.get(model_id) if server else None,
+            prompt_tokens, request.num_predict
+        )
+        if request.charge is None:
+            await ctx.respond(embed=utils.default_embed(
+                ctx, "Out of Budget",
+                f"{ctx.author.mention} or this server has used up the budget for ``{request.model}`` for now. "
+                f"Try again {utils.discord_ts(datetime.datetime.now() + datetime.timedelta(seconds=retry_after), 'R')}"
+                f" or use a smaller model.",
+                discord.Colour.blue()
+            ))
+            return False
+        return True
+
+    async def build_messages(self, request: LLMRequest) -> bool:
+        """Adds the prompt, along with the attached text files and any attached image for models that accept images, to
+        the channel's history. The messages sent start with the same system message every turn and otherwise only grow
+        at the end, so the ollama server can reuse the prompt it evaluated for the previous turn. Earlier turns recalled
+        from the channel's memory are put right before the prompt, so they don't change that prefix."""
+        ctx = request.ctx
+        message = {
+            'role': 'user',
+            'content': request.content
+        }
+        if request.entry.get('images'):
+            attachment = next(
+                (attachment for attachment in self.attached(request) if not attachments.is_text(attachment)), None
+            )
+            message['images'] = []
+            if attachment:
+                image = await attachment.read()
+                if self.images is not None:
+                    image = await self.images.process(image, request.entry.get('image size', config.image_max_size))
+                message['images'].append(image)
+        await self.conversations.append(ctx.channel.id, message)
+        request.messages = [{'role': 'system', 'content': SYSTEM_PROMPT}, *(
+            # history saved before the system message was moved out of the user messages still has it inline
+            {key: value for key, value in history_message.items() if key != 'system'}
+            for history_message in self.conversations.history(ctx.channel.id)
+        )]
+        if self.memory is not None:
+            recalled = await self.memory.recall(
+                ctx.guild.id if ctx.guild else None, ctx.channel.id, request.prompt, request.messages
+            )
+            if recalled:
+                request.messages.insert(-1, {'role': 'system', 'content': memory.MEMORY_PREFIX + "\n\n".join(recalled)})
+        return True
+
+    def request_key(self, model_name: str, chat_kwargs: dict) -> str:
+        """The key identical chat requests share in the response cache and while they are in flight"""
+        return cache.cache_key(
+            self.pool.primary.model_id(model_name) or model_name, chat_kwargs['messages'],
+            {option: value for option, value in chat_kwargs.items() if option != 'messages'}
+        )
+
+    async def chat(
+            self, ctx: Union[discord.ApplicationContext, commands.Context], title: str, model_name: str, *,
+            deadline: float = None, priority: bool = False, stream: streaming.StreamingResponse = None,
+            think_tags: bool = False, **chat_kwargs
+    ) -> tuple[ollama.ChatResponse, Optional[discord.Message]]:
+        """Sends a chat request, rendering the response progressively in a message as it is generated if streaming is
+        enabled. The response can be stopped with the button on that message or :meth:`stop`, in which case the part
+        generated so far is returned. It is also stopped once it has been generating for ``deadline`` seconds.
+        Priority requests jump the queue of their model. A stream can be given to render the response differently.
+        The thinking of models that put it in ``<think>`` tags is split out of the content if ``think_tags`` is set.
+        Returns the response and the message it was streamed into, if any."""
+        stream = stream or streaming.StreamingResponse(
+            ctx, title, edit_interval=config.stream_edit_interval, think_tags=think_tags
+        )
+        self.generations.append(stream)
+        try:
+            stream.task = asyncio.ensure_future(
+                self._single_flight(ctx, stream, model_name, deadline, priority, **chat_kwargs)
+            )
+            try:
+                response = await stream.task
+            except asyncio.CancelledError:
+                if not stream.stopped or not stream.task.cancelled():
+                    raise
+                response = stream.partial_response()
+        finally:
+            self.generations.remove(stream)
+            # a queue position edit still in flight would otherwise land after the response is sent
+            await stream.settle()
+            stream.close()
+        return response, stream.message
+
+    def stop(self, channel_id: int = None) -> int:
+        """Stops the responses being generated in a channel, or in every channel if no channel is specified
+        Returns:
+            int: The amount of responses that were stopped
+        """
+        stopped = [
+            stream for stream in self.generations
+            if not stream.stopped and (channel_id is None or stream.ctx.channel.id == channel_id)
+        ]
+        for stream in stopped:
+            stream.stop()
+        return len(stopped)
+
+    async def _single_flight(
+            self, ctx: Union[discord.ApplicationContext, commands.Context], stream: streaming.StreamingResponse,
+            model_name: str, deadline: Optional[float], priority: bool = False, **chat_kwargs
+    ) -> ollama.ChatResponse:
+        """Sends a chat request, unless an identical request is already being generated, in which case this one
+        follows it instead of generating the response a second time. The generation is shared, so a request that is
+        stopped only stops waiting for it, and it is only cancelled once none of the requests are waiting anymore."""
+        key = self.request_key(model_name, chat_kwargs)
+        if key in self._in_flight:
+            leader, result = self._in_flight[key]
+            stream.follow(leader)
+            try:
+                response = await asyncio.shield(result)
+            finally:
+                leader.followers.remove(stream)
+                if leader.stopped and not leader.followers:
+                    # the leader was only still generating for its followers
+                    result.cancel()
+            await stream.settle()
+            return response.model_copy(deep=True)
+        result = asyncio.ensure_future(self._chat(ctx, stream, model_name, deadline, priority, **chat_kwargs))
+        self._in_flight[key] = stream, result
+        result.add_done_callback(lambda _: self._in_flight.pop(key))
+        try:
+            response = await asyncio.shield(result)
+        except asyncio.CancelledError:
+            if not stream.followers:
+                result.cancel()
+            raise
+        return response.model_copy(deep=True) if stream.followers else response
+
+    async def _chat(
+            self, ctx: Union[discord.ApplicationContext, commands.Context], stream: streaming.StreamingResponse,
+            model_name: str, deadline: Optional[float], priority: bool = False, **chat_kwargs
+    ) -> ollama.ChatResponse:
+        """Routes a chat request to a server in the pool, queues it on that server's model scheduler and sends it.
+        If a server can't be reached before anything was generated, the request fails over to the next best
+        server. A request that had to wait in the queue for long gets a tighter token and time budget, so the
+        requests queued behind it aren't held up for as long."""
+        tried_servers = []
+        prefix = context.fingerprint(persisted(chat_kwargs['messages'])[:-1])
+        # a miss re-probes the pool in case the model was installed since the last refresh
+        await self.pool.has_model(model_name)
+        while True:
+            server, model_id = self.pool.route(model_name, exclude=tried_servers, prefix=prefix)
+            if server is None:
+                raise ollama.ResponseError(f"model '{model_id}' is not available on any reachable server", 404)
+            if self.residency is not None:
+                chat_kwargs['keep_alive'] = self.residency.keep_alive(model_id)
+            queued_at = time.monotonic()
+            async with server.scheduler.slot(
+                    model_id, ctx.author.id, ctx.channel.id, priority=priority, on_position=stream.show_queue_position
+            ):
+                queue_wait = time.monotonic() - queued_at
+                budget = deadline
+                if queue_wait > config.tight_budget_wait:
+                    budget = deadline and deadline * config.tight_budget_ratio
+                    options = dict(chat_kwargs.get('options') or {})
+                    if options.get('num_predict', -1) > 0:
+                        options['num_predict'] = max(1, int(options['num_predict'] * config.tight_budget_ratio))
+                        chat_kwargs['options'] = options
+                timer = asyncio.get_running_loop().call_later(
+                    budget, lambda: [response.stop("deadline") for response in [*stream.followers, stream]]
+                ) if budget else None
+                try:
+                    if config.stream_responses:
+                        response = await stream.consume(
+                            await server.client.chat(model=model_id, stream=True, **chat_kwargs)
+                        )
+                    else:
+                        response = await server.client.chat(model=model_id, **chat_kwargs)
+                except (httpx.ConnectError, httpx.TimeoutException, ConnectionError):
+                    server.inventory.invalidate()
+                    if stream.content or stream.thinking:
+                        raise
+                    tried_servers.append(server)
+                    continue
+                except (httpx.HTTPError, ollama.ResponseError):
+                    server.inventory.invalidate()
+                    raise
+                finally:
+                    if timer is not None:
+                        timer.cancel()
+            server.record(response)
+            if self.metrics is not None:
+                self.metrics.record({
+                    'model': model_id, 'server': server.url, 'command': ctx.command.qualified_name,
+                    'guild': str(ctx.guild.id) if ctx.guild else "DM"
+                }, response, queue_wait, stream.first_token_at and stream.first_token_at - queued_at)
+            server.remember_prefix(model_id, context.fingerprint([*persisted(chat_kwargs['messages']), {
+                'role': 'assistant', 'content': split_thinking(response.message.content)[1]
+            }]))
+            return response
+
+    async def lookup(self, request: LLMRequest, chat_kwargs: dict) -> Optional[str]:
+        """Serves the response from the response cache if there is one for the same request. Returns the key the
+        response should be cached under, or ``None`` if the request can't be cached."""
+        if self.response_cache is None or not request.use_cache or not cache.cacheable(chat_kwargs):
+            return None
+        key = self.request_key(request.model_name, chat_kwargs)
+        request.response = self.response_cache.get(key) or await asyncio.to_thread(self.response_cache.load, key)
+        request.cached = request.response is not None
+        return key
+
+    async def generate(self, request: LLMRequest) -> bool:
+        """Generates the response, or serves it from the response cache, and adds it to the channel's history"""
+        ctx = request.ctx
+        options = {'num_predict': request.num_predict}
+        if self.response_cache is not None and request.use_cache:
+            # with a fixed seed the model gives the same response every time, so serving it from the cache is honest
+            options['seed'] = config.response_cache_seed
+        chat_kwargs = {'messages': request.messages, 'think': request.think, 'options': options}
+        try:
+            key = await self.lookup(request, chat_kwargs)
+            if not request.cached:
+                async with ctx.typing() if not isinstance(ctx, discord.ApplicationContext) else nullcontext():
+                    request.response, request.stream_message = await self.chat(
+                        ctx, request.title, request.model_name, deadline=request.deadline,
+                        priority=request.priority, think_tags=request.entry.get('thinking') == "tags", **chat_kwargs
+                    )
+                if key is not None and request.response.done and request.response.done_reason != "length":
+                    self.response_cache.put(key, request.response)
+        except ollama.ResponseError as error:
+            await ctx.respond(embed=utils.default_embed(
+                ctx, "Error Generating Response",
+                f"{error.error}"
+            ))
+            return False
+        finally:
+            if request.charge is not None:
+                self.admission.settle(request.charge, None if request.cached else request.response)
+        if request.entry.get('thinking') == "tags":
+            # responses that weren't streamed, and cached ones from before the thinking was split out, still have it
+            separate_thinking(request.response)
+        await self.conversations.append(
+            ctx.channel.id, {'role': 'assistant', 'content': request.response.message.content}
+        )
+        return True
+
+    async def render(self, request: LLMRequest) -> bool:
+        """Sends the response, with a button below it that shows the thinking for models that think. The thinking is
+        only rendered once someone presses the button, so the response is sent without waiting on it."""
+        # a response can be all thinking, and discord doesn't allow sending an empty message
+        content = request.response.message.content or "** **"
+        thinking = request.response.message.thinking
+        show_thinking = request.show_thinking
+        if request.entry.get('thinking') == "toggle":
+            show_thinking = request.enable_thinking
+        view = None
+        if thinking and show_thinking:
+            view = streaming.ReasoningView(request.ctx, request.title, thinking)
+            response_content = content
+        elif request.think and not thinking:
+            response_content = ":warning: **WARNING**: thinking associated with the response is missing\n\n" + content
+        else:
+            response_content = content
+        if request.cached:
+            response_content += "\n-# Cached response"
+        elif request.response.done_reason == "stopped":
+            response_content += "\n-# Generation stopped"
+        elif request.response.done_reason == "length":
+            response_content += "\n-# Response truncated: reached the maximum length"
+        elif request.response.done_reason == "deadline":
+            response_content += "\n-# Response truncated: ran out of time"
+        await respond_paginated(
+            request.ctx, request.title, response_content, message=request.stream_message, view=view
+        )
+        return True
+
+    async def compact(self, request: LLMRequest) -> bool:
+        """Summarizes the older part of the channel's history in the background once it has grown long"""
+        if self.summarizer is not None:
+            self.summarizer.schedule(request.ctx.channel.id)
+        return True
+
+    async def remember(self, request: LLMRequest) -> bool:
+        """Adds the turn to the channel's memory in the background, so it can be recalled once it has left the
+        history"""
+        content = request.response.message.content
+        if self.memory is not None and content:
+            ctx = request.ctx
+            self.memory.schedule(ctx.guild.id if ctx.guild else None, ctx.channel.id, request.prompt, content)
+        return True
@@ -0,0 +1,160 @@
+import asyncio
+from collections import deque
+from typing import Iterable, Optional
+import ollama
+from llm import inventory, scheduler
+
+
+class OllamaServer:
+    """An ollama server in the pool along with its profile, cached inventory and request scheduler
+    Args:
+        url (str): The URL of the ollama server
+        profile (dict): The server's entry in ``server-profiles.json``
+        per_model (int): See :class:`llm.scheduler.ModelScheduler`
+        max_active_models (int): See :class:`llm.scheduler.ModelScheduler`
+        max_wait (float): See :class:`llm.scheduler.ModelScheduler`
+    Attributes:
+        tokens_per_second (Optional[float]): A moving average of the generation speed observed on the server
+        prefixes (dict[str, deque[str]]): The fingerprints of the latest conversations each model has evaluated on
+            the server, which the server can continue without evaluating the prompt again
+        durations (dict[str, float]): A moving average of the amount of seconds each model takes to respond once it
+            is loaded
+        load_times (dict[str, float]): A moving average of the amount of seconds each model takes to load
+    """
+    def __init__(self, url: str, profile: dict, per_model: int = 1, max_active_models: int = 1,
+                 max_wait: float = 60.0):
+        self.url = url
+        self.profile = profile
+        self.client = ollama.AsyncClient(url)
+        self.inventory = inventory.ModelInventory(self.client)
+        self.scheduler = scheduler.ModelScheduler(per_model, max_active_models, max_wait)
+        self.inventory.listeners.append(lambda probed: self.scheduler.update_resident(probed.resident))
+        self.tokens_per_second: Optional[float] = None
+        self.prefixes: dict[str, deque[str]] = {}
+        self.durations: dict[str, float] = {}
+        self.load_times: dict[str, float] = {}
+
+    def __repr__(self):
+        return f"<OllamaServer url={self.url!r} healthy={self.inventory.healthy}>"
+
+    def model_id(self, model_name: str) -> Optional[str]:
+        """Resolves a model name from the profile to the id of the model on this server"""
+        return self.profile['available'].get(model_name)
+
+    @property
+    def pending(self) -> int:
+        return self.scheduler.queued() + self.scheduler.total_running
+
+    def remember_prefix(self, model_id: str, fingerprint: str):
+        self.prefixes.setdefault(model_id, deque(maxlen=16)).append(fingerprint)
+
+    def has_prefix(self, model_id: str, fingerprint: Optional[str]) -> bool:
+        """Whether the model has evaluated a conversation the prompt continues and is still loaded"""
+        return (
+            fingerprint is not None and model_id in self.scheduler.resident_models and
+            fingerprint in self.prefixes.get(model_id, ())
+        )
+
+    @staticmethod
+    def _average(averages: dict[str, float], model_id: str, value: float):
+        averages[model_id] = value if model_id not in averages else 0.8 * averages[model_id] + 0.2 * value
+
+    def record(self, response: ollama.ChatResponse):
+        """Updates the observed generation speed, response time and load time from a finished response"""
+        load_time = (response.load_duration or 0) / 10 ** 9
+        if response.model and response.total_duration:
+            self._average(self.durations, response.model, response.total_duration / 10 ** 9 - load_time)
+        # a model that was already loaded reports a load time of a few milliseconds
+        if response.model and load_time > 0.5:
+            self._average(self.load_times, response.model, load_time)
+        if not response.eval_count or not response.eval_duration:
+            return
+        tokens_per_second = response.eval_count / (response.eval_duration / 10 ** 9)
+        if self.tokens_per_second is None:
+            self.tokens_per_second = tokens_per_second
+        else:
+            self.tokens_per_second = 0.8 * self.tokens_per_second + 0.2 * tokens_per_second
+
+
+class ServerPool:
+    """Routes LLM requests across every ollama server in ``server-profiles.json``. Requests go to a server that has
+    the model installed, preferring one that has already evaluated the start of the prompt, then one that has the model
+    loaded, then the one with the shortest expected wait based on its queue depth and observed generation speed.
+    Args:
+        profiles (dict[str, dict]): The server profiles keyed by the URL of the server
+        primary (str): The URL of the server whose profile defines the commands
+    """
+    def __init__(self, profiles: dict[str, dict], primary: str, **scheduler_options):
+        self.servers = [OllamaServer(url, profile, **scheduler_options) for url, profile in profiles.items()]
+        self.primary = next(server for server in self.servers if server.url == primary)
+
+    async def refresh(self):
+        await asyncio.gather(*(server.inventory.refresh() for server in self.servers))
+
+    async def check(self):
+        """Raises the error the primary server ran into if no server in the pool is reachable"""
+        if any(server.inventory.healthy for server in self.servers):
+            return
+        await asyncio.gather(*(
+            server.inventory.check() for server in self.servers if server is not self.primary
+        ), return_exceptions=True)
+        if not any(server.inventory.healthy for server in self.servers):
+            await self.primary.inventory.check()
+
+    def estimate_wait(self, model_name: str) -> tuple[Optional[OllamaServer], Optional[float]]:
+        """Estimates how long a request for a model would wait before it starts generating, from the cached inventory
+        and the queue of the server it would be routed to, without probing any server
+        Returns:
+            tuple[Optional[OllamaServer], Optional[float]]: The server the request would be routed to, or ``None`` if
+            no server has the model installed, and the estimated amount of seconds, or ``None`` if the model hasn't
+            responded or loaded on that server yet
+        """
+        server, model_id = self.route(model_name)
+        if server is None:
+            return None, None
+        model_scheduler = server.scheduler
+        ahead = model_scheduler.queued(model_id) + model_scheduler.running(model_id)
+        wait = 0.0
+        if ahead >= model_scheduler.per_model:
+            if model_id not in server.durations:
+                return server, None
+            wait += (ahead - model_scheduler.per_model + 1) / model_scheduler.per_model * server.durations[model_id]
+        if model_id not in model_scheduler.resident_models:
+            if model_id not in server.load_times:
+                return server, None
+            wait += server.load_times[model_id]
+        return server, wait
+
+    async def has_model(self, model_name: str) -> bool:
+        """Whether any reachable server in the pool has the model installed"""
+        for server in self.servers:
+            model_id = server.model_id(model_name)
+            if model_id and server.inventory.error is None and await server.inventory.has_model(model_id):
+                return True
+        return False
+
+    def route(self, model_name: str, exclude: Iterable[OllamaServer] = (),
+              prefix: Optional[str] = None) -> tuple[Optional[OllamaServer], str]:
+        """Picks the server to run a request on
+        Args:
+            model_name (str): The name of the model in the server profiles
+            exclude (Iterable[OllamaServer]): Servers that shouldn't be picked, e.g. because they already failed
+            prefix (Optional[str]): The fingerprint of the conversation the prompt continues
+        Returns:
+            tuple[Optional[OllamaServer], str]: The server, or ``None`` if no server can run the model, and the id of
+            the model on that server
+        """
+        candidates = [
+            (server, server.model_id(model_name)) for server in self.servers
+            if server not in exclude and server.model_id(model_name) and server.inventory.error is None
+            and server.model_id(model_name) in server.inventory.available
+        ]
+        if not candidates:
+            return None, self.primary.model_id(model_name) or model_name
+        known_speeds = [server.tokens_per_second for server in self.servers if server.tokens_per_second]
+        default_speed = sum(known_speeds) / len(known_speeds) if known_speeds else 1.0
+        return min(candidates, key=lambda candidate: (
+            not candidate[0].has_prefix(candidate[1], prefix),
+            candidate[1] not in candidate[0].scheduler.resident_models,
+            (candidate[0].pending + 1) / (candidate[0].tokens_per_second or default_speed)
+        ))
@@ -0,0 +1,101 @@
+import time
+from collections import deque
+from typing import Optional, Union
+import httpx
+import ollama
+from llm import pool
+
+
+class ResidencyManager:
+    """Decides how long models stay loaded on the ollama servers based on how often they are used. Models used often
+    are kept loaded with a long ``keep_alive``, the default models of the enabled commands are loaded at startup and
+    models that are rarely used are unloaded, largest first, when the models loaded on a server take up more memory
+    than allowed.
+    Args:
+        server_pool (pool.ServerPool): The ollama servers to manage
+        hot_keep_alive (Union[float, str]): The ``keep_alive`` given to requests for hot models
+        hot_uses (int): The amount of uses within ``usage_window`` that makes a model hot
+        usage_window (float): The amount of seconds uses of a model are counted for
+        memory_limit (int): The amount of bytes the loaded models of a server can take up before rarely used models
+            are unloaded, or 0 for no limit
+    """
+    def __init__(self, server_pool: pool.ServerPool, hot_keep_alive: Union[float, str] = 3600.0, hot_uses: int = 3,
+                 usage_window: float = 3600.0, memory_limit: int = 0):
+        self.pool = server_pool
+        self.hot_keep_alive = hot_keep_alive
+        self.hot_uses = hot_uses
+        self.usage_window = usage_window
+        self.memory_limit = memory_limit
+        self._uses: dict[str, deque[float]] = {}
+
+    def uses(self, model_id: str) -> int:
+        """The amount of times a model was used within the usage window"""
+        model_uses = self._uses.get(model_id)
+        if not model_uses:
+            return 0
+        while model_uses and model_uses[0] < time.monotonic() - self.usage_window:
+            model_uses.popleft()
+        return len(model_uses)
+
+    def is_hot(self, model_id: str) -> bool:
+        return self.uses(model_id) >= self.hot_uses
+
+    def record_use(self, model_id: str):
+        self._uses.setdefault(model_id, deque()).append(time.monotonic())
+
+    def keep_alive(self, model_id: str) -> Optional[Union[float, str]]:
+        """Records a request for a model and returns the ``keep_alive`` to send with it, or ``None`` to leave it to the
+        server's default"""
+        self.record_use(model_id)
+        return self.hot_keep_alive if self.is_hot(model_id) else None
+
+    async def prewarm(self, model_names: list[str]):
+        """Loads each model on the server requests for it would be routed to, by sending it an empty prompt. The
+        models are loaded through the server's scheduler, so no more models are loaded at once than it allows, and
+        with the server's default ``keep_alive``, since they only become hot once they are used."""
+        await self.pool.refresh()
+        loaded: dict[pool.OllamaServer, int] = {}
+        for model_name in dict.fromkeys(model_names):
+            server, model_id = self.pool.route(model_name)
+            if server is None or model_id in server.inventory.resident:
+                continue
+            if len(server.inventory.resident) + loaded.get(server, 0) >= server.scheduler.max_active_models:
+                # a server that can't run any more models at once would only unload the ones loaded before
+                continue
+            try:
+                async with server.scheduler.slot(model_id, 0, 0):
+                    await server.client.generate(model=model_id)
+            except (httpx.HTTPError, ConnectionError, ollama.ResponseError):
+                continue
+            loaded[server] = loaded.get(server, 0) + 1
+            server.inventory.invalidate()
+
+    async def rebalance(self):
+        """Unloads the rarely used models of every server whose loaded models take up more memory than allowed,
+        starting with the largest, until they fit"""
+        if not self.memory_limit:
+            return
+        for server in self.pool.servers:
+            if not server.inventory.healthy:
+                continue
+            resident = server.inventory.resident
+            used_memory = sum(model.size or 0 for model in resident.values())
+            if used_memory <= self.memory_limit:
+                continue
+            candidates = sorted(
+                (model for model_id, model in resident.items()
+                 if not server.scheduler.running(model_id) and not self.is_hot(model_id)),
+                key=lambda model: (self.uses(model.model), -(model.size or 0))
+            )
+            unloaded = False
+            for model in candidates:
+                if used_memory <= self.memory_limit:
+                    break
+                try:
+                    await server.client.generate(model=model.model, keep_alive=0)
+                except (httpx.HTTPError, ConnectionError, ollama.ResponseError):
+                    break
+                used_memory -= model.size or 0
+                unloaded = True
+            if unloaded:
+                server.inventory.invalidate()
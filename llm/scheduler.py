@@ -0,0 +1,236 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Callable, Iterable, Optional
+
+
+class _Ticket:
+    def __init__(self, model: str, user_id: int, channel_id: int, priority: bool = False):
+        self.model = model
+        self.user_id = user_id
+        self.channel_id = channel_id
+        self.priority = priority
+        self.position: Optional[int] = None
+        self.enqueued_at = time.monotonic()
+        self.admitted = asyncio.get_running_loop().create_future()
+        self.updated = asyncio.Event()
+
+
+class ModelScheduler:
+    """Queues LLM requests per model so a burst of requests doesn't make the ollama server swap models in and out of
+    memory. Requests for a model that is already running or resident are preferred, and within a model requests are
+    served round-robin across channels and then across users in each channel. Priority requests are served first in
+    the order they arrived, and their model is loaded next as if it had waited too long.
+    Args:
+        per_model (int): The amount of requests allowed to run at once for a single model
+        max_active_models (int): The amount of different models allowed to run at once
+        max_wait (float): The amount of seconds a request can wait before its model is allowed to displace the
+            currently running models
+    Attributes:
+        resident_models (set[str]): The model ids that are believed to be loaded on the ollama server
+    """
+    def __init__(self, per_model: int = 1, max_active_models: int = 1, max_wait: float = 60.0):
+        self.per_model = per_model
+        self.max_active_models = max_active_models
+        self.max_wait = max_wait
+        self.resident_models: set[str] = set()
+        self._queues: dict[str, OrderedDict[int, OrderedDict[int, deque[_Ticket]]]] = {}
+        self._priority_queues: dict[str, deque[_Ticket]] = {}
+        self._running: dict[str, int] = {}
+
+    def update_resident(self, models: Iterable[str]):
+        """Replaces the models believed to be loaded on the server, e.g. with the ones reported by ``ps()``"""
+        self.resident_models = set(models) | set(self._running)
+
+    def running(self, model: str) -> int:
+        return self._running.get(model, 0)
+
+    @property
+    def total_running(self) -> int:
+        return sum(self._running.values())
+
+    def _waiting(self, model: str = None) -> list[_Ticket]:
+        models = [model] if model else list({**self._priority_queues, **self._queues})
+        return [
+            *(ticket for queue_model in models for ticket in self._priority_queues.get(queue_model, ())),
+            *(ticket for queue_model in models for channel_queue in self._queues.get(queue_model, {}).values()
+              for user_queue in channel_queue.values() for ticket in user_queue)
+        ]
+
+    def queued(self, model: str = None) -> int:
+        return len(self._waiting(model))
+
+    def _service_order(self, model: str) -> list[_Ticket]:
+        # simulates the round-robin rotation without mutating the real queues
+        channels = [
+            [deque(user_queue) for user_queue in channel_queue.values()]
+            for channel_queue in self._queues.get(model, {}).values()
+        ]
+        order = list(self._priority_queues.get(model, ()))
+        while channels:
+            for channel_users in list(channels):
+                user_queue = channel_users.pop(0)
+                order.append(user_queue.popleft())
+                if user_queue:
+                    channel_users.append(user_queue)
+                if not channel_users:
+                    channels.remove(channel_users)
+        return order
+
+    def position(self, ticket: _Ticket) -> int:
+        """The amount of requests for the same model that will be served before this one"""
+        try:
+            return self._service_order(ticket.model).index(ticket)
+        except ValueError:
+            return 0
+
+    def _oldest_wait(self, model: str) -> float:
+        oldest = min((ticket.enqueued_at for ticket in self._waiting(model)), default=time.monotonic())
+        return time.monotonic() - oldest
+
+    def _pick_model(self) -> Optional[str]:
+        candidates = [
+            model for model in {**self._priority_queues, **self._queues} if self.running(model) < self.per_model
+        ]
+        if not candidates:
+            return None
+        active = {model for model in self._running if self._running[model] > 0}
+        starved = [
+            model for model in candidates if model not in active and (
+                model in self._priority_queues or self._oldest_wait(model) > self.max_wait
+            )
+        ]
+        active_candidates = [model for model in candidates if model in active]
+        priority_candidates = [model for model in active_candidates if model in self._priority_queues]
+        if priority_candidates:
+            return max(priority_candidates, key=self._oldest_wait)
+        # stop feeding the running models once another model has waited too long, so they drain and it can load
+        if active_candidates and not starved:
+            return max(active_candidates, key=self._oldest_wait)
+        if len(active) >= self.max_active_models:
+            return None
+        idle_candidates = [model for model in candidates if model not in active]
+        if not idle_candidates:
+            return None
+        return max(
+            idle_candidates,
+            key=lambda model: (
+                model in self._priority_queues, model in starved, model in self.resident_models,
+                self._oldest_wait(model)
+            )
+        )
+
+    def _pop_next(self, model: str) -> _Ticket:
+        if model in self._priority_queues:
+            priority_queue = self._priority_queues[model]
+            ticket = priority_queue.popleft()
+            if not priority_queue:
+                del self._priority_queues[model]
+            return ticket
+        channel_queues = self._queues[model]
+        channel_id, user_queues = next(iter(channel_queues.items()))
+        user_id, user_queue = next(iter(user_queues.items()))
+        ticket = user_queue.popleft()
+        # rotate the served user and channel to the back so everyone gets a turn
+        user_queues.move_to_end(user_id)
+        if not user_queue:
+            del user_queues[user_id]
+        channel_queues.move_to_end(channel_id)
+        if not user_queues:
+            del channel_queues[channel_id]
+        if not channel_queues:
+            del self._queues[model]
+        return ticket
+
+    def _remove(self, ticket: _Ticket):
+        if ticket.priority:
+            priority_queue = self._priority_queues.get(ticket.model)
+            if priority_queue is not None and ticket in priority_queue:
+                priority_queue.remove(ticket)
+                if not priority_queue:
+                    del self._priority_queues[ticket.model]
+            return
+        user_queue = self._queues.get(ticket.model, {}).get(ticket.channel_id, {}).get(ticket.user_id)
+        if user_queue is None or ticket not in user_queue:
+            return
+        user_queue.remove(ticket)
+        if not user_queue:
+            del self._queues[ticket.model][ticket.channel_id][ticket.user_id]
+        if not self._queues[ticket.model][ticket.channel_id]:
+            del self._queues[ticket.model][ticket.channel_id]
+        if not self._queues[ticket.model]:
+            del self._queues[ticket.model]
+
+    def _dispatch(self):
+        while (model := self._pick_model()) is not None:
+            ticket = self._pop_next(model)
+            self._running[model] = self.running(model) + 1
+            self.resident_models.add(model)
+            ticket.admitted.set_result(None)
+        # only the tickets whose position changed are woken up, so waiting requests don't keep waking each other
+        for model in {**self._priority_queues, **self._queues}:
+            for position, ticket in enumerate(self._service_order(model)):
+                if ticket.position != position:
+                    ticket.position = position
+                    ticket.updated.set()
+
+    def _release(self, model: str):
+        self._running[model] -= 1
+        if not self._running[model]:
+            del self._running[model]
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, model: str, user_id: int, channel_id: int, *, priority: bool = False,
+                   on_position: Callable[[int], None] = None):
+        """Waits until the request is allowed to run on the given model and holds the slot until the block exits
+        Args:
+            model (str): The id of the model the request will run on
+            user_id (int): The id of the user that made the request
+            channel_id (int): The id of the channel the request was made in
+            priority (bool): Whether the request jumps the queue
+            on_position (Callable[[int], None]): Called with the request's position in the queue every time it
+                changes while it is waiting. It must not block, so an admitted request leaves the queue straight away
+        """
+        ticket = _Ticket(model, user_id, channel_id, priority)
+        if priority:
+            self._priority_queues.setdefault(model, deque()).append(ticket)
+        else:
+            self._queues.setdefault(model, OrderedDict()).setdefault(channel_id, OrderedDict()).setdefault(
+                user_id, deque()
+            ).append(ticket)
+        self._dispatch()
+        last_position = None
+        try:
+            while not ticket.admitted.done():
+                position = ticket.position or 0
+                if on_position is not None and position != last_position:
+                    last_position = position
+                    on_position(position + 1)
+                ticket.updated.clear()
+                if ticket.admitted.done() or (ticket.position or 0) != position:
+                    continue
+                updated_task = asyncio.ensure_future(ticket.updated.wait())
+                try:
+                    # also wake up periodically so a starved model gets a chance once max_wait has passed
+                    done, _ = await asyncio.wait(
+                        {ticket.admitted, updated_task}, timeout=self.max_wait,
+                        return_when=asyncio.FIRST_COMPLETED
+                    )
+                finally:
+                    updated_task.cancel()
+                if not done:
+                    self._dispatch()
+        except BaseException:
+            if ticket.admitted.done() and not ticket.admitted.cancelled():
+                self._release(model)
+            else:
+                ticket.admitted.cancel()
+                self._remove(ticket)
+                self._dispatch()
+            raise
+        try:
+            yield
+        finally:
+            self._release(model)
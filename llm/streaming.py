@@ -0,0 +1,337 @@
+import asyncio
+import copy
+import time
+from typing import AsyncIterator, Optional, Union
+import discord
+import ollama
+from discord.ext import commands, pages
+import utils
+from llm import paginator
+
+
+class StopView(utils.DefaultView):
+    """The view with the button that stops a response from being generated. Only the user that requested the response
+    and the owner of the bot can use it."""
+    def __init__(self, response: "StreamingResponse"):
+        super().__init__(context=response.ctx, user=response.ctx.author, timeout=None)
+        self.response = response
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if await interaction.client.is_owner(interaction.user):
+            return True
+        return await super().interaction_check(interaction)
+
+    @discord.ui.button(label="Stop", style=discord.ButtonStyle.red, emoji="\u23f9\ufe0f")
+    async def stop_button(self, button: discord.ui.Button, interaction: discord.Interaction):
+        button.disabled = True
+        button.label = "Stopping..."
+        await interaction.response.edit_message(view=self)
+        self.response.stop()
+
+
+class ReasoningView(utils.DefaultView):
+    """The view with the button that shows the reasoning behind a response. The reasoning is only paginated once
+    someone asks for it, and only they see it.
+    Args:
+        ctx (Union[commands.Context, discord.ApplicationContext]): The context the response was sent to
+        title (str): The title of the response
+        thinking (str): The reasoning behind the response
+    """
+    def __init__(self, ctx: Union[commands.Context, discord.ApplicationContext], title: str, thinking: str):
+        super().__init__(context=ctx, timeout=3600)
+        self.title = title
+        self.thinking = thinking
+
+    @discord.ui.button(label="Show Reasoning", style=discord.ButtonStyle.grey, emoji="\U0001f4ad")
+    async def reasoning_button(self, _: discord.ui.Button, interaction: discord.Interaction):
+        reasoning_pages = paginator.paginate(self.thinking, 4096)
+        embed_pages = [
+            utils.default_embed(
+                self.ctx, f"{self.title} Reasoning" + (
+                    f" {index + 1}/{len(reasoning_pages)}" if len(reasoning_pages) > 1 else ""
+                ), reasoning_page
+            )
+            for index, reasoning_page in enumerate(reasoning_pages)
+        ]
+        if len(embed_pages) == 1:
+            await interaction.response.send_message(embed=embed_pages[0], ephemeral=True)
+        else:
+            await pages.Paginator(pages=embed_pages).respond(interaction, ephemeral=True)
+
+
+class ThinkTagSplitter:
+    """Splits the thinking of models that put it in ``<think>`` tags out of their response as it is streamed, holding
+    back the end of a chunk that could be the start of a tag split across chunks. Some models leave out the opening
+    tag, in which case everything before the closing tag turns out to be thinking once it arrives.
+    Attributes:
+        state (str): ``"start"`` before anything but whitespace arrived, ``"thinking"`` inside the tags,
+            ``"untagged"`` if there was no opening tag and no closing tag yet and ``"content"`` after the tags
+        reclassified (bool): Whether the last chunk revealed that the content received before it was thinking
+    """
+    OPEN = "<think>"
+    CLOSE = "</think>"
+
+    def __init__(self):
+        self.state = "start"
+        self.reclassified = False
+        self._buffer = ""
+        self._answering = False
+
+    @staticmethod
+    def _held_back(text: str, tag: str) -> int:
+        """The length of the end of the text that could be the start of the tag"""
+        for length in range(min(len(tag) - 1, len(text)), 0, -1):
+            if tag.startswith(text[-length:]):
+                return length
+        return 0
+
+    def feed(self, text: str) -> tuple[str, str]:
+        """Splits the next chunk of the response
+        Returns:
+            tuple[str, str]: The thinking and the content in the chunk
+        """
+        self.reclassified = False
+        if self.state == "content":
+            return "", self._answer(text)
+        self._buffer += text
+        thinking = ""
+        content = ""
+        if self.state == "start":
+            stripped = self._buffer.lstrip()
+            if not stripped or (self.OPEN.startswith(stripped) and stripped != self.OPEN):
+                return "", ""
+            if stripped.startswith(self.OPEN):
+                self.state = "thinking"
+                self._buffer = stripped[len(self.OPEN):]
+            else:
+                self.state = "untagged"
+        close = self._buffer.find(self.CLOSE)
+        if close >= 0:
+            self.reclassified = self.state == "untagged"
+            thinking = self._buffer[:close]
+            content = self._buffer[close + len(self.CLOSE):]
+            self.state = "content"
+            self._buffer = ""
+            return thinking, self._answer(content)
+        split = len(self._buffer) - self._held_back(self._buffer, self.CLOSE)
+        released, self._buffer = self._buffer[:split], self._buffer[split:]
+        return (released, "") if self.state == "thinking" else ("", released)
+
+    def _answer(self, text: str) -> str:
+        """Drops the line breaks between the closing tag and the answer, which can arrive in separate chunks"""
+        if not self._answering:
+            text = text.lstrip("\n")
+            self._answering = bool(text)
+        return text
+
+    def flush(self) -> tuple[str, str]:
+        """Releases whatever was held back once the response is done"""
+        released, self._buffer = self._buffer, ""
+        return (released, "") if self.state == "thinking" else ("", released)
+
+
+class StreamingResponse:
+    """Progressively renders a streamed ollama chat response into a single discord message
+    Args:
+        ctx (Union[commands.Context, discord.ApplicationContext]): The context the response is being sent to
+        title (str): The title of the embed the partial response is shown in
+        edit_interval (float): The minimum amount of seconds between edits of the message
+        page_limit (int): The amount of characters after which the message rolls over to a new page
+        think_tags (bool): Whether the model puts its thinking in ``<think>`` tags, which are then split out of the
+            content into the thinking
+    Attributes:
+        message (Optional[discord.Message]): The message the partial response is rendered in, if one was sent yet
+        content (str): The response content received so far
+        thinking (str): The thinking part of the response received so far
+        page (int): The index of the page currently being rendered
+        followers (list[StreamingResponse]): The responses to identical requests the chunks are mirrored to
+        task (Optional[asyncio.Task]): The task generating the response, which is cancelled if the response is stopped
+            before it started streaming
+        stopped (bool): Whether the response was requested to stop
+        queue_position (Optional[int]): The position of the request in the model's queue while it is queued
+        stop_reason (Optional[str]): Why the response was stopped, e.g. ``"stopped"`` if a user stopped it or
+            ``"deadline"`` if it ran out of time
+        first_token_at (Optional[float]): The monotonic time the first token of the response arrived at
+    """
+    def __init__(self, ctx: Union[commands.Context, discord.ApplicationContext], title: str, *,
+                 edit_interval: float = 1.5, page_limit: int = 4096, think_tags: bool = False):
+        self.ctx = ctx
+        self.title = title
+        self.edit_interval = edit_interval
+        self.page_limit = page_limit
+        self.message: Optional[discord.Message] = None
+        self.content = ""
+        self.thinking = ""
+        self.page = 0
+        self._paginator = paginator.MarkdownPaginator(page_limit)
+        self._tags = ThinkTagSplitter() if think_tags else None
+        self._last_edit = 0.0
+        self._pending_edit: Optional[asyncio.Task] = None
+        self.followers: list[StreamingResponse] = []
+        self.task: Optional[asyncio.Task] = None
+        self.stopped = False
+        self.queue_position: Optional[int] = None
+        self.stop_reason: Optional[str] = None
+        self.first_token_at: Optional[float] = None
+        self._view: Optional[StopView] = None
+        self._consumer: Optional[asyncio.Task] = None
+        self._final_chunk: Optional[ollama.ChatResponse] = None
+
+    def _visible_text(self) -> str:
+        if not self.content and self.thinking:
+            # only a glimpse of the reasoning is shown while it is generated, the rest is behind the reasoning button
+            thinking_tail = self.thinking[-512:].strip().replace("\n", "\n-# ")
+            return "-# **Thinking**...\n-# " + thinking_tail
+        self.page = len(self._paginator.pages)
+        return self._paginator.current
+
+    @property
+    def view(self) -> StopView:
+        if self._view is None:
+            self._view = StopView(self)
+        return self._view
+
+    async def _show(self, embed: discord.Embed):
+        try:
+            if self.message is None:
+                self.message = await self.ctx.respond(embed=embed, view=self.view)
+                if isinstance(self.message, discord.Interaction):
+                    self.message = await self.message.original_response()
+            else:
+                await self.message.edit(embed=embed, view=self.view)
+        except discord.HTTPException:
+            # a failed progress update should never abort the generation itself
+            pass
+
+    async def _render(self):
+        visible_text = self._visible_text()
+        if not visible_text.strip():
+            if self.queue_position is not None:
+                await self._show(utils.default_embed(
+                    self.ctx, f"{self.title} (Queued)", f"Waiting for the model to become available. Position in "
+                                                        f"queue: **{self.queue_position}**"
+                ))
+            return
+        page_number = f" {self.page + 1}" if self.page else ""
+        await self._show(utils.default_embed(self.ctx, f"{self.title}{page_number} (Generating...)", visible_text))
+
+    def show_queue_position(self, position: int):
+        """Shows the position of the request in the model queue while it waits to be generated. The message is
+        edited at most once per ``edit_interval``, since every admission moves all the requests queued behind it."""
+        self.queue_position = position
+        self._schedule_render()
+
+    def _schedule_render(self):
+        if self.stopped:
+            # a stopped response that still generates for its followers already shows what it had
+            return
+        if self._pending_edit and not self._pending_edit.done():
+            return
+        if time.monotonic() - self._last_edit < self.edit_interval:
+            return
+        self._last_edit = time.monotonic()
+        self._pending_edit = asyncio.create_task(self._render())
+
+    def _add(self, thinking: str, content: str):
+        if content:
+            self.content += content
+            self._paginator.feed(content)
+        if thinking:
+            self.thinking += thinking
+
+    def _feed(self, chunk: ollama.ChatResponse):
+        if self.first_token_at is None and (chunk.message.content or chunk.message.thinking):
+            self.first_token_at = time.monotonic()
+        content = chunk.message.content or ""
+        thinking = chunk.message.thinking or ""
+        if self._tags is not None and content:
+            tag_thinking, content = self._tags.feed(content)
+            if self._tags.reclassified:
+                thinking, self.content = self.content + thinking, ""
+                self._paginator = paginator.MarkdownPaginator(self.page_limit)
+            thinking += tag_thinking
+        self._add(thinking, content)
+        self._schedule_render()
+
+    def _flush(self):
+        if self._tags is not None:
+            self._add(*self._tags.flush())
+
+    def follow(self, leader: "StreamingResponse"):
+        """Mirrors the response another request is streaming, starting with what it has received so far"""
+        self.content = leader.content
+        self._paginator.feed(leader.content)
+        self.thinking = leader.thinking
+        self._tags = copy.deepcopy(leader._tags)
+        leader.followers.append(self)
+        self._schedule_render()
+
+    async def settle(self):
+        """Waits for the edit in progress, if any, to finish"""
+        if self._pending_edit:
+            await asyncio.gather(self._pending_edit, return_exceptions=True)
+
+    def stop(self, reason: str = "stopped"):
+        """Stops the response from being generated, keeping what was generated so far. A response that identical
+        requests follow stops waiting for the generation instead, which goes on for the followers."""
+        if self.stopped:
+            return
+        self.stopped = True
+        self.stop_reason = reason
+        if self._consumer is not None and not self.followers:
+            self._consumer.cancel()
+        elif self.task is not None:
+            self.task.cancel()
+
+    def close(self):
+        if self._view is not None:
+            self._view.stop()
+
+    def partial_response(self) -> ollama.ChatResponse:
+        """The response generated before it was stopped. Nothing is changed, since the generation can go on for the
+        followers after this response stopped."""
+        thinking, content = copy.copy(self._tags).flush() if self._tags is not None else ("", "")
+        response = (
+            self._final_chunk.model_copy(deep=True) if self._final_chunk
+            else ollama.ChatResponse(message=ollama.Message(role="assistant"))
+        )
+        response.message.content = self.content + content
+        response.message.thinking = (self.thinking + thinking).strip("\n") or None
+        response.done = False
+        response.done_reason = self.stop_reason
+        return response
+
+    async def _consume(self, stream: AsyncIterator[ollama.ChatResponse]):
+        async for chunk in stream:
+            self._final_chunk = chunk
+            for response in [self, *self.followers]:
+                response._feed(chunk)
+
+    async def consume(self, stream: AsyncIterator[ollama.ChatResponse]) -> ollama.ChatResponse:
+        """Consumes the chunks of a streamed chat response, editing the message as the response comes in
+        Args:
+            stream (AsyncIterator[ollama.ChatResponse]): The iterator returned by ``chat(..., stream=True)``
+        Returns:
+            ollama.ChatResponse: The final chunk of the response with the full content and thinking filled in, or
+            the partial response if it was stopped
+        """
+        self._consumer = asyncio.ensure_future(self._consume(stream))
+        try:
+            await self._consumer
+        except asyncio.CancelledError:
+            if not self.stopped or not self._consumer.cancelled():
+                raise
+        finally:
+            # closing the stream closes the connection, so the server stops generating a stopped response straight away
+            await stream.aclose()
+            await asyncio.gather(*(response.settle() for response in [self, *self.followers]))
+        if self._consumer.cancelled():
+            return self.partial_response()
+        final_chunk = self._final_chunk
+        if final_chunk is None:
+            raise ollama.ResponseError("The ollama server returned an empty response")
+        for response in [self, *self.followers]:
+            response._flush()
+        final_chunk.message.content = self.content
+        final_chunk.message.thinking = self.thinking.strip("\n") or None
+        return final_chunk
@@ -0,0 +1,89 @@
+import asyncio
+import httpx
+import ollama
+from llm import context, pool
+
+SUMMARY_PROMPT = (
+    'Summarize the following conversation between a user and an AI assistant in a few short paragraphs. Keep the '
+    'facts, names, decisions, code and open questions that later messages might refer to. Only reply with the summary.'
+)
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+def transcript(messages: list[dict]) -> str:
+    lines = []
+    for message in messages:
+        content = message.get('content') or ""
+        if message.get('role') == 'system' and content.startswith(SUMMARY_PREFIX):
+            lines.append(f"Earlier summary: {content[len(SUMMARY_PREFIX):]}")
+            continue
+        images = " [image]" * len(message.get('images') or [])
+        lines.append(f"{str(message.get('role')).capitalize()}: {content}{images}")
+    return "\n\n".join(lines)
+
+
+class ConversationSummarizer:
+    """Compacts long channel histories in the background. Once a channel's history takes up more than ``threshold``
+    of the token budget, a small model summarizes all but the latest messages and the summary replaces them, so
+    later turns keep the context without evaluating the whole conversation again.
+    Args:
+        server_pool (pool.ServerPool): The ollama servers to run the summaries on
+        conversations (context.ConversationStore): The message history of each channel
+        model_name (str): The name of the model in the server profiles that writes the summaries
+        threshold (float): The fraction of the token budget a history has to take up to be summarized
+        keep (int): The amount of latest messages that are kept as they are
+        max_tokens (int): The maximum amount of tokens in a summary
+    """
+    def __init__(self, server_pool: pool.ServerPool, conversations: context.ConversationStore, model_name: str,
+                 threshold: float = 0.6, keep: int = 4, max_tokens: int = 512):
+        self.pool = server_pool
+        self.conversations = conversations
+        self.model_name = model_name
+        self.threshold = threshold
+        self.keep = keep
+        self.max_tokens = max_tokens
+        self._tasks: dict[int, asyncio.Task] = {}
+
+    def schedule(self, channel_id: int):
+        """Starts summarizing a channel's history in the background if it has grown past the threshold"""
+        if channel_id in self._tasks:
+            return
+        if self.conversations.tokens(channel_id) <= self.conversations.token_budget * self.threshold:
+            return
+        task = self._tasks[channel_id] = asyncio.create_task(self.summarize(channel_id))
+        task.add_done_callback(lambda _: self._tasks.pop(channel_id, None))
+
+    async def summarize(self, channel_id: int) -> bool:
+        """Summarizes all but the latest messages of a channel's history
+        Returns:
+            bool: Whether the history was compacted
+        """
+        first_seq, messages = self.conversations.snapshot(channel_id)
+        older = messages[:-self.keep] if self.keep else messages
+        # the history should carry on from a user turn after the summary
+        while older and older[-1].get('role') == 'user':
+            older.pop()
+        if len(older) < 2:
+            return False
+        server, model_id = self.pool.route(self.model_name)
+        if server is None:
+            return False
+        try:
+            async with server.scheduler.slot(model_id, 0, channel_id):
+                response = await server.client.chat(model=model_id, messages=[
+                    {'role': 'system', 'content': SUMMARY_PROMPT},
+                    {'role': 'user', 'content': transcript(older)}
+                ], options={'num_predict': self.max_tokens, 'temperature': 0})
+        except (httpx.HTTPError, ConnectionError, ollama.ResponseError):
+            server.inventory.invalidate()
+            return False
+        summary = (response.message.content or "").strip()
+        if not summary:
+            return False
+        return self.conversations.replace_oldest(
+            channel_id, first_seq, len(older), {'role': 'system', 'content': SUMMARY_PREFIX + summary}
+        )
+
+    def cancel(self):
+        for task in list(self._tasks.values()):
+            task.cancel()
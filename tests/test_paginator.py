@@ -0,0 +1,59 @@
+import random
+from llm import paginator
+
+ATOMS = ("word", " ", "\n", "\n\n", "```", "```py\n", "`", "-# ", "> ", "x" * 50, "longword" * 20)
+
+
+def stream(text: str, limit: int, sizes: list[int]) -> paginator.MarkdownPaginator:
+    """Feeds text to a paginator in chunks of the given sizes, checking the page in progress after each one"""
+    markdown = paginator.MarkdownPaginator(limit)
+    index = 0
+    while index < len(text):
+        size = sizes[index % len(sizes)]
+        markdown.feed(text[index:index + size])
+        index += size
+        assert len(markdown.current) <= limit
+    markdown.finish()
+    return markdown
+
+
+def test_long_fence_line():
+    pages = paginator.paginate("```" + "word " * 1500 + "\n" + "more text " * 150, 4096)
+    assert all(len(page) <= 4096 for page in pages)
+    assert "".join(pages).count("more") == 150
+
+
+def test_long_fence_language():
+    pages = paginator.paginate("```" + "x" * 5000 + "\nprint()\n```", 100)
+    assert all(len(page) <= 100 for page in pages)
+
+
+def test_current_fits_while_line_is_streamed():
+    markdown = paginator.MarkdownPaginator(4096)
+    for index in range(30):
+        markdown.feed(f"line {index} " + "x" * 100 + "\n")
+    markdown.feed("y" * 780)
+    assert len(markdown.current) <= 4096
+
+
+def test_streamed_matches_complete():
+    text = "".join(
+        f"```py\nprint({index})\n```\n" if index % 7 == 0 else f"-# line {index} " + "word " * (index % 13) + "\n"
+        for index in range(400)
+    )
+    for sizes in ([1], [3, 7], [64]):
+        assert stream(text, 200, sizes).pages == paginator.paginate(text, 200)
+
+
+def test_fuzz():
+    rng = random.Random(0)
+    for _ in range(2000):
+        limit = rng.choice([20, 40, 100, 300])
+        text = "".join(rng.choice(ATOMS) for _ in range(rng.randint(0, 80)))
+        sizes = [rng.randint(1, 12) for _ in range(5)]
+        whole = paginator.paginate(text, limit)
+        streamed = stream(text, limit, sizes).pages
+        assert all(len(page) <= limit for page in whole + streamed)
+        if all(len(line) + 40 <= limit for line in text.split("\n")):
+            # lines that fit on a page are never cut, so streaming can't change where pages end
+            assert streamed == whole